@@ -8,7 +8,7 @@ from skeletonservice.utils import get_instance_folder_path
 from skeletonservice.datasets.api import api_bp
 from skeletonservice.datasets.views import views_bp
 from skeletonservice.datasets.limiter import limiter
-from skeletonservice.datasets.service import SKELETON_DEFAULT_VERSION_PARAMS, SKELETON_VERSION_PARAMS
+from skeletonservice.datasets.service import SKELETON_DEFAULT_VERSION_PARAMS, SKELETON_VERSION_PARAMS, SkeletonService
 from flask_restx import Api
 from flask_cors import CORS
 import logging
@@ -140,5 +140,7 @@ def create_app(test_config=None):
     @app.before_request
     def before_request():
         request.start_time = datetime.datetime.now(datetime.timezone.utc)
+        # Each uwsgi thread serves many requests; don't let one request's verbose level carry over to the next
+        SkeletonService.begin_request()
 
     return app
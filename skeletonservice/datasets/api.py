@@ -64,6 +64,17 @@ class SkeletonResource__get_skeletons(Resource):
         return ["Placeholder for /skeletons endpoint, of an as-yet undetermined usefulness."]
 
 
+@api_bp.route("/payload_cache_stats")
+@api_bp.doc("get payload cache stats", security="apikey")
+class SkeletonResource__payload_cache_stats(Resource):
+    """Payload cache stats"""
+
+    @auth_required
+    def get(self):
+        """Get the hit, miss and eviction counters of the serving process's in-memory payload cache"""
+        return SkeletonService.get_payload_cache_stats()
+
+
 @api_bp.route("/<string:datastack_name>/precomputed")
 class SkeletonResource__datastack(Resource):
     """PrecomputedResource"""
@@ -329,7 +340,7 @@ class SkeletonResource__query_cache_B(Resource):
     ]
 
     @staticmethod
-    def process(datastack_name: str, skvn: int, root_id_prefixes: str, limit: int, verbose_level: int=0):
+    def process(datastack_name: str, skvn: int, root_id_prefixes: str, limit: int, verbose_level: int=0, cursor: int=None):
         # limit_query_cache(request)
 
         SkelClassVsn = SkeletonService.get_version_specific_handler(skvn)
@@ -342,6 +353,7 @@ class SkeletonResource__query_cache_B(Resource):
             limit=limit,
             session_timestamp_=SkeletonService.get_session_timestamp(),
             verbose_level_=verbose_level,
+            cursor=cursor,
         )
 
     @auth_required
@@ -352,9 +364,14 @@ class SkeletonResource__query_cache_B(Resource):
         Get skeletons in cache by root_id_prefix
         
         root_id_prefixes could be a single int (as a string), a single string (i.e. one int as a string), or a comma-separated list of strings (i.e. multiple ints as a single string).
+        If the result includes "next_cursor", pass it back as the cursor query parameter to get the next page.
         """
         verbose_level = int(request.args.get('verbose_level')) if 'verbose_level' in request.args else 0
-        return self.process(datastack_name, skvn, root_id_prefixes, limit, verbose_level)
+        try:
+            cursor = int(request.args.get('cursor')) if 'cursor' in request.args else None
+        except ValueError:
+            return {"Error": f"Invalid cursor: {request.args.get('cursor')}. Pass back the next_cursor of the previous page."}, 400
+        return self.process(datastack_name, skvn, root_id_prefixes, limit, verbose_level, cursor)
 
 
 # NOTE: Use of this endpoint has been removed from CAVEclient:SkeletonService, but it can't be removed from here if there are any older clients in the wild that might access it.
@@ -0,0 +1,59 @@
+"""Periodic maintenance of the objects SkeletonService keeps in its bucket.
+
+Meant to be run from a scheduled job (one run per bucket at a time), e.g.:
+
+    python -m skeletonservice.datasets.maintenance compact-refusal-list gs://<bucket>/
+    python -m skeletonservice.datasets.maintenance compact-skeletonization-times gs://<bucket>/
+    python -m skeletonservice.datasets.maintenance compact-skeleton-index gs://<bucket>/ <datastack_name>
+"""
+
+import argparse
+
+from skeletonservice.datasets.service import SkeletonService
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m skeletonservice.datasets.maintenance")
+    parser.add_argument("-v", "--verbose_level", type=int, default=0)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    compact_refusal_list = subparsers.add_parser(
+        "compact-refusal-list",
+        help="Fold the per-rid refusal markers into the refusal list snapshot.",
+    )
+    compact_refusal_list.add_argument("bucket")
+
+    compact_skeletonization_times = subparsers.add_parser(
+        "compact-skeletonization-times",
+        help="Merge the per-skeleton timing records into one parquet file per day.",
+    )
+    compact_skeletonization_times.add_argument("bucket")
+    compact_skeletonization_times.add_argument(
+        "--date", action="append", dest="dates",
+        help="YYYY-MM-DD day to compact; may be repeated. Defaults to every day before today (UTC).",
+    )
+
+    compact_skeleton_index = subparsers.add_parser(
+        "compact-skeleton-index",
+        help="Fold the skeleton existence index markers into the index snapshot, building the snapshot if there is none.",
+    )
+    compact_skeleton_index.add_argument("bucket")
+    compact_skeleton_index.add_argument("datastack_name")
+    compact_skeleton_index.add_argument("--skeleton_version", type=int, default=None)
+    compact_skeleton_index.add_argument(
+        "--rebuild", action="store_true",
+        help="Rebuild the snapshot from a listing of every cached skeleton of the datastack.",
+    )
+
+    args = parser.parse_args(argv)
+
+    if args.command == "compact-refusal-list":
+        SkeletonService.compact_refusal_list(args.bucket, args.verbose_level)
+    elif args.command == "compact-skeletonization-times":
+        SkeletonService.compact_skeletonization_times(args.bucket, args.dates, args.verbose_level)
+    elif args.command == "compact-skeleton-index":
+        SkeletonService.compact_skeleton_index(args.bucket, args.datastack_name, args.skeleton_version, args.rebuild, args.verbose_level)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,20 @@
 import os
+import contextvars
 import json
+import math
+import random
+import threading
+import time
 import traceback as tb
 import logging
 from timeit import default_timer
+from google.api_core import retry
+from google.cloud import pubsub_v1
 from messagingclient import MessagingClientConsumer
+from messagingclient import MessagingClientPublisher
 from messagingclient import RetryableError
-from .service import SkeletonService
+from messagingclient.client import PROJECT_NAME
+from .service import SkeletonService, GenerationLeaseHeld, HeavyRoot
 
 # messagingclient logs one line per received message with the bare `logging` module, i.e. on the
 # ROOT logger, not on a 'messagingclient' logger (see messagingclient/client.py, _consume_round_robin).
@@ -26,6 +35,53 @@ env_verbose_level = int(os.environ.get('VERBOSE_LEVEL', "0"))
 # Mirror of service.log_phase_timings; see _PhaseTimer there.
 log_phase_timings = os.environ.get('LOG_PHASE_TIMINGS', "false").lower() == "true"
 
+# Messages pulled and processed together; see batch_callback(). Every message used to pay the cache check and the
+# validation (refusal list, CAVEclient, is_valid_nodes) on its own. 1 keeps messagingclient's one message per callback.
+message_batch_size = int(os.environ.get('MESSAGE_BATCH_SIZE', "1"))
+
+# Messages a worker process handles at once, each consumer on its own thread. Generation is mostly waiting on the
+# chunkedgraph, the materialization service and the bucket, so a worker handling one message at a time left its pod's CPU
+# idle while the queues backed up. The threads share the pooled CAVEclient, and service.CAVE_MAX_IN_FLIGHT_CALLS bounds
+# the calls they make to CAVE together. Request state (verbose level, session timestamp) is context-local per message.
+worker_concurrency = int(os.environ.get('WORKER_CONCURRENCY', "1"))
+
+# Retryable failures (see _retryable_status) used to be nacked, and Pub/Sub redelivered them almost at once, into the rate
+# limit that had just refused them. Such a message is now published again with a retry_attempt attribute counting its
+# retries and a retry_not_before attribute an exponentially growing, jittered delay ahead (between half and all of
+# RETRY_BASE_DELAY_SECS * 2 ** attempt, at most RETRY_MAX_DELAY_SECS), and the original is acked. A worker that receives
+# it earlier hands it back for the time remaining by setting its ack deadline. A message that fails again after
+# RETRY_MAX_ATTEMPTS retries goes to the dead-letter path: it is published to SKELETON_CACHE_DEAD_LETTER_EXCHANGE if that
+# is set, else nacked, for the subscription's dead-letter policy. This needs the ack ids, so it is done by this module's
+# own pull loop (_consume_batches) rather than messagingclient's. 0 disables it and nacks retryable failures as before.
+retry_max_attempts = int(os.environ.get('RETRY_MAX_ATTEMPTS', "6"))
+retry_base_delay_secs = float(os.environ.get('RETRY_BASE_DELAY_SECS', "15"))
+retry_max_delay_secs = float(os.environ.get('RETRY_MAX_DELAY_SECS', "900"))
+
+# A message returned because another worker holds the generation lease of its skeleton (GenerationLeaseHeld) is not a
+# failure: it is published again between half and all of this delay ahead, without counting against RETRY_MAX_ATTEMPTS,
+# so that it never reaches the dead-letter path (and the refusal list) however long the lease holder's generation takes.
+duplicate_retry_delay_secs = float(os.environ.get('DUPLICATE_RETRY_DELAY_SECS', "60"))
+
+# Mirror of service.heavy_worker: a heavy worker consumes SKELETON_CACHE_HEAVY_RETRIEVE_QUEUE only (see HEAVY_ROOT_MIN_L3_IDS).
+heavy_worker = os.environ.get('HEAVY_WORKER', "false").lower() == "true"
+
+# The ack deadline pulled batches are extended to, since a message waits for the generations of the messages before it
+# in its batch. 600 seconds is the most Pub/Sub allows.
+BATCH_ACK_DEADLINE_SECS = 600
+
+# The message attributes that, besides the rid, identify the skeleton; messages agreeing on them are processed together
+_BATCH_KEY_ATTRIBUTES = [
+    "skeleton_params_datastack_name",
+    "skeleton_params_bucket",
+    "skeleton_params_root_resolution",
+    "skeleton_params_collapse_soma",
+    "skeleton_params_collapse_radius",
+    "skeleton_version",
+]
+
+# Message outcomes for which the message is returned to the subscription rather than acked
+_REQUEUE_OUTCOMES = ["retryable", "duplicate_requeued"]
+
 # Statuses worth returning to the subscription rather than dropping the work. All are conditions
 # that a later delivery can plausibly succeed at; anything else stays fatal.
 _RETRYABLE_HTTP = {
@@ -114,6 +170,19 @@ def callback(payload):
                 )
                 if verbose_level >= 1:
                     SkeletonService.print_with_session_timestamp("Skeleton Cache message-processor returned from SkeletonService.get_skeleton_by_datastack_and_rid() with result: ", result, session_timestamp_=session_timestamp)
+            except HeavyRoot as e:
+                message_outcome = "heavy_rerouted"
+                if verbose_level >= 1:
+                    SkeletonService.print_with_session_timestamp(f"Skeleton Cache message-processor: {e}; sending it to the heavy workers.", session_timestamp_=session_timestamp)
+                if not _reroute_heavy(payload):
+                    raise RetryableError(str(e)) from e
+            except GenerationLeaseHeld as e:
+                # Another worker is generating this skeleton (e.g., this is a redelivery or a duplicate publication).
+                # Return the message rather than generate it again; by its redelivery the skeleton is normally cached.
+                message_outcome = "duplicate_requeued"
+                if verbose_level >= 1:
+                    SkeletonService.print_with_session_timestamp(f"Skeleton Cache message-processor: {e}; returning the message for redelivery.", session_timestamp_=session_timestamp)
+                raise RetryableError(str(e)) from e
             except Exception as e:
                 status = _retryable_status(e)
                 if status is not None:
@@ -151,33 +220,309 @@ def callback(payload):
         # this the catch-all below would swallow it, the message would be acked, and the work
         # would be lost -- which is what was happening to ~35% of messages under the
         # materialization rate limit.
-        message_outcome = "retryable"
+        if message_outcome == "ok":
+            message_outcome = "retryable"
         raise
     except Exception as e:
         message_outcome = f"error:{type(e).__name__}"
         print("Skeleton Cache messaging message-processor suffered a failure that was not caught at lower granularity: ", repr(e))
         tb.print_exc()
     finally:
-        if log_phase_timings:
-            try:
-                print("MESSAGE_TIMING " + json.dumps({
-                    "outcome": message_outcome,
-                    "total_s": round(default_timer() - message_start, 3),
-                }), flush=True)
-            except Exception:
-                pass  # instrumentation must never affect message handling
+        _emit_message_timing(message_outcome, message_start)
+
+
+def _emit_message_timing(message_outcome, message_start):
+    if log_phase_timings:
+        try:
+            print("MESSAGE_TIMING " + json.dumps({
+                "outcome": message_outcome,
+                "total_s": round(default_timer() - message_start, 3),
+            }), flush=True)
+        except Exception:
+            pass  # instrumentation must never affect message handling
+
+
+def _message_outcome(e, session_timestamp):
+    """Classify (and report) the error a message failed with the way callback() does, as one of its MESSAGE_TIMING outcomes."""
+    if e is None:
+        return "ok"
+    if isinstance(e, GenerationLeaseHeld):
+        return "duplicate_requeued"
+    if isinstance(e, HeavyRoot):
+        return "heavy_rerouted"
+    status = _retryable_status(e)
+    if status is not None:
+        SkeletonService.print_with_session_timestamp(
+            f"Skeleton Cache message-processor got a retryable HTTP {status}; returning the message for redelivery.",
+            session_timestamp_=session_timestamp)
+        return "retryable"
+    SkeletonService.print_with_session_timestamp("Skeleton Cache message-processor received error: ", repr(e), session_timestamp_=session_timestamp)
+    return f"error:{type(e).__name__}"
+
+
+def batch_callback(messages):
+    """Process several pulled messages together; see MESSAGE_BATCH_SIZE.
+
+    Messages that only ask for a skeleton to be cached (output_format "none") are grouped by their skeleton parameters
+    and handed to SkeletonService.cache_skeletons_by_datastack_and_rids(), which checks the cache and validates once
+    per group rather than once per message, and processes a rid published more than once a single time. Any other
+    message, e.g., from the dead letter queue, goes through callback() on its own.
+
+    Yields (index, requeue) as each message is settled, requeue being None if messages[index] may be acked, else the
+    outcome ("retryable" or "duplicate_requeued") it must be returned to the subscription for (what callback() signals
+    with RetryableError).
+    """
+    batch_start = default_timer()
+    skeletoncache_dead_letter_queue = os.getenv("SKELETON_CACHE_DEAD_LETTER_RETRIEVE_QUEUE", None)
+    groups = {}
+    for i, payload in enumerate(messages):
+        try:
+            batched = (
+                skeletoncache_dead_letter_queue not in payload.attributes.get("__subscription_name", "Unknown")
+                and payload.attributes["skeleton_params_output_format"] == "none"
+            )
+            if batched:
+                groups.setdefault(tuple(payload.attributes[name] for name in _BATCH_KEY_ATTRIBUTES), []).append(i)
+                continue
+        except Exception:
+            pass  # Malformed; callback() reports it
+        try:
+            callback(payload)
+            yield i, None
+        except RetryableError as e:
+            yield i, "duplicate_requeued" if isinstance(e.__cause__, GenerationLeaseHeld) else "retryable"
+
+    for key, indices in groups.items():
+        datastack_name, bucket, root_resolution, collapse_soma, collapse_radius, skeleton_version = key
+        session_timestamp = messages[indices[0]].attributes.get("session_timestamp", "not_provided")
+        outcomes = {}  # rid -> outcome
+        indices_by_rid = {}
+        try:
+            verbose_level = max(int(messages[i].attributes["verbose_level"]) for i in indices)
+            for i in indices:
+                indices_by_rid.setdefault(int(messages[i].attributes["skeleton_params_rid"]), []).append(i)
+            if max(verbose_level, env_verbose_level) >= 1:
+                SkeletonService.print_with_session_timestamp(
+                    f"Skeleton Cache message-processor processing {len(indices)} messages for {len(indices_by_rid)} rids together: {key}",
+                    session_timestamp_=session_timestamp)
+
+            for rid, error in SkeletonService.cache_skeletons_by_datastack_and_rids(
+                datastack_name,
+                list(indices_by_rid),
+                bucket,
+                [int(v) for v in root_resolution.split()],
+                False if collapse_soma.lower() in ["false", "f", "0"] else True,
+                int(collapse_radius),
+                int(skeleton_version),
+                session_timestamp,
+                verbose_level,
+            ):
+                outcomes[rid] = _message_outcome(error, session_timestamp)
+                requeue = outcomes[rid] if outcomes[rid] in _REQUEUE_OUTCOMES else None
+                if outcomes[rid] == "heavy_rerouted" and not _reroute_heavy(messages[indices_by_rid[rid][0]]):  # Once for all of the rid's messages
+                    requeue = "retryable"
+                for i in indices_by_rid[rid]:
+                    _emit_message_timing(outcomes[rid], batch_start)
+                    yield i, requeue
+        except Exception as e:
+            print("Skeleton Cache messaging message-processor suffered a failure processing a batch: ", repr(e))
+            tb.print_exc()
+            outcome = _message_outcome(e, session_timestamp)
+            for i in indices:
+                try:
+                    settled = int(messages[i].attributes["skeleton_params_rid"]) in outcomes
+                except Exception:
+                    settled = False
+                if not settled:
+                    _emit_message_timing(outcome, batch_start)
+                    yield i, outcome if outcome in _REQUEUE_OUTCOMES else None
+
+
+def _callback_in_own_context(payload):
+    # Each message starts from the default request state (see service._verbose_level) instead of inheriting whatever the
+    # message processed before it on this thread set
+    return contextvars.Context().run(callback, payload)
+
+
+def _retry_delay_secs(attempt):
+    delay = min(retry_max_delay_secs, retry_base_delay_secs * 2 ** attempt)
+    return random.uniform(delay / 2, delay)
+
+
+def _retry_hold_secs(message):
+    """Seconds until a retried message is due (see RETRY_MAX_ATTEMPTS), 0 if it is due or is not a retry."""
+    try:
+        return max(0.0, float(message.attributes.get("retry_not_before", "0")) - time.time())
+    except ValueError:
+        return 0.0
+
+
+def _reroute_heavy(message):
+    """Publish a message for a root too large for this worker to the heavy workers (see service.HEAVY_ROOT_MIN_L3_IDS).
+    Return whether it was published, i.e., whether the original may be acked rather than returned to the subscription.
+    """
+    exchange = os.getenv("SKELETON_CACHE_HEAVY_EXCHANGE", None)
+    if not exchange:
+        return False
+    attributes = {k: v for k, v in message.attributes.items() if k != "__subscription_name"}
+    attributes["heavy_root"] = "True"
+    try:
+        MessagingClientPublisher(0).publish(exchange, message.data, attributes)
+    except Exception as e:
+        print("Skeleton Cache messaging client could not publish a message to the heavy workers: ", repr(e))
+        return False
+    return True
+
+
+def _retry_exchange(attributes):
+    high_priority = attributes.get("high_priority", "False").lower() in ["true", "t", "1"]
+    exchange = os.getenv("SKELETON_CACHE_HIGH_PRIORITY_EXCHANGE" if high_priority else "SKELETON_CACHE_LOW_PRIORITY_EXCHANGE", None)
+    if attributes.get("heavy_root", "False").lower() in ["true", "t", "1"]:
+        exchange = os.getenv("SKELETON_CACHE_HEAVY_EXCHANGE", exchange)
+    return exchange
+
+
+def _schedule_retry(message, duplicate=False):
+    """Publish a message that failed retryably again, delayed, or to the dead-letter exchange once its retries are spent.
+    A duplicate (see DUPLICATE_RETRY_DELAY_SECS) is published again after a fixed delay, and never counts as a retry.
+    Return whether it was published, i.e., whether the original may be acked rather than nacked.
+    """
+    if retry_max_attempts <= 0:
+        return False
+    attributes = {k: v for k, v in message.attributes.items() if k != "__subscription_name"}
+    attempt = int(attributes.get("retry_attempt", "0"))
+    if duplicate:
+        attributes["retry_not_before"] = f"{time.time() + random.uniform(duplicate_retry_delay_secs / 2, duplicate_retry_delay_secs):.0f}"
+        exchange = _retry_exchange(attributes)
+    elif attempt >= retry_max_attempts:
+        exchange = os.getenv("SKELETON_CACHE_DEAD_LETTER_EXCHANGE", None)
+        SkeletonService.print_with_session_timestamp(
+            f"Skeleton Cache message-processor giving up on rid {attributes.get('skeleton_params_rid')} after {attempt} retries; "
+            f"sending it to the dead-letter path ({exchange or 'nack'}).", session_timestamp_=attributes.get("session_timestamp", "not_provided"))
+    else:
+        attributes["retry_attempt"] = f"{attempt + 1}"
+        attributes["retry_not_before"] = f"{time.time() + _retry_delay_secs(attempt):.0f}"
+        exchange = _retry_exchange(attributes)
+    if not exchange:
+        return False
+    try:
+        MessagingClientPublisher(0).publish(exchange, message.data, attributes)
+    except Exception as e:
+        print("Skeleton Cache messaging client could not publish a message for retry: ", repr(e))
+        return False
+    return True
+
+
+def _settle_batch(subscriber, subscription_name, received_messages):
+    due = []
+    for received_message in received_messages:
+        hold_secs = _retry_hold_secs(received_message.message)
+        if hold_secs <= 0:
+            due.append(received_message)
+            continue
+        try:
+            # Not due yet: let it come back when it is, without processing it
+            subscriber.modify_ack_deadline(request={
+                "subscription": subscription_name, "ack_ids": [received_message.ack_id],
+                "ack_deadline_seconds": min(math.ceil(hold_secs), BATCH_ACK_DEADLINE_SECS),
+            })
+        except Exception as e:
+            print("Skeleton Cache messaging client could not hold back a retried message: ", repr(e))
+    if not due:
+        return
+
+    ack_ids = [received_message.ack_id for received_message in due]
+    messages = [received_message.message for received_message in due]
+    for message in messages:
+        message.attributes["__subscription_name"] = subscription_name
+    try:
+        subscriber.modify_ack_deadline(request={
+            "subscription": subscription_name, "ack_ids": ack_ids, "ack_deadline_seconds": BATCH_ACK_DEADLINE_SECS,
+        })
+    except Exception as e:
+        print("Skeleton Cache messaging client could not extend the ack deadline of a batch: ", repr(e))
+
+    for i, requeue in batch_callback(messages):
+        try:
+            if requeue and not _schedule_retry(messages[i], duplicate=requeue == "duplicate_requeued"):
+                subscriber.modify_ack_deadline(request={
+                    "subscription": subscription_name, "ack_ids": [ack_ids[i]], "ack_deadline_seconds": 0,
+                })
+            else:
+                subscriber.acknowledge(request={"subscription": subscription_name, "ack_ids": [ack_ids[i]]})
+        except Exception as e:
+            # The message comes back once its ack deadline passes
+            print("Skeleton Cache messaging client could not ack or nack a message: ", repr(e))
+
+
+def _consume_batches(queues, batch_size):
+    """Pull loop over the queues in round robin, like MessagingClientConsumer.consume_multiple(), except that up to
+    batch_size messages are pulled at a time and handed to batch_callback() together (messagingclient pulls one).
+    Each message is still acked, or scheduled for a retry (see RETRY_MAX_ATTEMPTS), on its own, as soon as it is settled.
+    """
+    subscription_names = [f"projects/{PROJECT_NAME}/subscriptions/{queue}" for queue in queues]
+    with pubsub_v1.SubscriberClient() as subscriber:
+        queue_index = 0
+        while True:
+            subscription_name = subscription_names[queue_index]
+            queue_index = (queue_index + 1) % len(subscription_names)
+
+            response = subscriber.pull(
+                request={"subscription": subscription_name, "max_messages": batch_size},
+                retry=retry.Retry(deadline=300),
+            )
+            if not response.received_messages:
+                time.sleep(0.1)
+                continue
+            contextvars.Context().run(_settle_batch, subscriber, subscription_name, response.received_messages)
+
+
+def _consume(queues):
+    if message_batch_size > 1 or retry_max_attempts > 0:
+        _consume_batches(queues, message_batch_size)
+    else:
+        MessagingClientConsumer().consume_multiple(queues, _callback_in_own_context)
+
+
+def _consume_concurrently(queues, concurrency):
+    """Run concurrency consumers of the queues, each on its own thread, so that as many messages are processed at once.
+    Return once any of them stops, which they only do on a fatal error, so that the worker exits and is restarted
+    just as it is with a single consumer.
+    """
+    stopped = threading.Event()
+
+    def _run():
+        try:
+            _consume(queues)
+        except Exception as e:
+            print("Skeleton Cache messaging consumer thread failed: ", repr(e))
+            tb.print_exc()
+        finally:
+            stopped.set()
+
+    for i in range(concurrency):
+        threading.Thread(target=_run, name=f"skeleton-consumer-{i}", daemon=True).start()
+    stopped.wait()
 
 try:
-    c = MessagingClientConsumer()
     skeletoncache_low_priority_queue = os.getenv("SKELETON_CACHE_LOW_PRIORITY_RETRIEVE_QUEUE", None)
     skeletoncache_high_priority_queue = os.getenv("SKELETON_CACHE_HIGH_PRIORITY_RETRIEVE_QUEUE", None)
     skeletoncache_dead_letter_queue = os.getenv("SKELETON_CACHE_DEAD_LETTER_RETRIEVE_QUEUE", None)
-    if not skeletoncache_low_priority_queue or not skeletoncache_high_priority_queue or not skeletoncache_dead_letter_queue:
-        raise ValueError(f"Skeleton Cache messaging client: one or more of the messaging queues are not set: LOW:{skeletoncache_low_priority_queue}, HIGH:{skeletoncache_high_priority_queue}, DEAD:{skeletoncache_dead_letter_queue}")
-    c.consume_multiple([skeletoncache_low_priority_queue,
-                        skeletoncache_high_priority_queue,
-                        skeletoncache_dead_letter_queue],
-                        callback)
+    skeletoncache_heavy_queue = os.getenv("SKELETON_CACHE_HEAVY_RETRIEVE_QUEUE", None)
+    if heavy_worker:
+        if not skeletoncache_heavy_queue:
+            raise ValueError("Skeleton Cache messaging client: HEAVY_WORKER is set but SKELETON_CACHE_HEAVY_RETRIEVE_QUEUE is not")
+        skeletoncache_queues = [skeletoncache_heavy_queue]
+    else:
+        if not skeletoncache_low_priority_queue or not skeletoncache_high_priority_queue or not skeletoncache_dead_letter_queue:
+            raise ValueError(f"Skeleton Cache messaging client: one or more of the messaging queues are not set: LOW:{skeletoncache_low_priority_queue}, HIGH:{skeletoncache_high_priority_queue}, DEAD:{skeletoncache_dead_letter_queue}")
+        skeletoncache_queues = [skeletoncache_low_priority_queue,
+                                skeletoncache_high_priority_queue,
+                                skeletoncache_dead_letter_queue]
+    if worker_concurrency > 1:
+        _consume_concurrently(skeletoncache_queues, worker_concurrency)
+    else:
+        _consume(skeletoncache_queues)
     print("Skeleton Cache messaging client registered callback successfully (barring any exceptions that are trapped inside MessagingClientConsumer).")
 except Exception as e:
     print("Skeleton Cache messaging client failed to register callback: ", repr(e))
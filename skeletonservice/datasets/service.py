@@ -1,24 +1,37 @@
 import ast
+import contextvars
 import copy
 from io import BytesIO
 import binascii
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import fcntl
 import google.auth
 import google.auth.downscoped
 import google.auth.transport.requests
+import google.api_core.exceptions
+import google.cloud.storage
+import hashlib
 import logging
 import math
+import threading
 import time
 from timeit import default_timer
 from typing import List, Union
 import os
+import random
+import socket
 import traceback
+import uuid
 import datetime
 from messagingclient import MessagingClientPublisher
 import numpy as np
 import json
 import gzip
+from limits.storage import storage_from_string
 from flask import current_app, send_file, Response, request, has_request_context, jsonify
 import pandas as pd
+from scipy import sparse
 from .skeleton_io_from_meshparty import SkeletonIO
 from meshparty import skeleton as mp_skeleton
 import caveclient
@@ -44,14 +57,39 @@ CACHE_MESHWORK = False
 DEBUG_MINIMIZE_JSON_SKELETON = False  # DEBUG: See _minimize_json_skeleton_for_easier_debugging() for explanation.
 DEBUG_DEAD_LETTER_TEST_RID = 102030405060708090  # This root will always immediately trigger an exception when skeletonizing, which will send it to the dead letter queue
 COMPRESSION = "gzip"  # Valid values mirror cloudfiles.CloudFiles.put() and put_json(): None, 'gzip', 'br' (brotli), 'zstd'
-MAX_BULK_SYNCHRONOUS_SKELETONS = 10
+# Validation, existence checks and reads of a synchronous bulk request are batched or concurrent, so this can be raised per deployment
+MAX_BULK_SYNCHRONOUS_SKELETONS = int(os.environ.get("MAX_BULK_SYNCHRONOUS_SKELETONS", "10"))
 MAX_BULK_CACHED_SKELETONS = 500  # Higher limit: only reading from cache, not generating
 PUBSUB_BATCH_SIZE = 100
+PAYLOAD_CACHE_FORMATS = ["precomputed", "flatdict", "jsoncompressed", "arrayscompressed"]  # Formats served from _payload_cache, all plain bytes
 # We have to clean up escape characters in DATASTACK_NAME_REMAPPING because the curly brackets of the inner dictionary are escaped when bash-serializing in the PrinceAllenCAVE scripts
 DATASTACK_NAME_REMAPPING = ast.literal_eval(os.environ.get('SKELETON_DATASTACK_NAME_REMAPPING', '{}').replace("\\", ""))
 MESHWORK_VERSION = 1
-SKELETONIZATION_TIMES_FILENAME = "skeletonization_times_v2.csv"
+SKELETONIZATION_TIMES_FILENAME = "skeletonization_times_v2.csv"  # Legacy single-object archive, no longer written
+# One small CSV record per generated skeleton under <prefix>shards/<YYYY-MM-DD>/<worker>/, compacted into
+# <prefix>daily/<YYYY-MM-DD>.parquet by compact_skeletonization_times().
+SKELETONIZATION_TIMES_PREFIX = "skeletonization_times/"
+SKELETONIZATION_TIMES_COLUMNS = ["Timestamp", "SkeletonService_version", "CAVEclient_version", "Datastack_Name", "Skeleton_Version", "Root_ID", "N_Vertices", "N_Endpoints", "N_Branchpoints", "Skeletonization_Time_Secs"]
 SKELETONIZATION_REFUSAL_LIST_FILENAME = "skeletonization_refusal_root_ids.csv"
+# One small marker object per refused (datastack, rid), named <prefix><YYYYMMDDHH>/<datastack_name>/<rid> after the hour
+# it was written in and holding the timestamp, so that a revalidation lists the recent hours only (see _RefusalListCache).
+# Markers from before the hour was added are named <prefix><datastack_name>/<rid>, and are still read.
+# Markers are folded into SKELETONIZATION_REFUSAL_LIST_FILENAME (the snapshot) by compact_refusal_list().
+SKELETONIZATION_REFUSAL_MARKERS_PREFIX = "skeletonization_refusal_root_ids/"
+# Index of the rids with a cached H5 skeleton, per datastack and skeleton version, under <prefix><datastack_name>/<version>/:
+# snapshot.npz holds a sorted int64 array of rids, and each H5 write adds an empty marker delta/<YYYYMMDDHH>/<rid>.
+# compact_skeleton_index() folds completed hours of markers into the snapshot.
+SKELETON_INDEX_PREFIX = "skeleton_index/"
+# One lease object per skeleton being generated, named <prefix><datastack_name>/<h5 skeleton filename>; see _GenerationLease
+GENERATION_LEASE_PREFIX = "generation_leases/"
+GENERATION_LEASE_POLL_SECS = 2  # How often a request waiting on another worker's generation checks for its H5
+CAVE_GOVERNOR_WINDOW_SECS = 60  # The window CAVE services count their rate limits over ("800 per 1 minute")
+CAVE_GOVERNOR_KEY_PREFIX = "skeletoncache_cave_governor"
+SOMA_CACHE_PAGE_ROWS = 50000  # Annotation ids per live_query when loading a soma table into _soma_position_cache
+SOMA_CACHE_MAX_DELTA_ROOTS = 20000  # New roots past which a refresh reloads a soma table rather than querying them
+SOMA_CACHE_RELOAD_SECS = 24 * 3600  # Age past which a refresh reloads a soma table, dropping the rows deleted since
+INCREMENTAL_REBUILD_HOPS = 3  # Level 2 hops around the level 2 ids an edit created that incremental generation rebuilds
+DEFAULT_COMPARTMENT_CODE, AXON_COMPARTMENT_CODE, SOMA_COMPARTMENT_CODE = 3, 2, 1  # Vertex compartment codes, as in SWC
 SKELETON_DEFAULT_VERSION_PARAMS = [-1, 0]  # -1 for latest version, 0 for Neuroglancer version
 SKELETON_VERSION_PARAMS = {
     # V1: Basic skeletons
@@ -108,7 +146,7 @@ class VersionedSkeleton:
     """
     def __init__(self, skeleton, version, lvl2_ids=None):
         if (version < 4 and lvl2_ids) or (version >= 4 and lvl2_ids is None):
-            if verbose_level >= 1:
+            if _verbose_level.get() >= 1:
                 # Generate a traceback but don't kill the process
                 try:
                     raise ValueError(f"VersionedSkeleton initialized with inconsistent lvl2_ids for version v{version}.")
@@ -130,22 +168,31 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger('messagingclient')
 logger.setLevel(logging.INFO)
 
-# Since processes are threaded and not forked, I'm concerned this global might get shared across threads processing different requests.
-# Consequently, I'm not sure this approach is safe. But there is no class object created anywhere in the request handling.
-# SkeletonService is used entirely statically.
-session_timestamp = "not_set"
+# The session timestamp and verbose level of the request being processed. Every entry point sets them, and they used to be
+# module globals, so concurrent requests in one process (uwsgi threads, or the worker's WORKER_CONCURRENCY) overwrote each
+# other's. As context variables each thread, and each task run in its own copy of the context, has its own.
+# SkeletonService is used entirely statically, so there is no request object to hang them on instead.
+_session_timestamp = contextvars.ContextVar("session_timestamp", default="not_set")
 
 # Default verbose level
-verbose_level = int(os.environ.get('VERBOSE_LEVEL', "0"))
+default_verbose_level = int(os.environ.get('VERBOSE_LEVEL', "0"))
+_verbose_level = contextvars.ContextVar("verbose_level", default=default_verbose_level)
+
+
+def _in_current_context(fn):
+    """Wrap fn to run in a copy of the calling thread's context, for threads, which start from an empty one.
+    Each call gets its own copy, since one context cannot be entered by two threads at once.
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
 
 # Enable verbose debugging for one root id, e.g., a problematic id that has been encountered by a user
 debugging_root_id = int(os.environ.get('DEBUG_ROOT_ID', "0"))
 
-# Opt-in archival of per-skeleton timings to SKELETONIZATION_TIMES_FILENAME. Off by default:
-# _archive_skeletonization_time() rewrites that entire object on every skeleton, so its cost grows
-# with the number of skeletons ever produced and every worker contends for the same key.
-# See the note on _archive_skeletonization_time() before turning this back on.
-archive_skeletonization_times = os.environ.get('ARCHIVE_SKELETONIZATION_TIMES', "false").lower() == "true"
+# Archival of per-skeleton timings under SKELETONIZATION_TIMES_PREFIX. This used to be off by default because
+# _archive_skeletonization_time() rewrote one ever-growing object on every skeleton. It now writes one small
+# record per skeleton without reading anything, so it is on by default. Set to false to stop collecting.
+archive_skeletonization_times = os.environ.get('ARCHIVE_SKELETONIZATION_TIMES', "true").lower() == "true"
 
 # Emit one PHASE_TIMINGS line per message with the wall time of each step of the worker preamble.
 # Off by default. The preamble runs on EVERY message -- including the majority that turn out to be
@@ -153,6 +200,133 @@ archive_skeletonization_times = os.environ.get('ARCHIVE_SKELETONIZATION_TIMES',
 # time (median ~2s, per skeletonization_times_v2.csv) does not explain observed throughput.
 log_phase_timings = os.environ.get('LOG_PHASE_TIMINGS', "false").lower() == "true"
 
+# Seconds a pooled CAVEclient (and the segmentation CloudVolume built from it) is reused before it is
+# rebuilt. Building both used to happen on every message and every bulk request, and PHASE_TIMINGS
+# showed caveclient_init + segmentation_cloudvolume dominating messages that were cache hits.
+# The TTL bounds how long a stale auth token or datastack info can be served. 0 disables pooling.
+cave_client_pool_ttl_secs = float(os.environ.get('CAVE_CLIENT_POOL_TTL_SECS', "900"))
+
+# Generate skeletons whose meshwork is not cached (every output format but "meshwork" and "meshwork_none") without the
+# meshwork features the skeleton does not use: the synapses are queried for the sites the axon/dendrite split needs only,
+# without their positions and other columns, the L2 cache is asked for the volumes the radius is computed from only, and
+# of the segment properties only the radius is computed. The skeleton is the same either way, since the cached H5 serves
+# every format. Set to false to build the full meshwork for every skeleton.
+lean_generation = os.environ.get('LEAN_GENERATION', "true").lower() == "true"
+
+# Generate the lean skeleton of a root created by a proofreading edit from its parents' cached v4 skeletons: only the
+# level 2 neighborhoods the edit changed are skeletonized anew and spliced into what is kept of the parents' skeletons.
+# A root whose rebuilt neighborhoods exceed INCREMENTAL_MAX_REBUILD_FRACTION of its level 2 ids, reach its soma, or whose
+# parents are not cached, is generated in full. Off by default, since a spliced skeleton approximates a full one.
+incremental_generation = os.environ.get('INCREMENTAL_GENERATION', "false").lower() == "true"
+incremental_max_rebuild_fraction = float(os.environ.get('INCREMENTAL_MAX_REBUILD_FRACTION', "0.25"))
+
+# Calls a process keeps in flight to each CAVE service (chunkedgraph, materialization, L2 cache, ...) of a datastack,
+# further calls blocking until one completes. With several messages processed at once (WORKER_CONCURRENCY in
+# messaging.py) or threaded web workers, this bounds the load one pod puts on CAVE however many threads it runs.
+# The pooled CAVEclient is shared by all of them, so the limit is implemented by its connection pools (pool_block).
+# 0 leaves them unbounded.
+cave_max_in_flight_calls = int(os.environ.get('CAVE_MAX_IN_FLIGHT_CALLS', "0"))
+
+# Calls per minute the whole fleet may make to each CAVE service during generation (see _CaveCallGovernor), as JSON,
+# e.g., '{"materialize": 700, "chunkedgraph": 2000}'. Workers used to find out about the materialization service's
+# limit (800 per minute) only from its 429s, after which every message in flight was redelivered. The budget is counted
+# in a store shared by all pods, CAVE_GOVERNOR_STORAGE_URI (a limits storage URI; defaults to LIMITER_URI, memory:// on a
+# local machine, where it only coordinates one process). Each pod adapts the rate it admits calls at between a twentieth
+# of the ceiling and the ceiling, halving it on a 429 and raising it again after each window without one.
+# Services not listed are not governed; '{}' disables the governor.
+cave_governor_rates = json.loads(os.environ.get('CAVE_GOVERNOR_RATES', '{"materialize": 700}'))
+cave_governor_storage_uri = os.environ.get('CAVE_GOVERNOR_STORAGE_URI', os.environ.get('LIMITER_URI', "memory://"))
+if "://" not in cave_governor_storage_uri:  # LIMITER_URI is set to a placeholder on local machines
+    cave_governor_storage_uri = "memory://"
+
+# Seconds a call waits for the governor's budget before being made anyway, leaving it to the service to refuse it.
+cave_governor_max_wait_secs = float(os.environ.get('CAVE_GOVERNOR_MAX_WAIT_SECS', "60"))
+
+# Seconds between refreshes of the soma positions each process holds per datastack and soma table (see _SomaPositionCache).
+# _get_root_soma() used to make up to two live_query calls to the materialization service for every generation, the calls
+# that ran into its rate limit. A table is now loaded once, and each refresh only queries the roots created since the
+# previous one (chunkedgraph.get_delta_roots()) and the rows created since. Only the soma of a root found in it is taken
+# from it: any other root is still looked up with live_query, so that a row added since the last refresh is not missed.
+# 0 disables the cache.
+soma_cache_refresh_secs = float(os.environ.get('SOMA_CACHE_REFRESH_SECS', "3600"))
+
+# Level 2 ids whose L2 cache attributes each process holds (see _Level2AttributeCache), for the generations of neighboring
+# and re-edited roots, which share most of their level 2 ids. A level 2 id's attributes never change, since an edit creates
+# new level 2 ids, so ids are only evicted, least recently used first. An id takes a few hundred bytes. 0 disables the cache.
+l2_attribute_cache_max_entries = int(os.environ.get('L2_ATTRIBUTE_CACHE_MAX_ENTRIES', "250000"))
+
+# Check the cache before validating the root id. Most low-priority bulk messages are for skeletons that already
+# exist, and a cached skeleton was necessarily validated when it was generated, so the refusal list read, the
+# CAVEclient and the chunkedgraph call are only paid when a skeleton actually has to be generated. Such hits are
+# reported with the PHASE_TIMINGS outcome "cache_hit_fast". Set to false to restore validate-then-check ordering.
+cache_first_fast_path = os.environ.get('CACHE_FIRST_FAST_PATH', "true").lower() == "true"
+
+# Seconds the in-memory refusal list is trusted before the snapshot's generation and the markers of the recent hours are
+# checked again (a HEAD and a LIST or two, not a download). Lookups used to GET and parse the whole CSV and scan the DataFrame once per rid, and the bulk paths do
+# that once per rid in the request. Rids added by this process are visible immediately; rids added by other
+# workers become visible within this window. 0 disables the cache and reads the CSV on every check.
+refusal_list_revalidate_secs = float(os.environ.get('REFUSAL_LIST_REVALIDATE_SECS', "60"))
+
+# Threads used by get_cached_skeletons_bulk_by_datastack_and_rids() to read and convert cached skeletons. The work is
+# GCS-bound (one GET per rid), so this bounds the number of concurrent GCS requests one bulk request makes, not CPUs.
+bulk_fetch_concurrency = int(os.environ.get('BULK_FETCH_CONCURRENCY', "32"))
+
+# Bytes of final encoded skeleton payloads (precomputed, flatdict, jsoncompressed, arrayscompressed) each web process
+# keeps in memory, least recently used first out. Neuroglancer sessions request the same few rids over and over and
+# every one of those requests used to go to GCS. This is per uwsgi process, so the worst case is processes (8) times
+# this on top of the normal footprint; size it against cheaper-rss-limit-soft in uwsgi.ini. 0 disables the cache.
+payload_cache_max_bytes = int(os.environ.get('PAYLOAD_CACHE_MAX_BYTES', str(128 * 1024 * 1024)))
+
+# Seconds a payload is served from memory before it is read from the bucket again. Cached skeletons are immutable,
+# so this only bounds how long a skeleton that was deleted or regenerated in the bucket can still be served.
+payload_cache_ttl_secs = float(os.environ.get('PAYLOAD_CACHE_TTL_SECS', "600"))
+
+# Directory on the pod's local SSD holding a second-tier cache of skeleton files between the in-memory payload cache
+# and the bucket. It is shared by all the uwsgi processes of a pod, keyed by skeleton filename and evicted least
+# recently used first once it exceeds disk_cache_max_bytes. Unset (the default) disables it.
+disk_cache_dir = os.environ.get('SKELETON_DISK_CACHE_DIR', None)
+disk_cache_max_bytes = int(os.environ.get('SKELETON_DISK_CACHE_MAX_BYTES', str(10 * 1024 ** 3)))
+
+# Seconds the in-memory skeleton existence index is trusted before its snapshot is HEADed and the markers of the hours it
+# does not cover yet are listed again. skeletons_exist() used to HEAD every rid it was asked about, and it is called on
+# every single-skeleton request (to pick a rate limit category) and for every rid of every bulk submission.
+# A datastack whose index has never been built (see compact_skeleton_index()) falls back to HEADs. 0 disables the index.
+skeleton_index_revalidate_secs = float(os.environ.get('SKELETON_INDEX_REVALIDATE_SECS', "30"))
+
+# Seconds a generation lease (see _GenerationLease) is held before other workers may take it over. When many requests
+# ask for the same uncached skeleton at once, e.g., from a shared Neuroglancer link or a message redelivered while its
+# first delivery is still being processed, only the worker holding the lease generates it. The holder renews the lease
+# every third of this while it generates, so this only bounds how long a lease outlives a worker that died; it need not
+# exceed the longest generation. 0 disables leasing (in-process coalescing still applies).
+generation_lease_ttl_secs = float(os.environ.get('GENERATION_LEASE_TTL_SECS', "60"))
+
+# Seconds a request waits for another worker's generation of the same skeleton before generating it itself.
+generation_lease_wait_secs = float(os.environ.get('GENERATION_LEASE_WAIT_SECS', "120"))
+
+# What a request that only caches its skeleton (output_format "none", i.e., every Pub/Sub message) does when another
+# worker holds the generation lease, rather than occupying a worker while it waits:
+# "requeue" raises GenerationLeaseHeld, which the message callback turns into a nack, so the message is redelivered after
+# the subscription's retry backoff and then, normally, finds the skeleton cached;
+# "ack" drops the message, relying on the holder (whose own message is redelivered if it dies) to cache the skeleton;
+# "wait" waits like a request that needs the skeleton returned.
+# Every generation is reported in PHASE_TIMINGS with one of the outcomes "generated", "generated_duplicate" (generated
+# while another worker held the lease too, the rate this is meant to drive down), "generated_unleased", "coalesced",
+# "generation_lease_wait", "cache_hit_leased", "duplicate_requeued" or "duplicate_acked".
+generation_lease_duplicate_action = os.environ.get('GENERATION_LEASE_DUPLICATE_ACTION', "requeue").lower()
+
+# Roots of at least this many level 3 ids (chunkedgraph.get_leaves(stop_layer=3), a listing several times shorter than
+# the level 2 ids) are generated by heavy workers: workers with more memory and a longer timeout that consume
+# SKELETON_CACHE_HEAVY_RETRIEVE_QUEUE only. Gigantic roots used to reach the refusal list only after killing or timing out
+# the workers they were delivered to, blocking the queues meanwhile. A worker that is not a heavy worker counts them just
+# before generating a root, and raises HeavyRoot for one too large, which the message callback publishes to
+# SKELETON_CACHE_HEAVY_EXCHANGE with a heavy_root attribute. Roots are not counted when they are published, which would
+# route them straight to the heavy queue, because that would add a chunkedgraph call to every request the web tier
+# serves. The cost is that an oversized root passes once through the queue it was published to, and takes a worker
+# slot there for the count, before it is rerouted.
+# 0, or SKELETON_CACHE_HEAVY_EXCHANGE unset, disables the routing.
+heavy_root_min_l3_ids = int(os.environ.get('HEAVY_ROOT_MIN_L3_IDS', "0"))
+heavy_worker = os.environ.get('HEAVY_WORKER', "false").lower() == "true"
+
 
 class _PhaseTimer:
     """Accumulate per-phase wall times and emit them as one structured line.
@@ -189,6 +363,1047 @@ class _PhaseTimer:
             }))
         except Exception:
             pass  # instrumentation must never affect the request
+
+
+class _CaveClientPool:
+    """Process-wide CAVEclient and segmentation CloudVolume per datastack, rebuilt after a TTL.
+
+    Shared by the worker callback and every web entry point. A per-datastack lock ensures that a
+    burst of concurrent requests for a cold datastack builds one client, not one per request.
+    The CloudVolume is built lazily because several callers never need it.
+    """
+
+    def __init__(self, ttl_secs):
+        self._ttl_secs = ttl_secs
+        self._lock = threading.Lock()
+        self._datastack_locks = {}
+        self._entries = {}  # datastack_name -> {"created": t, "client": CAVEclient, "cv": CloudVolume or None}
+
+    @staticmethod
+    def _new_client(datastack_name):
+        if cave_max_in_flight_calls > 0:
+            return caveclient.CAVEclient(
+                datastack_name, server_address=CAVE_CLIENT_SERVER, pool_maxsize=cave_max_in_flight_calls, pool_block=True
+            )
+        return caveclient.CAVEclient(datastack_name, server_address=CAVE_CLIENT_SERVER)
+
+    def _datastack_lock(self, datastack_name):
+        with self._lock:
+            return self._datastack_locks.setdefault(datastack_name, threading.Lock())
+
+    def _fresh_entry(self, datastack_name):
+        entry = self._entries.get(datastack_name)
+        if entry is None or default_timer() - entry["created"] >= self._ttl_secs:
+            return None
+        return entry
+
+    def _entry(self, datastack_name):
+        entry = self._fresh_entry(datastack_name)
+        if entry is not None:
+            return entry
+        with self._datastack_lock(datastack_name):
+            entry = self._fresh_entry(datastack_name)  # another thread may have built it meanwhile
+            if entry is None:
+                entry = {
+                    "created": default_timer(),
+                    "client": self._new_client(datastack_name),
+                    "cv": None,
+                }
+                self._entries[datastack_name] = entry
+            return entry
+
+    def get_client(self, datastack_name):
+        if self._ttl_secs <= 0:
+            return self._new_client(datastack_name)
+        return self._entry(datastack_name)["client"]
+
+    def get_cloudvolume(self, datastack_name):
+        if self._ttl_secs <= 0:
+            return self.get_client(datastack_name).info.segmentation_cloudvolume()
+        entry = self._entry(datastack_name)
+        if entry["cv"] is None:
+            with self._datastack_lock(datastack_name):
+                if entry["cv"] is None:
+                    entry["cv"] = entry["client"].info.segmentation_cloudvolume()
+        return entry["cv"]
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+
+
+_cave_client_pool = _CaveClientPool(cave_client_pool_ttl_secs)
+
+
+class _CaveCallGovernor:
+    """Fleet-wide budget of calls per window for each CAVE service, with a per-pod AIMD rate.
+
+    Every governed call takes a token by incrementing the service's counter for the current window in the shared
+    storage. Once the count passes the rate this pod currently admits, the call sleeps until the next window (plus
+    jitter, so the pods do not all return at once) and tries again. The rate starts at the service's ceiling, is halved
+    (at most once per window, down to a twentieth of the ceiling) when a governed call is refused with a 429, and rises by
+    a twentieth of the ceiling after each window without one. One token is taken per governed call, which may be several
+    HTTP requests (e.g., pcg_meshwork()), so the ceilings should leave headroom below the services' limits.
+    If the storage is unreachable the calls are made ungoverned rather than failed.
+    """
+
+    def __init__(self, rates, storage_uri, window_secs=CAVE_GOVERNOR_WINDOW_SECS, max_wait_secs=60):
+        self._ceilings = {service: float(rate) for service, rate in rates.items() if rate and float(rate) > 0}
+        self._storage_uri = storage_uri
+        self._window_secs = window_secs
+        self._max_wait_secs = max_wait_secs
+        self._lock = threading.Lock()
+        self._storage = None
+        self._rates = {}  # service -> {"rate": calls per window, "changed": t of the last increase or decrease}
+
+    def _get_storage(self):
+        with self._lock:
+            if self._storage is None:
+                self._storage = storage_from_string(self._storage_uri)
+            return self._storage
+
+    def _window(self, now):
+        return int(now // self._window_secs)
+
+    def _state(self, service, now):
+        # changed: when the rate last changed, for the increases; decreased: when it was last halved
+        return self._rates.setdefault(service, {"rate": self._ceilings[service], "changed": now, "decreased": None})
+
+    def rate(self, service):
+        """The rate this pod currently admits calls to service at, raised for each window that passed without a 429."""
+        ceiling = self._ceilings[service]
+        now = time.time()
+        with self._lock:
+            state = self._state(service, now)
+            windows = int((now - state["changed"]) // self._window_secs)
+            if windows > 0:
+                state["rate"] = min(ceiling, state["rate"] + windows * ceiling / 20)
+                state["changed"] = now
+            return state["rate"]
+
+    def rate_limited(self, service):
+        """Halve the rate for service, once per window, since the calls in flight when it was refused are refused too."""
+        ceiling = self._ceilings[service]
+        now = time.time()
+        with self._lock:
+            state = self._state(service, now)
+            if state["decreased"] is not None and now - state["decreased"] < self._window_secs:
+                return
+            state["rate"] = max(ceiling / 20, state["rate"] / 2)
+            state["changed"] = state["decreased"] = now
+            rate = state["rate"]
+        SkeletonService.print(f"CAVE call governor: {service} refused a call with a 429, now admitting {rate:.0f} calls per {self._window_secs}s")
+
+    def acquire(self, service):
+        """Take a token for one call to service, waiting for a later window if this one's budget is spent."""
+        if service not in self._ceilings:
+            return
+        start = time.time()
+        while True:
+            now = time.time()
+            window = self._window(now)
+            try:
+                count = self._get_storage().incr(f"{CAVE_GOVERNOR_KEY_PREFIX}/{service}/{window}", int(self._window_secs * 2) or 1)
+            except Exception as e:
+                SkeletonService.print(f"CAVE call governor: could not reach its storage, calling {service} ungoverned: {repr(e)}")
+                return
+            if count <= self.rate(service):
+                return
+            next_window = (window + 1) * self._window_secs
+            if next_window - start > self._max_wait_secs:
+                return
+            time.sleep(next_window - now + random.uniform(0, self._window_secs / 20))
+
+    @staticmethod
+    def _is_rate_limited(e):
+        """The materialization service surfaces its 429s through a 500, with the status only in the message."""
+        return getattr(getattr(e, "response", None), "status_code", None) == 429 or "429 Too Many Requests" in str(e)
+
+    def call(self, services, fn, *args, **kwargs):
+        """Call fn once a token has been taken for each of services, the CAVE services fn calls."""
+        for service in services:
+            self.acquire(service)
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if self._is_rate_limited(e):
+                for service in services:
+                    if service in self._ceilings:
+                        self.rate_limited(service)
+            raise
+
+    def clear(self):
+        with self._lock:
+            self._rates = {}
+
+
+_cave_call_governor = _CaveCallGovernor(cave_governor_rates, cave_governor_storage_uri, max_wait_secs=cave_governor_max_wait_secs)
+
+
+class _SomaPositionCache:
+    """Process-wide soma position of every root with exactly one row in a soma table, per datastack and table, as of a time.
+
+    A root found in it is a dict hit. A root not found in it is left to the caller's live_query, since a row may have been
+    added for it since the entry was taken, and a skeleton generated without its soma would be cached as such for good.
+    The table is loaded in windows of annotation ids rather than pages of an unordered query, which may repeat or skip
+    rows from one page to the next. Once the refresh interval has passed, the next lookup drops
+    the roots that expired since and queries again the rows of the new roots and of the roots with rows created since
+    (soma tables such as nucleus_alternative_points are curated by hand), reloading the whole table if there are too
+    many new roots or the table was loaded more than SOMA_CACHE_RELOAD_SECS ago. If a refresh fails, the entry is kept.
+    """
+
+    def __init__(self, refresh_secs):
+        self._refresh_secs = refresh_secs
+        self._lock = threading.Lock()
+        self._table_locks = {}
+        self._entries = {}  # (datastack_name, soma_table) -> {"loaded": t, "checked": t, "as_of": datetime, "somas": {rid: position}, "resolution": array}
+
+    def _table_lock(self, key):
+        with self._lock:
+            return self._table_locks.setdefault(key, threading.Lock())
+
+    @staticmethod
+    def _live_query(client, soma_table, timestamp, **kwargs):
+        return _cave_call_governor.call(["materialize"], client.materialize.live_query, soma_table, timestamp, **kwargs)
+
+    @staticmethod
+    def _single_somas(df):
+        counts = df["pt_root_id"].value_counts()
+        df = df[df["pt_root_id"].isin(counts.index[counts == 1])]
+        return dict(zip(df["pt_root_id"].astype(np.int64).tolist(), df["pt_position"]))
+
+    def _load(self, client, soma_table):
+        as_of = datetime.datetime.now(datetime.timezone.utc)
+        pages, first_id = [], 0
+        while True:  # Until an empty window with no ids past it
+            page = self._live_query(
+                client, soma_table, as_of, limit=SOMA_CACHE_PAGE_ROWS,
+                filter_greater_equal_dict={"id": first_id}, filter_less_dict={"id": first_id + SOMA_CACHE_PAGE_ROWS},
+            )
+            first_id += SOMA_CACHE_PAGE_ROWS
+            if len(page) > 0:
+                pages.append(page)
+            elif len(self._live_query(client, soma_table, as_of, limit=1, filter_greater_equal_dict={"id": first_id})) == 0:
+                break
+        return {
+            "loaded": default_timer(),
+            "checked": default_timer(),
+            "as_of": as_of,
+            "somas": self._single_somas(pd.concat(pages) if pages else page),
+            "resolution": (pages[0] if pages else page).attrs.get("dataframe_resolution"),
+        }
+
+    def _refresh(self, client, soma_table, entry):
+        as_of = datetime.datetime.now(datetime.timezone.utc)
+        if default_timer() - entry["loaded"] >= SOMA_CACHE_RELOAD_SECS:
+            return self._load(client, soma_table)
+        old_roots, new_roots = _cave_call_governor.call(["chunkedgraph"], client.chunkedgraph.get_delta_roots, entry["as_of"], as_of)
+        if len(new_roots) > SOMA_CACHE_MAX_DELTA_ROOTS:
+            return self._load(client, soma_table)
+        created = self._live_query(client, soma_table, as_of, filter_greater_dict={"created": entry["as_of"]})
+        somas = dict(entry["somas"])
+        for rid in old_roots:
+            somas.pop(int(rid), None)
+        # All the rows of a root with a row created since, since it may now have more than one (or its row replaced one)
+        roots = {int(rid) for rid in new_roots} | set(created["pt_root_id"].astype(np.int64).tolist())
+        if roots:
+            for rid in roots:
+                somas.pop(rid, None)
+            somas.update(self._single_somas(self._live_query(
+                client, soma_table, as_of, filter_in_dict={"pt_root_id": sorted(roots)}
+            )))
+        return {**entry, "checked": default_timer(), "as_of": as_of, "somas": somas}
+
+    def _entry(self, client, soma_table):
+        key = (client.datastack_name, soma_table)
+        entry = self._entries.get(key)
+        if entry is not None and default_timer() - entry["checked"] < self._refresh_secs:
+            return entry
+        with self._table_lock(key):
+            entry = self._entries.get(key)  # another thread may have refreshed it meanwhile
+            if entry is not None and default_timer() - entry["checked"] < self._refresh_secs:
+                return entry
+            try:
+                entry = self._load(client, soma_table) if entry is None else self._refresh(client, soma_table, entry)
+            except Exception as e:
+                SkeletonService.print(f"Soma position cache could not load {key}, falling back to live_query: {repr(e)}")
+                if entry is not None:
+                    entry = {**entry, "checked": default_timer()}
+            if entry is not None:
+                self._entries[key] = entry
+            return entry
+
+    def lookup(self, client, soma_table, rid):
+        """Return (soma position, resolution) for rid in soma_table, or None if the cache does not hold its soma."""
+        if self._refresh_secs <= 0:
+            return None
+        entry = self._entry(client, soma_table)
+        if entry is None:
+            return None
+        position = entry["somas"].get(int(rid))
+        if position is None:
+            return None
+        return position, entry["resolution"]
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+
+
+_soma_position_cache = _SomaPositionCache(soma_cache_refresh_secs)
+
+
+class _Level2AttributeCache:
+    """Process-wide L2 cache attributes of level 2 ids, per datastack, least recently used evicted past max_entries.
+
+    get_l2data() answers like cave_client.l2cache.get_l2data(), fetching only the level 2 ids it does not hold all the
+    requested attributes of. Level 2 ids the L2 cache has not computed yet are not held, so they are asked for again.
+    """
+
+    def __init__(self, max_entries):
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (datastack_name, l2id) -> {attribute: value}
+
+    def get_l2data(self, cave_client, l2ids, attributes):
+        if self._max_entries <= 0 or attributes is None:
+            return _cave_call_governor.call(["l2cache"], cave_client.l2cache.get_l2data, l2ids, attributes=attributes)
+        datastack_name = cave_client.datastack_name
+        l2data, missing = {}, []
+        with self._lock:
+            for l2id in l2ids:
+                key = (datastack_name, int(l2id))
+                entry = self._entries.get(key)
+                if entry is not None and all(attribute in entry for attribute in attributes):
+                    self._entries.move_to_end(key)
+                    l2data[str(l2id)] = {attribute: entry[attribute] for attribute in attributes}
+                else:
+                    missing.append(l2id)
+        if missing:
+            fetched = _cave_call_governor.call(["l2cache"], cave_client.l2cache.get_l2data, missing, attributes=attributes)
+            l2data.update(fetched)
+            with self._lock:
+                for l2id, values in fetched.items():
+                    if values:
+                        key = (datastack_name, int(l2id))
+                        self._entries[key] = {**self._entries.get(key, {}), **values}
+                        self._entries.move_to_end(key)
+                while len(self._entries) > self._max_entries:
+                    self._entries.popitem(last=False)
+        return l2data
+
+    def clear(self):
+        with self._lock:
+            self._entries = OrderedDict()
+
+
+_level2_attribute_cache = _Level2AttributeCache(l2_attribute_cache_max_entries)
+
+
+class _Level2CachedClient:
+    """A CAVEclient whose l2cache.get_l2data() reads through _level2_attribute_cache, for pcg_skel, which makes the call
+    itself. It compares and hashes as the client it wraps, so that pcg_skel's per-client caches still hit."""
+
+    class _L2CacheClient:
+        def __init__(self, cave_client):
+            self._cave_client = cave_client
+
+        def get_l2data(self, l2_ids, attributes=None):
+            return _level2_attribute_cache.get_l2data(self._cave_client, l2_ids, attributes)
+
+        def __getattr__(self, name):
+            return getattr(self._cave_client.l2cache, name)
+
+    def __init__(self, cave_client):
+        self._cave_client = cave_client
+        self.l2cache = _Level2CachedClient._L2CacheClient(cave_client)
+
+    def __getattr__(self, name):
+        return getattr(self._cave_client, name)
+
+    def __eq__(self, other):
+        return (other._cave_client if isinstance(other, _Level2CachedClient) else other) is self._cave_client
+
+    def __hash__(self):
+        return hash(self._cave_client)
+
+
+class _RefusalListCache:
+    """Process-wide refusal list per bucket, held as datastack_name -> set of int64 root ids.
+
+    Once the revalidation window has passed, the next lookup HEADs the snapshot, downloading the whole list again only
+    if its ETag/Last-Modified/size changed, and lists the markers of the hours since the list was loaded that have not
+    settled, reading only the markers it has not seen yet. A revalidation so costs about as much however many markers
+    compact_refusal_list() has yet to fold into the snapshot. Each bucket is revalidated under its own lock, so that a
+    slow GCS call for one bucket holds up neither the others nor add(). If revalidation fails and a previous copy is
+    held, the previous copy keeps being served rather than failing every request on a transient GCS error.
+    """
+
+    # An hour's markers are listed until this many seconds after it ended, after which no more can appear in it
+    HOUR_SETTLE_SECS = 120
+
+    def __init__(self, revalidate_secs):
+        self._revalidate_secs = revalidate_secs
+        self._lock = threading.Lock()
+        self._bucket_locks = {}
+        # bucket -> {"checked": t, "version": snapshot head token, "rids": {datastack_name: set(rid)},
+        #            "from_hour": first unsettled hour, "markers": {YYYYMMDDHH: set(marker path)}, "added": set((datastack_name, rid))}
+        self._buckets = {}
+
+    def _bucket_lock(self, bucket):
+        with self._lock:
+            return self._bucket_locks.setdefault(bucket, threading.Lock())
+
+    @staticmethod
+    def _version(bucket):
+        """The snapshot's HEAD token, all None if there is no snapshot. Raises if the snapshot cannot be HEADed."""
+        head = CloudFiles(f"{bucket}").head(SKELETONIZATION_REFUSAL_LIST_FILENAME)
+        if not head:
+            return (None, None, None)
+        return (head.get("ETag"), str(head.get("Last-Modified")), head.get("Content-Length"))
+
+    @staticmethod
+    def _to_sets(refusal_df):
+        rids = {}
+        for datastack_name, group in refusal_df.groupby("DATASTACK_NAME"):
+            rids[datastack_name] = set(group["ROOT_ID"].astype(np.int64).tolist())
+        return rids
+
+    @staticmethod
+    def _merge_sets(rids, added_rids):
+        """rids with added_rids added, copy-on-write so that readers iterating the previous sets are unaffected."""
+        merged = dict(rids)
+        for datastack_name, datastack_rids in added_rids.items():
+            merged[datastack_name] = merged.get(datastack_name, set()) | datastack_rids
+        return merged
+
+    def _load(self, bucket, version=None):
+        if version is None:
+            try:
+                version = self._version(bucket)
+            except Exception:  # Unknown, so the first revalidation that can HEAD the snapshot reloads the list
+                version = None
+        from_hour = datetime.datetime.now(datetime.timezone.utc).replace(minute=0, second=0, microsecond=0)
+        rids = self._to_sets(SkeletonService._read_refusal_list_without_timestamps(bucket))
+        return {"checked": default_timer(), "version": version, "rids": rids, "from_hour": from_hour, "markers": {}, "added": set()}
+
+    def _revalidate(self, bucket, state):
+        version = self._version(bucket)
+        if version != state["version"]:
+            return self._load(bucket, version)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        hour, from_hour, markers, new_markers = state["from_hour"], None, {}, []
+        while hour <= now:
+            hour_str = hour.strftime("%Y%m%d%H")
+            listed = set(SkeletonService._list_refusal_markers(bucket, hour_str))
+            new_markers.extend(listed - state["markers"].get(hour_str, set()))
+            if from_hour is None and (now - hour).total_seconds() < 3600 + self.HOUR_SETTLE_SECS:
+                from_hour = hour
+            if from_hour is not None:  # The markers of settled hours need not be remembered, as they are not listed again
+                markers[hour_str] = listed
+            hour += datetime.timedelta(hours=1)
+        rids = state["rids"]
+        if new_markers:
+            rids = self._merge_sets(rids, self._to_sets(SkeletonService._read_refusal_markers(bucket, sorted(new_markers))))
+        return {**state, "checked": default_timer(), "rids": rids, "from_hour": from_hour or state["from_hour"], "markers": markers}
+
+    def _refresh(self, bucket):
+        with self._bucket_lock(bucket):
+            state = self._buckets.get(bucket)
+            if state is not None and default_timer() - state["checked"] < self._revalidate_secs:
+                return state  # another thread revalidated it meanwhile
+            try:
+                new_state = self._load(bucket) if state is None else self._revalidate(bucket, state)
+            except Exception as e:
+                if state is None:
+                    raise
+                SkeletonService.print(f"Failed to refresh the refusal list from {bucket}, continuing with the previous copy: {str(e)}")
+                new_state = {**state, "checked": default_timer()}
+            with self._lock:
+                current = self._buckets.get(bucket)
+                if current is not None and current["added"]:  # add()ed meanwhile, perhaps too late for new_state to hold
+                    added_rids = {}
+                    for datastack_name, rid in current["added"]:
+                        added_rids.setdefault(datastack_name, set()).add(rid)
+                    new_state["rids"] = self._merge_sets(new_state["rids"], added_rids)
+                new_state["added"] = set()
+                self._buckets[bucket] = new_state
+            return new_state
+
+    def rids(self, bucket, datastack_name):
+        """Return the set of refused root ids for a datastack. Callers must not modify it."""
+        if self._revalidate_secs <= 0:
+            return self._to_sets(SkeletonService._read_refusal_list_without_timestamps(bucket)).get(datastack_name, set())
+        state = self._buckets.get(bucket)
+        if state is None or default_timer() - state["checked"] >= self._revalidate_secs:
+            state = self._refresh(bucket)
+        return state["rids"].get(datastack_name, set())
+
+    def contains(self, bucket, datastack_name, rid):
+        return int(rid) in self.rids(bucket, datastack_name)
+
+    def add(self, bucket, datastack_name, rid):
+        """Record a rid this process just added, without waiting for the next revalidation."""
+        with self._lock:
+            state = self._buckets.get(bucket)
+            if state is not None:
+                state["rids"] = self._merge_sets(state["rids"], {datastack_name: {int(rid)}})
+                state["added"] = state["added"] | {(datastack_name, int(rid))}
+
+    def clear(self):
+        with self._lock:
+            self._buckets = {}
+
+
+_refusal_list_cache = _RefusalListCache(refusal_list_revalidate_secs)
+
+
+class _PayloadCache:
+    """Process-wide LRU of final encoded skeleton payloads, bounded by total bytes, with a TTL per entry.
+
+    Keys are the payload's full bucket path (see SkeletonService._get_payload_cache_key()), so each format and
+    skeleton version is cached separately. Payloads are bytes and are never mutated, so they are shared, not copied.
+    Payloads larger than a quarter of the budget are not cached, so one huge skeleton cannot flush everything else.
+    """
+
+    def __init__(self, max_bytes, ttl_secs):
+        self._max_bytes = max_bytes
+        self._ttl_secs = ttl_secs
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires, payload), least recently used first
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def _remove(self, key):
+        _, payload = self._entries.pop(key)
+        self._bytes -= len(payload)
+
+    def get(self, key):
+        if self._max_bytes <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= default_timer():
+                self._remove(key)
+                self._evictions += 1
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def put(self, key, payload):
+        if self._max_bytes <= 0 or not isinstance(payload, bytes) or len(payload) > self._max_bytes // 4:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (default_timer() + self._ttl_secs, payload)
+            self._bytes += len(payload)
+            while self._bytes > self._max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self._max_bytes,
+                "ttl_secs": self._ttl_secs,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries = OrderedDict()
+            self._bytes = 0
+            self._hits = 0
+            self._misses = 0
+            self._evictions = 0
+
+
+_payload_cache = _PayloadCache(payload_cache_max_bytes, payload_cache_ttl_secs)
+
+
+class _DiskCache:
+    """Pod-local cache of skeleton files on disk, shared by every process that points at the same directory.
+
+    Files are named by a hash of their bucket path. Writes go to a temporary file that is renamed into place, so
+    readers in other processes never see a partial file. Recency is the file's mtime, which a hit bumps, so every
+    process shares one LRU order. Eviction scans the directory, so it only runs after a tenth of the budget has
+    been written by this process, and only in one process at a time (a non-blocking flock on a lock file).
+    Any OS error is treated as a miss: the bucket is always the source of truth.
+    """
+
+    def __init__(self, root_dir, max_bytes):
+        self._root_dir = root_dir
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._written_since_sweep = max_bytes  # Sweep on the first write, since other processes may have filled it
+        if self.enabled:
+            os.makedirs(root_dir, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return bool(self._root_dir) and self._max_bytes > 0
+
+    def _path(self, key):
+        return os.path.join(self._root_dir, hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                payload = f.read()
+            os.utime(path)
+            return payload
+        except OSError:
+            return None
+
+    def put(self, key, payload):
+        if not self.enabled or not isinstance(payload, bytes) or len(payload) > self._max_bytes:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            SkeletonService.print(f"Failed to write {key} to the disk cache: {str(e)}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            self._written_since_sweep += len(payload)
+            sweep = self._written_since_sweep >= self._max_bytes // 10
+            if sweep:
+                self._written_since_sweep = 0
+        if sweep:
+            self._evict()
+
+    def _evict(self):
+        try:
+            with open(os.path.join(self._root_dir, ".lock"), "w") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return  # Another process is already sweeping
+                entries = []
+                total_bytes = 0
+                with os.scandir(self._root_dir) as it:
+                    for entry in it:
+                        if entry.name.startswith(".") or entry.name.endswith(".tmp"):
+                            continue
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+                        total_bytes += stat.st_size
+                if total_bytes <= self._max_bytes:
+                    return
+                # Evict down to 90% so that the next few writes do not immediately trigger another sweep
+                for _, size, path in sorted(entries):
+                    if total_bytes <= self._max_bytes * 0.9:
+                        break
+                    try:
+                        os.remove(path)
+                        total_bytes -= size
+                    except FileNotFoundError:
+                        pass
+        except OSError as e:
+            SkeletonService.print(f"Failed to evict from the disk cache: {str(e)}")
+
+
+_disk_cache = _DiskCache(disk_cache_dir, disk_cache_max_bytes)
+
+
+class _SkeletonIndexCache:
+    """Process-wide existence index per (bucket, datastack, skeleton version), as a sorted int64 array plus a set.
+
+    The array is the snapshot written by compact_skeleton_index(); the set holds the rids of the delta markers of the
+    hours after the snapshot. A revalidation HEADs the snapshot (downloading it again only if it changed) and lists
+    only the hours that have not been listed since they ended, so its cost does not grow with the size of the bucket.
+    As with _RefusalListCache, a failed revalidation keeps serving the previous copy.
+    """
+
+    # An hour's markers are listed until this many seconds after it ended, after which no more can appear in it
+    HOUR_SETTLE_SECS = 120
+
+    def __init__(self, revalidate_secs):
+        self._revalidate_secs = revalidate_secs
+        self._lock = threading.Lock()
+        self._indexes = {}  # (bucket, datastack_name, skeleton_version) -> state, see _refresh()
+
+    @staticmethod
+    def _hours_after(through_hour, now):
+        """The YYYYMMDDHH hours after through_hour, up to and including the current one."""
+        hour = datetime.datetime.strptime(through_hour, "%Y%m%d%H").replace(tzinfo=datetime.timezone.utc) + datetime.timedelta(hours=1)
+        while hour <= now:
+            yield hour
+            hour += datetime.timedelta(hours=1)
+
+    def _refresh(self, key):
+        bucket, datastack_name, skeleton_version = key
+        with self._lock:
+            state = self._indexes.get(key)
+            if state is not None and default_timer() - state["checked"] < self._revalidate_secs:
+                return state  # another thread revalidated it meanwhile
+            try:
+                cf = CloudFiles(bucket)
+                index_prefix = SkeletonService._skeleton_index_prefix(datastack_name, skeleton_version)
+                head = cf.head(f"{index_prefix}snapshot.npz")
+                version = (head.get("ETag"), str(head.get("Last-Modified")), head.get("Content-Length")) if head else None
+                if state is None or version != state["version"]:
+                    rids, through_hour = SkeletonService._read_skeleton_index_snapshot(bucket, datastack_name, skeleton_version)
+                    state = {"version": version, "rids": rids, "through_hour": through_hour, "delta_rids": set(), "settled_hours": set()}
+                else:
+                    state = dict(state)
+                if state["through_hour"] is not None:
+                    now = datetime.datetime.now(datetime.timezone.utc)
+                    delta_rids = set(state["delta_rids"])
+                    settled_hours = set(state["settled_hours"])
+                    for hour in self._hours_after(state["through_hour"], now):
+                        hour_str = hour.strftime("%Y%m%d%H")
+                        if hour_str in settled_hours:
+                            continue
+                        delta_rids.update(SkeletonService._list_skeleton_index_deltas(bucket, datastack_name, skeleton_version, hour_str))
+                        if (now - hour).total_seconds() >= 3600 + self.HOUR_SETTLE_SECS:
+                            settled_hours.add(hour_str)
+                    state["delta_rids"] = delta_rids
+                    state["settled_hours"] = settled_hours
+            except Exception as e:
+                previous = self._indexes.get(key)
+                if previous is None:
+                    raise
+                SkeletonService.print(f"Failed to refresh the skeleton index of {datastack_name} v{skeleton_version} in {bucket}, continuing with the previous copy: {str(e)}")
+                previous["checked"] = default_timer()
+                return previous
+            state["checked"] = default_timer()
+            self._indexes[key] = state
+            return state
+
+    def _state(self, bucket, datastack_name, skeleton_version):
+        key = (bucket, datastack_name, skeleton_version)
+        state = self._indexes.get(key)
+        if state is None or default_timer() - state["checked"] >= self._revalidate_secs:
+            state = self._refresh(key)
+        return state
+
+    def exist(self, bucket, datastack_name, skeleton_version, rids):
+        """
+        Return {rid: bool} for the rids, or None if the index is disabled or has never been built for this datastack,
+        in which case the caller must check the bucket itself.
+        """
+        if self._revalidate_secs <= 0:
+            return None
+        state = self._state(bucket, datastack_name, skeleton_version)
+        if state["through_hour"] is None:
+            return None
+        query = np.asarray(rids, dtype=np.int64)
+        positions = np.searchsorted(state["rids"], query)
+        in_snapshot = (positions < len(state["rids"])) & (state["rids"][np.minimum(positions, len(state["rids"]) - 1)] == query) \
+            if len(state["rids"]) else np.zeros(len(query), dtype=bool)
+        delta_rids = state["delta_rids"]
+        return {int(rid): bool(found) or int(rid) in delta_rids for rid, found in zip(query, in_snapshot)}
+
+    @staticmethod
+    def _prefix_ranges(rid_prefixes):
+        """
+        The disjoint, sorted, inclusive ranges of int64 rids whose decimal representation starts with one of the prefixes:
+        for prefix p and every length n it can be extended to, [p * 10^k, (p + 1) * 10^k - 1] with k = n - len(p).
+        A prefix with a leading zero, "0" included, matches no rid, as when listing the bucket by prefix.
+        """
+        int64_max = np.iinfo(np.int64).max
+        ranges = []
+        for rid_prefix in rid_prefixes:
+            rid_prefix = str(rid_prefix)
+            if rid_prefix.startswith("0"):
+                continue
+            for k in range(len(str(int64_max)) - len(rid_prefix) + 1):
+                lo = int(rid_prefix) * 10 ** k
+                if lo > int64_max:
+                    break
+                ranges.append((lo, min((int(rid_prefix) + 1) * 10 ** k - 1, int64_max)))
+        merged = []
+        for lo, hi in sorted(ranges):
+            if merged and lo <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+            else:
+                merged.append((lo, hi))
+        return merged
+
+    def query(self, bucket, datastack_name, skeleton_version, rid_prefixes, limit=None, cursor=None):
+        """
+        Return (num_found, rids) for the rids starting with any of the decimal rid_prefixes, in ascending order, after
+        cursor (a rid) if given and at most limit of them. Counting is a pair of binary searches per range and only the
+        returned rids are materialized, so the cost depends on limit, not on how many skeletons the bucket holds.
+        Return None if the index is disabled or has never been built for this datastack.
+        """
+        if self._revalidate_secs <= 0:
+            return None
+        state = self._state(bucket, datastack_name, skeleton_version)
+        if state["through_hour"] is None:
+            return None
+        snapshot_rids = state["rids"]
+        ranges = self._prefix_ranges(rid_prefixes)
+        # Markers not yet folded into the snapshot are few, so they are simply filtered
+        delta_rids = np.array(sorted(
+            rid for rid in state["delta_rids"] if any(lo <= rid <= hi for lo, hi in ranges)
+        ), dtype=np.int64)
+        delta_rids = delta_rids[~np.isin(delta_rids, snapshot_rids)]
+
+        num_found = len(delta_rids)
+        for lo, hi in ranges:
+            num_found += int(np.searchsorted(snapshot_rids, hi, side="right") - np.searchsorted(snapshot_rids, lo, side="left"))
+
+        rids = []
+        for lo, hi in ranges:
+            if cursor is not None:
+                if hi <= cursor:
+                    continue
+                lo = max(lo, cursor + 1)
+            remaining = None if limit is None else limit - len(rids)
+            if remaining is not None and remaining <= 0:
+                break
+            start = np.searchsorted(snapshot_rids, lo, side="left")
+            end = np.searchsorted(snapshot_rids, hi, side="right")
+            if remaining is not None:
+                end = min(end, start + remaining)
+            page = snapshot_rids[start:end]
+            # Delta rids in this range that sort before the end of the page (or anywhere in the range if it wasn't cut short)
+            delta_hi = hi if remaining is None or end - start < remaining else int(page[-1])
+            delta_page = delta_rids[(delta_rids >= lo) & (delta_rids <= delta_hi)]
+            page = np.concatenate([page, delta_page])
+            page.sort()
+            rids.extend(page[:remaining].tolist())
+        return num_found, rids
+
+    def add(self, bucket, datastack_name, skeleton_version, rid):
+        """Record a skeleton this process just wrote, without waiting for the next revalidation."""
+        with self._lock:
+            state = self._indexes.get((bucket, datastack_name, skeleton_version))
+            if state is not None:
+                # Copy-on-write so that readers of the previous set are unaffected
+                state["delta_rids"] = state["delta_rids"] | {int(rid)}
+
+    def clear(self):
+        with self._lock:
+            self._indexes = {}
+
+
+_skeleton_index_cache = _SkeletonIndexCache(skeleton_index_revalidate_secs)
+
+
+class _SingleFlight:
+    """Coalesce concurrent calls with the same key within a process: the first caller runs the call and the others
+    block on a future for its result (or its exception). The key is forgotten once the call completes, so this only
+    deduplicates calls that overlap in time; it is not a cache.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> Future
+
+    def do(self, key, fn):
+        """Return (result, led), where led tells whether this caller ran fn or waited for another caller's run."""
+        with self._lock:
+            future = self._calls.get(key)
+            led = future is None
+            if led:
+                future = Future()
+                self._calls[key] = future
+        if not led:
+            return future.result(), False
+        try:
+            result = fn()
+            future.set_result(result)
+            return result, True
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+_single_flight = _SingleFlight()
+
+
+class _GenerationLease:
+    """A lease on generating one skeleton, held as a small object in the bucket that only one worker can create.
+
+    Creation is conditional (ifGenerationMatch=0 on GCS, O_EXCL for file:// buckets), so of any number of workers
+    racing for the same skeleton exactly one gets the lease. The object records its holder and expiry, so a lease left
+    behind by a worker that died is taken over once it expires rather than blocking the skeleton forever. While it
+    generates, the holder keeps the lease alive with a heartbeat (see start_heartbeat()), which also notices if the lease
+    was taken over regardless, e.g., after the heartbeat stalled, in which case lost is set.
+    """
+
+    _gcs_client = None
+    _gcs_client_lock = threading.Lock()
+
+    def __init__(self, bucket, path, ttl_secs):
+        self._bucket = bucket
+        self._path = path
+        self._ttl_secs = ttl_secs
+        self._generation = None  # GCS object generation of the lease this instance holds
+        self._lock = threading.Lock()  # Serializes renewals with release()
+        self._stop_heartbeat = threading.Event()
+        self._heartbeat = None
+        self.holder = f"{socket.gethostname()}-{os.getpid()}-{threading.get_ident()}-{uuid.uuid4().hex[:8]}"
+        self.lost = False
+
+    def _gcs_blob(self):
+        with _GenerationLease._gcs_client_lock:
+            if _GenerationLease._gcs_client is None:
+                _GenerationLease._gcs_client = google.cloud.storage.Client()
+        bucket_name, _, bucket_prefix = self._bucket[len("gs://"):].partition("/")
+        return _GenerationLease._gcs_client.bucket(bucket_name).blob(bucket_prefix + self._path)
+
+    def _local_path(self):
+        return os.path.join(self._bucket[len("file://"):], self._path)
+
+    def _content(self):
+        return json.dumps({"holder": self.holder, "expires": time.time() + self._ttl_secs})
+
+    def _create(self):
+        """Create the lease object if there is none. Return whether this call created it."""
+        content = self._content()
+        if self._bucket.startswith("gs://"):
+            blob = self._gcs_blob()
+            try:
+                blob.upload_from_string(content, if_generation_match=0)
+            except google.api_core.exceptions.PreconditionFailed:
+                return False
+            self._generation = blob.generation
+            return True
+        if self._bucket.startswith("file://"):
+            os.makedirs(os.path.dirname(self._local_path()), exist_ok=True)
+            try:
+                fd = os.open(self._local_path(), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                return False
+            with os.fdopen(fd, "w") as f:
+                f.write(content)
+            return True
+        raise ValueError(f"Generation leases are not supported for {self._bucket}")
+
+    def _read(self):
+        """Return (holder, expires, generation) of the current lease object, or None if there is none."""
+        if self._bucket.startswith("gs://"):
+            blob = self._gcs_blob()
+            try:
+                content = blob.download_as_bytes()
+            except google.api_core.exceptions.NotFound:
+                return None
+            lease = json.loads(content)
+            return lease["holder"], lease["expires"], blob.generation
+        try:
+            with open(self._local_path()) as f:
+                content = f.read()
+            lease = json.loads(content)
+            return lease["holder"], lease["expires"], None
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            # Created but not written yet (or the writer died in between): expire it relative to its creation
+            return "unknown", os.path.getmtime(self._local_path()) + self._ttl_secs, None
+
+    def _delete(self, generation):
+        if self._bucket.startswith("gs://"):
+            try:
+                # Only delete the lease that was read, not one another worker has created since
+                self._gcs_blob().delete(if_generation_match=generation)
+            except (google.api_core.exceptions.NotFound, google.api_core.exceptions.PreconditionFailed):
+                pass
+        else:
+            try:
+                os.remove(self._local_path())
+            except FileNotFoundError:
+                pass
+
+    def try_acquire(self):
+        if self._create():
+            return True
+        lease = self._read()
+        if lease is None:
+            return self._create()  # Released in the meantime
+        holder, expires, generation = lease
+        if expires < time.time():
+            SkeletonService.print(f"Taking over the generation lease {self._path} of {holder}, which expired {time.time() - expires:.0f}s ago")
+            self._delete(generation)
+            return self._create()
+        return False
+
+    def _renew(self):
+        """Push the expiry of the lease this instance holds forward. Return False if it is not ours anymore."""
+        if self._bucket.startswith("gs://"):
+            blob = self._gcs_blob()
+            try:
+                blob.upload_from_string(self._content(), if_generation_match=self._generation)
+            except (google.api_core.exceptions.NotFound, google.api_core.exceptions.PreconditionFailed):
+                return False
+            self._generation = blob.generation
+            return True
+        lease = self._read()
+        if lease is None or lease[0] != self.holder:
+            return False
+        tmp_path = f"{self._local_path()}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self._content())
+        os.replace(tmp_path, self._local_path())
+        return True
+
+    def _heartbeat_loop(self):
+        while not self._stop_heartbeat.wait(self._ttl_secs / 3):
+            with self._lock:
+                if self._stop_heartbeat.is_set():
+                    return
+                try:
+                    if not self._renew():
+                        self.lost = True
+                        SkeletonService.print(f"Lost the generation lease {self._path}; another worker may be generating the skeleton too")
+                        return
+                except Exception as e:
+                    # Keep trying; if renewals keep failing the lease expires, as if this worker had died
+                    SkeletonService.print(f"Exception while renewing the generation lease {self._path}: {str(e)}")
+
+    def start_heartbeat(self):
+        """Renew the acquired lease every third of its TTL until it is released."""
+        self._heartbeat = threading.Thread(target=_in_current_context(self._heartbeat_loop), name=f"lease-heartbeat-{self._path}", daemon=True)
+        self._heartbeat.start()
+
+    def release(self):
+        with self._lock:
+            self._stop_heartbeat.set()
+            if not self.lost:
+                self._delete(self._generation)
+
+
+class GenerationLeaseHeld(Exception):
+    """Raised instead of waiting when a request that only caches its skeleton finds another worker generating it.
+
+    See generation_lease_duplicate_action. The message callback returns the message to the subscription on this.
+    """
+
+
+class HeavyRoot(Exception):
+    """Raised instead of generating when a worker that is not a heavy worker is handed a root of at least
+    HEAVY_ROOT_MIN_L3_IDS level 3 ids. The message callback publishes the message to SKELETON_CACHE_HEAVY_EXCHANGE on this.
+    """
+
+
 class SkeletonService:
     @staticmethod
     def get_session_timestamp():
@@ -196,20 +1411,29 @@ class SkeletonService:
         Get the session timestamp from the request context.
         If we are outside a request context, return the current time.
         """
-        global session_timestamp
 
         if has_request_context():
             try:
-                session_timestamp = request.start_time.strftime('@_%Y%m%d_%H%M%S.%f')[:-3]
+                _session_timestamp.set(request.start_time.strftime('@_%Y%m%d_%H%M%S.%f')[:-3])
             except Exception as e:
                 print(f"Error getting session timestamp from request: {str(e)}")
                 traceback.print_exc()
-                session_timestamp = datetime.datetime.now().strftime('!_%Y%m%d_%H%M%S.%f')[:-3]
+                _session_timestamp.set(datetime.datetime.now().strftime('!_%Y%m%d_%H%M%S.%f')[:-3])
         else:
             # return "no_request_context"
-            session_timestamp = datetime.datetime.now().strftime('&_%Y%m%d_%H%M%S.%f')[:-3]
-        return session_timestamp
+            _session_timestamp.set(datetime.datetime.now().strftime('&_%Y%m%d_%H%M%S.%f')[:-3])
+        return _session_timestamp.get()
     
+    @staticmethod
+    def begin_request():
+        """
+        Reset the request state (see _verbose_level) at the start of a web request.
+        A uwsgi thread serves one request after another in the same context, and the entry points only ever raise the verbose level,
+        so without this a single verbose request would leave every later request on its thread verbose.
+        """
+        _verbose_level.set(default_verbose_level)
+        SkeletonService.get_session_timestamp()
+
     @staticmethod
     def print_with_session_timestamp(*args, session_timestamp_='unknown', sep=' ', end='\n', file=None, flush=False):
         try:
@@ -225,9 +1449,9 @@ class SkeletonService:
     @staticmethod
     def print(*args, sep=' ', end='\n', file=None, flush=False):
         try:
-            SkeletonService.print_with_session_timestamp(*args, session_timestamp_=session_timestamp, sep=sep, end=end, file=file, flush=flush)
+            SkeletonService.print_with_session_timestamp(*args, session_timestamp_=_session_timestamp.get(), sep=sep, end=end, file=file, flush=flush)
         except Exception as e:
-            print(f"Error printing message for session [{session_timestamp}]: {str(e)}")
+            print(f"Error printing message for session [{_session_timestamp.get()}]: {str(e)}")
             traceback.print_exc()
             print(*args, sep=sep, end=end, file=file, flush=flush)
 
@@ -357,6 +1581,16 @@ class SkeletonService:
         datastack_name_remapped = DATASTACK_NAME_REMAPPING[datastack_name] if datastack_name in DATASTACK_NAME_REMAPPING else datastack_name
         return f"{bucket}{datastack_name_remapped}/{skeleton_version}/"
 
+    @staticmethod
+    def _get_payload_cache_key(params, format):
+        """
+        Key of a final encoded payload in _payload_cache: the path the payload would have in the bucket.
+        params carries the requested skeleton version, not the cached one, since the payload depends on it.
+        """
+        bucket, skeleton_version, datastack_name = params[1], params[2], params[3]
+        return SkeletonService._get_bucket_subdirectory(bucket, datastack_name, skeleton_version) + \
+            SkeletonService._get_skeleton_filename(*params, format)
+
     @staticmethod
     def _retrieve_skeleton_from_local(params, format):
         """
@@ -364,26 +1598,26 @@ class SkeletonService:
         computing a skeleton from scratch or retrieving one from a Google bucket.
         """
         try:
-            if verbose_level >= 1:
+            if _verbose_level.get() >= 1:
                 SkeletonService.print("_retrieve_skeleton_from_local()")
 
             debug_skeleton_cache_loc = os.environ.get("DEBUG_SKELETON_CACHE_LOC", None)
             if debug_skeleton_cache_loc is None:
-                if verbose_level >= 1:
+                if _verbose_level.get() >= 1:
                     SkeletonService.print("DEBUG_SKELETON_CACHE_LOC is not set.")
                 return None
             
             file_name = SkeletonService._get_skeleton_filename(
                 *params, "h5", include_compression=False
             )
-            if verbose_level >= 1:
+            if _verbose_level.get() >= 1:
                 SkeletonService.print(f"_retrieve_skeleton_from_local() Looking at {debug_skeleton_cache_loc + file_name}")
             if not os.path.exists(debug_skeleton_cache_loc + file_name):
-                if verbose_level >= 1:
+                if _verbose_level.get() >= 1:
                     SkeletonService.print(f"_retrieve_skeleton_from_local() No local skeleton file found at {debug_skeleton_cache_loc + file_name}")
                 return None
 
-            if verbose_level >= 1:
+            if _verbose_level.get() >= 1:
                 SkeletonService.print(
                     "_retrieve_skeleton_from_local() Local debug skeleton file found. Reading it..."
                 )
@@ -434,20 +1668,49 @@ class SkeletonService:
         bucket, skeleton_version, datastack_name = params[1], params[2], params[3]
 
         file_name = SkeletonService._get_skeleton_filename(*params, format)
-        if verbose_level >= 1:
+        if _verbose_level.get() >= 1:
             SkeletonService.print("File name being sought in cache:", file_name)\
         
         if skeleton_version != HIGHEST_SKELETON_VERSION:
-            if verbose_level >= 1:
+            if _verbose_level.get() >= 1:
                 SkeletonService.print(f"_confirm_skeleton_in_cache() Skeleton version V{skeleton_version} was requested but caching only supports version V{HIGHEST_SKELETON_VERSION}, so that version will be sought.")
             skeleton_version = HIGHEST_SKELETON_VERSION
 
-        if verbose_level >= 1:
+        if _verbose_level.get() >= 1:
             SkeletonService.print(f"_confirm_skeleton_in_cache() Querying skeleton at {SkeletonService._get_bucket_subdirectory(bucket, datastack_name, skeleton_version)}{file_name}")
         cf = CloudFiles(SkeletonService._get_bucket_subdirectory(bucket, datastack_name, skeleton_version))
-        if verbose_level >= 1:
-            SkeletonService.print(f"_confirm_skeleton_in_cache() Result for {file_name}: {cf.exists(file_name)}")
-        return cf.exists(file_name)
+        exists = cf.exists(file_name)
+        if _verbose_level.get() >= 1:
+            SkeletonService.print(f"_confirm_skeleton_in_cache() Result for {file_name}: {exists}")
+        return exists
+
+    @staticmethod
+    def _confirm_skeletons_in_cache(params_list, format):
+        """
+        Batched _confirm_skeleton_in_cache(): one CloudFiles exists() over all the filenames, which CloudFiles issues concurrently.
+        params_list must share a bucket and datastack. Return a list of booleans in the order of params_list.
+        """
+        if not params_list:
+            return []
+        if not CACHE_NON_H5_SKELETONS and format != "h5":
+            return [False] * len(params_list)
+
+        bucket, datastack_name = params_list[0][1], params_list[0][3]
+        file_names = [SkeletonService._get_skeleton_filename(*params, format) for params in params_list]
+        cf = CloudFiles(SkeletonService._get_bucket_subdirectory(bucket, datastack_name, HIGHEST_SKELETON_VERSION))
+        exists = cf.exists(file_names)
+        if _verbose_level.get() >= 1:
+            SkeletonService.print(f"_confirm_skeletons_in_cache() {sum(exists.values())} of {len(file_names)} found in cache")
+        return [bool(exists.get(file_name)) for file_name in file_names]
+
+    @staticmethod
+    def _read_cached_file(cf, file_name):
+        """
+        Read a cached file with a single GET, returning None if it is missing. A failed read raises rather than
+        returning None, so that an error is never mistaken for a cache miss (and a needless regeneration).
+        This replaces exists() followed by get(), which cost two round trips on every hit.
+        """
+        return cf.get(file_name)
 
     @staticmethod
     def _retrieve_meshwork_from_cache(params, include_compression):
@@ -456,68 +1719,71 @@ class SkeletonService:
         file_name = SkeletonService._get_meshwork_filename(
             *params, include_compression=include_compression
         )
-        if verbose_level >= 1:
+        if _verbose_level.get() >= 1:
             SkeletonService.print("_retrieve_meshwork_from_cache() File name being sought in cache:", file_name)
         bucket = params[1]
-        if verbose_level >= 1:
+        if _verbose_level.get() >= 1:
             SkeletonService.print(f"_retrieve_meshwork_from_cache() Querying meshwork at {bucket}meshworks/{MESHWORK_VERSION}/{file_name}")
         cf = CloudFiles(f"{bucket}meshworks/{MESHWORK_VERSION}/")
-        if cf.exists(file_name):
-            return cf.get(file_name)
-        else:
-            if verbose_level >= 1:
+        meshwork_bytes = SkeletonService._read_cached_file(cf, file_name)
+        if meshwork_bytes is None:
+            if _verbose_level.get() >= 1:
                 SkeletonService.print(f"_retrieve_meshwork_from_cache() Not found in cache: {file_name}")
         
-        return None
+        return meshwork_bytes
 
     @staticmethod
     def _retrieve_skeleton_from_cache(params, format):
         """
         If the requested format is JSON or PRECOMPUTED, then read the skeleton and return it as native content.
         But if the requested format is H5 or SWC, then return the location of the skeleton file.
+        When SKELETON_DISK_CACHE_DIR is set, the pod-local disk cache is consulted before the bucket.
         """
         if not CACHE_NON_H5_SKELETONS and format != "h5" and format != "h5_mpsk":
             return None
-        
+
         bucket, skeleton_version, datastack_name = params[1], params[2], params[3]
         if skeleton_version != HIGHEST_SKELETON_VERSION:
-            if verbose_level >= 1:
+            if _verbose_level.get() >= 1:
                 SkeletonService.print(f"_retrieve_skeleton_from_cache() Skeleton version V{skeleton_version} was requested but caching only supports version V{HIGHEST_SKELETON_VERSION}, so that version will be retrieved.")
             skeleton_version = HIGHEST_SKELETON_VERSION
         
         cached_format = format if format != "h5_mpsk" else "h5"
         file_name = SkeletonService._get_skeleton_filename(*params, cached_format)
         
-        if verbose_level >= 1:
+        if _verbose_level.get() >= 1:
             SkeletonService.print("_retrieve_skeleton_from_cache() File name being sought in cache:", file_name)
-        if verbose_level >= 1:
+        if _verbose_level.get() >= 1:
             SkeletonService.print(f"_retrieve_skeleton_from_cache() Querying skeleton at {SkeletonService._get_bucket_subdirectory(bucket, datastack_name, skeleton_version)}{file_name}")
         
-        cf = CloudFiles(SkeletonService._get_bucket_subdirectory(bucket, datastack_name, skeleton_version))
-        if cf.exists(file_name):
+        bucket_subdirectory = SkeletonService._get_bucket_subdirectory(bucket, datastack_name, skeleton_version)
+        skeleton_bytes = _disk_cache.get(bucket_subdirectory + file_name)
+        if skeleton_bytes is None:
+            cf = CloudFiles(bucket_subdirectory)
+            skeleton_bytes = SkeletonService._read_cached_file(cf, file_name)
+            if skeleton_bytes is not None:
+                _disk_cache.put(bucket_subdirectory + file_name, skeleton_bytes)
+        if skeleton_bytes is not None:
             if format == "flatdict":
-                return cf.get(file_name)
+                return skeleton_bytes
             elif format == "json" or format == "arrays":
-                return cf.get_json(file_name)
+                return json.loads(skeleton_bytes.decode("utf-8"))
             elif format == "jsoncompressed" or format == "arrayscompressed":
-                return cf.get(file_name)
+                return skeleton_bytes
             elif format == "precomputed":
-                return cf.get(file_name)
+                return skeleton_bytes
             elif format == "h5":
-                skeleton_bytes = cf.get(file_name)
                 skeleton_bytes = BytesIO(skeleton_bytes)
                 return skeleton_bytes
             elif format == "h5_mpsk":
-                skeleton_bytes = cf.get(file_name)
                 skeleton_bytes = BytesIO(skeleton_bytes)
                 skeleton, lvl2_ids = SkeletonIO.read_skeleton_h5(skeleton_bytes)
                 return VersionedSkeleton(skeleton, skeleton_version, lvl2_ids)
             elif format == "swc" or format == "swccompressed":
-                skeleton_bytes = cf.get(file_name)
                 skeleton_bytes = BytesIO(skeleton_bytes)
                 return skeleton_bytes  # Don't even bother building a skeleton object
         else:
-            if verbose_level >= 1:
+            if _verbose_level.get() >= 1:
                 SkeletonService.print(f"_retrieve_skeleton_from_cache() Not found in cache: {file_name}")
                 
         return None  # if format != "h5_mpsk" else (None, None)
@@ -531,7 +1797,7 @@ class SkeletonService:
             *params, include_compression=include_compression
         )
         bucket = params[1]
-        if verbose_level >= 1:
+        if _verbose_level.get() >= 1:
             SkeletonService.print(f"Caching meshwork to {bucket}meshworks/{MESHWORK_VERSION}/{file_name}")
         cf = CloudFiles(f"{bucket}meshworks/{MESHWORK_VERSION}/")
         cf.put(
@@ -563,9 +1829,10 @@ class SkeletonService:
             *params, format, include_compression=include_compression
         )
 
-        if verbose_level >= 1:
-            SkeletonService.print(f"Caching skeleton to {SkeletonService._get_bucket_subdirectory(bucket, datastack_name, skeleton_version)}/{file_name}")
-        cf = CloudFiles(SkeletonService._get_bucket_subdirectory(bucket, datastack_name, skeleton_version))
+        bucket_subdirectory = SkeletonService._get_bucket_subdirectory(bucket, datastack_name, skeleton_version)
+        if _verbose_level.get() >= 1:
+            SkeletonService.print(f"Caching skeleton to {bucket_subdirectory}/{file_name}")
+        cf = CloudFiles(bucket_subdirectory)
         if format == "json" or format == "arrays":
             cf.put_json(
                 file_name, skeleton_file_content, COMPRESSION if include_compression else None
@@ -576,61 +1843,159 @@ class SkeletonService:
                 skeleton_file_content,
                 compress=COMPRESSION if include_compression else None,
             )
+            # Warm the local disk cache so that reads from this pod need not go back to the bucket for what it just wrote
+            _disk_cache.put(bucket_subdirectory + file_name, skeleton_file_content)
+
+        if format == "h5":
+            try:
+                SkeletonService._record_skeleton_in_index(bucket, datastack_name, skeleton_version, params[0])
+            except Exception as e:
+                # The index lagging behind the cache only costs HEADs or a redundant request, so don't fail the write over it.
+                SkeletonService.print(f"Exception while recording {params[0]} in the skeleton index: {str(e)}. Traceback:")
+                traceback.print_exc()
     
     @staticmethod
     def _archive_skeletonization_time(bucket, datastack_name, rid, skeleton_version, n_vertices, n_end_points, n_branch_points, skeletonization_elapsed_time):
         """
         Archive the skeletonization time for a given root id.
 
-        Disabled unless ARCHIVE_SKELETONIZATION_TIMES=true, because this is a full
-        read-modify-write of one fixed object at the bucket root, performed once per generated
-        skeleton by every worker:
-
-            GET the whole CSV -> append one row -> gzip and PUT the whole CSV
-
-        The object is never rotated, so it grows by a row per skeleton forever and the per-skeleton
-        cost grows with it. Measured on minniev7 2026-08-16 it had reached 85,309 rows / 8.10 MB
-        uncompressed (1.45 MB gzipped), which every one of 200 workers downloaded and re-uploaded
-        for each skeleton. Workers sat at 1-6 millicores of a 100m request with ~9,000 messages
-        backlogged: blocked on this, not on CPU. GCS also allows only about one write per second to
-        a single object, so the workers additionally contend and retry.
-
-        TODO: This function does not lock or mutex the file while it alters it (which GCP buckets do not support).
-            Multiple skeleton workers could collide here (get1, get2, put1, put2) such that only the last overlapping worker's data is saved.
-        Re-enabling this as-is reintroduces both problems. A sharded design (one small object per
-        skeleton under a prefix, aggregated offline) would avoid the read, the rewrite and the race.
+        Each call PUTs one small CSV (header plus one row) under a date- and worker-partitioned prefix and
+        reads nothing. This replaces a full read-modify-write of a single bucket-root CSV per skeleton,
+        which on minniev7 (2026-08-16) had reached 85,309 rows / 8.10 MB that every one of 200 workers
+        downloaded and re-uploaded for each skeleton, contending on GCS's ~1 write/s per-object limit and
+        losing rows to overlapping writes. compact_skeletonization_times() merges the records offline.
         """
         if not archive_skeletonization_times:
             return
 
         try:
-            if verbose_level >= 1:
+            if _verbose_level.get() >= 1:
                 SkeletonService.print(f"Archiving skeletonization time for rid {rid} and skeleton version {skeleton_version}: {skeletonization_elapsed_time} seconds")
 
+            now = datetime.datetime.now(datetime.timezone.utc)
+            # The worker component keeps concurrent writers on disjoint keys. The rid and a microsecond timestamp keep one worker's records apart.
+            worker = f"{socket.gethostname()}-{os.getpid()}"
+            shard_path = f"{SKELETONIZATION_TIMES_PREFIX}shards/{now.strftime('%Y-%m-%d')}/{worker}/{now.strftime('%H%M%S%f')}_{datastack_name}_{rid}_v{skeleton_version}.csv"
+
+            skeleton_times = ",".join(SKELETONIZATION_TIMES_COLUMNS) + "\n"
+            skeleton_times += f"{now.strftime('%Y-%m-%d_%H:%M:%S')},{__version__},{caveclient.__version__},{datastack_name},{skeleton_version},{rid},{n_vertices},{n_end_points},{n_branch_points},{skeletonization_elapsed_time}\n"
+
             cf = CloudFiles(f"{bucket}")  # Don't bother entering a skeleton version subdirectory
-            if cf.exists(SKELETONIZATION_TIMES_FILENAME):
-                skeleton_times = cf.get(SKELETONIZATION_TIMES_FILENAME).decode("utf-8")
-            else:
-                # Initialize a new empty CSV file with a header line.
-                # Column order must match the row appended below (Datastack_Name before
-                # Skeleton_Version); they disagreed previously, so a from-scratch recreation of the
-                # file would have mislabelled every column.
-                skeleton_times = "Timestamp,SkeletonService_version,CAVEclient_version,Datastack_Name,Skeleton_Version,Root_ID,N_Vertices,N_Endpoints,N_Branchpoints,Skeletonization_Time_Secs\n"
-            
-            skeleton_times += f"{datetime.datetime.now().strftime('%Y-%m-%d_%H:%M:%S')},{__version__},{caveclient.__version__},{datastack_name},{skeleton_version},{rid},{n_vertices},{n_end_points},{n_branch_points},{skeletonization_elapsed_time}\n"
-            skeleton_times_bytes = BytesIO(skeleton_times.encode("utf-8")).getvalue()
-            cf.put(SKELETONIZATION_TIMES_FILENAME, skeleton_times_bytes, compress=True)
+            cf.put(shard_path, skeleton_times.encode("utf-8"), compress=False)
         except Exception as e:
             # This is a non-critical operation, so don't let it stop the process.
             SkeletonService.print(f"Exception in _archive_skeletonization_time(): {str(e)}. Traceback:")
             traceback.print_exc()
+
+    @staticmethod
+    def compact_skeletonization_times(bucket, dates=None, verbose_level_=0):
+        """
+        Merge the per-skeleton timing records of each day into <prefix>daily/<YYYY-MM-DD>.parquet and delete the merged records.
+        By default every day before today (UTC) is compacted, i.e., days that no longer receive records.
+        A day that was already compacted is merged with its existing daily file, so late records are not lost.
+        Return a dict of date -> number of records compacted.
+        """
+        if verbose_level_ > _verbose_level.get():
+            _verbose_level.set(verbose_level_)
+
+        shards_prefix = f"{SKELETONIZATION_TIMES_PREFIX}shards/"
+        cf = CloudFiles(f"{bucket}")
+
+        shard_paths_by_date = {}
+        for path in cf.list(prefix=shards_prefix):
+            date = path[len(shards_prefix):].split("/", 1)[0]
+            shard_paths_by_date.setdefault(date, []).append(path)
+
+        if dates is None:
+            today = datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d')
+            dates = [date for date in shard_paths_by_date if date < today]
+
+        compacted = {}
+        for date in sorted(dates):
+            shard_paths = shard_paths_by_date.get(date, [])
+            if not shard_paths:
+                continue
+
+            contents = cf.get(shard_paths, return_dict=True)
+            day_dfs = [pd.read_csv(BytesIO(content), dtype=str) for content in contents.values() if content]
+
+            daily_filename = f"{SKELETONIZATION_TIMES_PREFIX}daily/{date}.parquet"
+            existing = cf.get(daily_filename)
+            if existing is not None:
+                day_dfs.insert(0, pd.read_parquet(BytesIO(existing)).astype(str))
+
+            day_df = pd.concat(day_dfs, ignore_index=True).drop_duplicates()
+            day_df = day_df.astype({
+                "Skeleton_Version": "int64", "Root_ID": "int64",
+                "N_Vertices": "int64", "N_Endpoints": "int64", "N_Branchpoints": "int64",
+                "Skeletonization_Time_Secs": "float64",
+            })
+            parquet_bytes = BytesIO()
+            day_df.to_parquet(parquet_bytes, index=False)
+            cf.put(daily_filename, parquet_bytes.getvalue(), compress=False)
+            # Only delete the records once the daily file that contains them has been written
+            cf.delete(shard_paths)
+
+            compacted[date] = len(shard_paths)
+            SkeletonService.print(f"Compacted {len(shard_paths)} skeletonization time records into {daily_filename} in {bucket} ({len(day_df)} rows)")
+        return compacted
     
+    @staticmethod
+    def _refusal_marker_path(datastack_name, rid, hour):
+        return f"{SKELETONIZATION_REFUSAL_MARKERS_PREFIX}{hour}/{datastack_name}/{rid}"
+
+    @staticmethod
+    def _list_refusal_markers(bucket, hour=None):
+        """The refusal markers in the bucket, or only those written in hour (YYYYMMDDHH) if given."""
+        prefix = f"{SKELETONIZATION_REFUSAL_MARKERS_PREFIX}{hour}/" if hour else SKELETONIZATION_REFUSAL_MARKERS_PREFIX
+        marker_paths = []
+        for path in CloudFiles(f"{bucket}").list(prefix=prefix):
+            # Ignore anything under the prefix that isn't a [<YYYYMMDDHH>/]<datastack_name>/<rid> marker
+            parts = path[len(SKELETONIZATION_REFUSAL_MARKERS_PREFIX):].split("/")
+            if path.startswith(prefix) and parts[-1].isdigit() and (
+                len(parts) == 2 or (len(parts) == 3 and len(parts[0]) == 10 and parts[0].isdigit())
+            ):
+                marker_paths.append(path)
+        return marker_paths
+
+    @staticmethod
+    def _read_refusal_markers(bucket, marker_paths):
+        """
+        Read refusal markers into a DataFrame with the same columns as the snapshot.
+        """
+        rows = []
+        if marker_paths:
+            contents = CloudFiles(f"{bucket}").get(marker_paths, return_dict=True)
+            for path in marker_paths:
+                datastack_name, rid = path[len(SKELETONIZATION_REFUSAL_MARKERS_PREFIX):].split("/")[-2:]
+                timestamp = contents.get(path)
+                rows.append({
+                    "TIMESTAMP": timestamp.decode("utf-8") if timestamp else "",
+                    "DATASTACK_NAME": datastack_name,
+                    "ROOT_ID": int(rid),
+                })
+        return pd.DataFrame(rows, columns=["TIMESTAMP", "DATASTACK_NAME", "ROOT_ID"])
+
+    @staticmethod
+    def _merge_refusal_lists(*refusal_dfs):
+        merged_df = pd.concat([df for df in refusal_dfs if len(df) > 0] or [refusal_dfs[0]])
+        return merged_df.drop_duplicates(subset=["DATASTACK_NAME", "ROOT_ID"], keep="first").reset_index(drop=True)
+
     @staticmethod
     def _read_refusal_list(bucket):
         """
-        Read the root id refusal list and return it.
+        Read the root id refusal list, i.e., the snapshot plus any markers added since it was last compacted, and return it.
+        """
+        snapshot_df = SkeletonService._read_refusal_list_snapshot(bucket)
+        markers_df = SkeletonService._read_refusal_markers(bucket, SkeletonService._list_refusal_markers(bucket))
+        return SkeletonService._merge_refusal_lists(snapshot_df, markers_df)
+
+    @staticmethod
+    def _read_refusal_list_snapshot(bucket):
+        """
+        Read the compacted root id refusal list and return it.
         """
-        if verbose_level >= 1:
+        if _verbose_level.get() >= 1:
             SkeletonService.print(f"Reading list of root ids for which to refuse skeletonization from {bucket}")
         
         cf = CloudFiles(f"{bucket}")
@@ -654,15 +2019,14 @@ class SkeletonService:
         Some root ids cannot be meaningfully skeletonized. For example, some correspond to gigantic objects. Such root ids should not be processed.
         Return True if the root id is in the list of root ids to refuse skeletonization.
         """
-        if verbose_level >= 1:
+        if _verbose_level.get() >= 1:
             SkeletonService.print(f"Checking the list of root ids for which to refuse skeletonization from {bucket}, for datastack {datastack_name} and root id {rid}")
         
         if not isinstance(rid, int):
             rid = int(rid)
         
-        skeletonization_refusal_root_ids_df_without_timestamps = SkeletonService._read_refusal_list_without_timestamps(bucket)
-        result = (skeletonization_refusal_root_ids_df_without_timestamps == [datastack_name, rid]).all(axis=1).any()
-        if verbose_level >= 1:
+        result = _refusal_list_cache.contains(bucket, datastack_name, rid)
+        if _verbose_level.get() >= 1:
             SkeletonService.print(f"Result of refusal list check for datastack {datastack_name} and root id {rid}: {result}")
         return result
     
@@ -678,17 +2042,16 @@ class SkeletonService:
         """
         Add the root id to the list of root ids for which skeletonization should be refused.
         """
-        global verbose_level
-        if verbose_level_ > verbose_level:
-            verbose_level = verbose_level_
-        if rid == debugging_root_id and verbose_level < 1:
-            verbose_level = 1
+        if verbose_level_ > _verbose_level.get():
+            _verbose_level.set(verbose_level_)
+        if rid == debugging_root_id and _verbose_level.get() < 1:
+            _verbose_level.set(1)
         
         # We don't want to add the test rid to the refusal list.
         # Doing so might prevent us from testing it again in the future because it would be found in the dead letter queue at the beginning of the process.
         # Admittedly, the code skips the refusal check for this id anyway, so it shoudl be safe to add it to the refusal listm buy let's not do it anyway.
         if rid == DEBUG_DEAD_LETTER_TEST_RID:
-            if verbose_level >= 1:
+            if _verbose_level.get() >= 1:
                 SkeletonService.print(f"Not adding rid {rid} to the refusal list because we are only testing that it reaches this point in the code.")
             return
 
@@ -696,31 +2059,152 @@ class SkeletonService:
             SkeletonService.print(f"Root ID somehow exceeds INT64 range: {rid}. Adding it to the refusal list would corrupt the Pandas DataFrame. It will not be added.")
             return
         
-        if verbose_level >= 1:
+        if _verbose_level.get() >= 1:
             SkeletonService.print(f"Adding rid {rid} to the refusal list for datastack {datastack_name}")
         
-        skeletonization_refusal_root_ids_df = SkeletonService._read_refusal_list(bucket)
-
-        # We wouldn't expect the rid to already exist in the refusal list by the time we reach this point in the code,
-        # but it's possible the concurrent requests or some other erroneous or transient or problematic situation could cause this,
-        # so let's go ahead and make sure we don't add any duplicate entries. There's no harm in doing this.
-        mask = (skeletonization_refusal_root_ids_df['DATASTACK_NAME'] == datastack_name) & (skeletonization_refusal_root_ids_df['ROOT_ID'] == rid)
-        if mask.sum() == 0:
-            timestamp = datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%d_%H%M%S')
-            skeletonization_refusal_root_ids_df = pd.concat([
-                skeletonization_refusal_root_ids_df, pd.DataFrame({'TIMESTAMP': [timestamp], 'DATASTACK_NAME': [datastack_name], 'ROOT_ID': [rid]})])
+        # Write one marker object for this rid rather than reading, appending to and rewriting the whole list.
+        # A rewrite per dead-lettered rid ran into the same per-object write rate limit and lost-update race as
+        # _archive_skeletonization_time(). The marker is keyed by (hour, datastack, rid), and readers merge markers by
+        # (datastack, rid), so adding a rid twice, e.g., from concurrent dead letters, still yields a single entry.
+        now = datetime.datetime.now(datetime.timezone.utc)
+        cf = CloudFiles(f"{bucket}")
+        result = cf.put(
+            SkeletonService._refusal_marker_path(datastack_name, rid, now.strftime("%Y%m%d%H")),
+            now.strftime('%Y%m%d_%H%M%S').encode("utf-8"),
+            compress=False,
+        )
+        
+        if _verbose_level.get() >= 1:
+            SkeletonService.print(f"Result of adding rid {rid} to the refusal list for datastack {datastack_name}: {result}")
 
-            csv_content = skeletonization_refusal_root_ids_df.to_csv(index=False)
-            csv_content_bytes = BytesIO(csv_content.encode("utf-8")).getvalue()
+        _refusal_list_cache.add(bucket, datastack_name, rid)
 
-            cf = CloudFiles(f"{bucket}")
-            result = cf.put(SKELETONIZATION_REFUSAL_LIST_FILENAME, csv_content_bytes, compress=True)
+    @staticmethod
+    def compact_refusal_list(bucket, verbose_level_=0):
+        """
+        Fold the refusal markers into the snapshot and delete the folded markers.
+        Markers written while this runs are not listed, so they are neither folded nor deleted and survive to the next run.
+        Only one compaction should run per bucket at a time: two overlapping runs could each rewrite the snapshot.
+        """
+        if verbose_level_ > _verbose_level.get():
+            _verbose_level.set(verbose_level_)
         
-            if verbose_level >= 1:
-                SkeletonService.print(f"Result of adding rid {rid} to the refusal list for datastack {datastack_name}: {result}")
-        else:
-            if verbose_level >= 1:
-                SkeletonService.print(f"Rid {rid} already exists in the refusal list for datastack {datastack_name}. A duplicate entry wasn't added.")
+        marker_paths = SkeletonService._list_refusal_markers(bucket)
+        if not marker_paths:
+            if _verbose_level.get() >= 1:
+                SkeletonService.print(f"No refusal markers to compact in {bucket}")
+            return 0
+        
+        snapshot_df = SkeletonService._read_refusal_list_snapshot(bucket)
+        markers_df = SkeletonService._read_refusal_markers(bucket, marker_paths)
+        merged_df = SkeletonService._merge_refusal_lists(snapshot_df, markers_df)
+
+        csv_content_bytes = BytesIO(merged_df.to_csv(index=False).encode("utf-8")).getvalue()
+        cf = CloudFiles(f"{bucket}")
+        cf.put(SKELETONIZATION_REFUSAL_LIST_FILENAME, csv_content_bytes, compress=True)
+        # Only delete the markers once the snapshot that contains them has been written
+        cf.delete(marker_paths)
+
+        SkeletonService.print(f"Compacted {len(marker_paths)} refusal markers into {SKELETONIZATION_REFUSAL_LIST_FILENAME} in {bucket}: {len(snapshot_df)} -> {len(merged_df)} entries")
+        return len(marker_paths)
+
+    @staticmethod
+    def _skeleton_index_prefix(datastack_name, skeleton_version):
+        datastack_name_remapped = DATASTACK_NAME_REMAPPING[datastack_name] if datastack_name in DATASTACK_NAME_REMAPPING else datastack_name
+        return f"{SKELETON_INDEX_PREFIX}{datastack_name_remapped}/{skeleton_version}/"
+
+    @staticmethod
+    def _record_skeleton_in_index(bucket, datastack_name, skeleton_version, rid):
+        """
+        Add an H5 skeleton that was just cached to the existence index: one empty marker under the current hour,
+        and the process's own copy of the index. The marker name carries everything, so rewriting it is harmless.
+        """
+        hour = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%d%H")
+        cf = CloudFiles(f"{bucket}")
+        cf.put(f"{SkeletonService._skeleton_index_prefix(datastack_name, skeleton_version)}delta/{hour}/{rid}", b"", compress=False)
+        _skeleton_index_cache.add(bucket, datastack_name, skeleton_version, rid)
+
+    @staticmethod
+    def _read_skeleton_index_snapshot(bucket, datastack_name, skeleton_version):
+        """
+        Return the snapshot's sorted int64 array of rids and the last hour (YYYYMMDDHH) of markers folded into it.
+        If the index has never been built, return an empty array and None.
+        """
+        cf = CloudFiles(f"{bucket}")
+        snapshot_bytes = cf.get(f"{SkeletonService._skeleton_index_prefix(datastack_name, skeleton_version)}snapshot.npz")
+        if snapshot_bytes is None:
+            return np.array([], dtype=np.int64), None
+        with np.load(BytesIO(snapshot_bytes)) as snapshot:
+            return snapshot["rids"].astype(np.int64), str(snapshot["through_hour"])
+
+    @staticmethod
+    def _list_skeleton_index_deltas(bucket, datastack_name, skeleton_version, hour=None):
+        """
+        Return the rids of the markers of one hour, or of all hours, as a dict {hour: [rids]} when hour is None.
+        """
+        cf = CloudFiles(f"{bucket}")
+        delta_prefix = f"{SkeletonService._skeleton_index_prefix(datastack_name, skeleton_version)}delta/"
+        if hour is not None:
+            return [int(path.rsplit("/", 1)[-1]) for path in cf.list(prefix=f"{delta_prefix}{hour}/") if path.rsplit("/", 1)[-1].isdigit()]
+        deltas = {}
+        for path in cf.list(prefix=delta_prefix):
+            parts = path[len(delta_prefix):].split("/")
+            if len(parts) == 2 and parts[1].isdigit():
+                deltas.setdefault(parts[0], []).append(int(parts[1]))
+        return deltas
+
+    @staticmethod
+    def compact_skeleton_index(bucket, datastack_name, skeleton_version=None, rebuild=False, verbose_level_=0):
+        """
+        Fold the markers of every hour that ended more than an hour ago into the existence index snapshot and delete them.
+        If the index has never been built, or rebuild is set, the snapshot is first built by listing every cached H5
+        skeleton of the datastack. That listing is expensive and is meant to be done once per datastack.
+        Only one compaction should run per datastack at a time: two overlapping runs could each rewrite the snapshot.
+        Return the number of rids in the snapshot.
+        """
+        if verbose_level_ > _verbose_level.get():
+            _verbose_level.set(verbose_level_)
+        if skeleton_version is None:
+            skeleton_version = HIGHEST_SKELETON_VERSION
+        if bucket[-1] != "/":
+            bucket += "/"
+
+        rids, through_hour = SkeletonService._read_skeleton_index_snapshot(bucket, datastack_name, skeleton_version)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        if through_hour is None or rebuild:
+            # The suffix of the filename skeletons_exist() looks for, i.e., everything after the rid. Some CloudFiles
+            # backends list compressed files without their compression extension, so it is matched without it.
+            suffix = SkeletonService._get_skeleton_filename(0, bucket, skeleton_version, datastack_name, [1, 1, 1], True, 7500, "h5", False)
+            suffix = suffix[suffix.find("__ds"):]
+            cf = CloudFiles(SkeletonService._get_bucket_subdirectory(bucket, datastack_name, skeleton_version))
+            listed_rids = [
+                int(file_name[(file_name.find("rid-")+len("rid-")):file_name.find("__ds")])
+                for file_name in cf.list(prefix=f"skeleton__v{skeleton_version}__rid-")
+                if file_name.endswith(suffix) or os.path.splitext(file_name)[0].endswith(suffix)
+            ]
+            rids = np.unique(np.concatenate([rids, np.array(listed_rids, dtype=np.int64)]))
+            if _verbose_level.get() >= 1:
+                SkeletonService.print(f"Built the skeleton index of {datastack_name} v{skeleton_version} from {len(listed_rids)} cached skeletons")
+
+        # Markers are written with the writer's current hour, so an hour that ended more than an hour ago is complete.
+        # The markers of the current and previous hour are left for the next run.
+        settled_hour = (now - datetime.timedelta(hours=2)).strftime("%Y%m%d%H")
+        deltas = SkeletonService._list_skeleton_index_deltas(bucket, datastack_name, skeleton_version)
+        folded_hours = sorted(hour for hour in deltas if hour <= settled_hour)
+        if folded_hours:
+            rids = np.unique(np.concatenate([rids] + [np.array(deltas[hour], dtype=np.int64) for hour in folded_hours]))
+        through_hour = max(through_hour or settled_hour, settled_hour)
+
+        snapshot = BytesIO()
+        np.savez_compressed(snapshot, rids=rids, through_hour=np.array(through_hour))
+        index_prefix = SkeletonService._skeleton_index_prefix(datastack_name, skeleton_version)
+        cf = CloudFiles(f"{bucket}")
+        cf.put(f"{index_prefix}snapshot.npz", snapshot.getvalue(), compress=False)
+        # Only delete the markers once the snapshot that contains them has been written
+        cf.delete([f"{index_prefix}delta/{hour}/{rid}" for hour in folded_hours for rid in deltas[hour]])
+
+        SkeletonService.print(f"Compacted {sum(len(deltas[hour]) for hour in folded_hours)} markers into the skeleton index of {datastack_name} v{skeleton_version} in {bucket}: {len(rids)} rids through {through_hour}")
+        return len(rids)
 
     @staticmethod
     def _get_root_soma(rid, client, soma_tables=None):
@@ -739,8 +2223,8 @@ class SkeletonService:
         """
 
         now = datetime.datetime.now(datetime.timezone.utc)
-        root_ts = client.chunkedgraph.get_root_timestamps(
-            rid, latest=True, timestamp=now
+        root_ts = _cave_call_governor.call(
+            ["chunkedgraph"], client.chunkedgraph.get_root_timestamps, rid, latest=True, timestamp=now
         )[0]
 
         if soma_tables is None:
@@ -752,16 +2236,17 @@ class SkeletonService:
                 soma_tables = [soma_tables]
         
         for soma_table in soma_tables:
-            soma_df = client.materialize.tables[soma_table](pt_root_id=rid).live_query(
-                timestamp=root_ts
+            cached = _soma_position_cache.lookup(client, soma_table, rid)
+            if cached is not None:
+                return root_ts, cached[0], cached[1]
+
+            soma_df = _cave_call_governor.call(
+                ["materialize"], client.materialize.tables[soma_table](pt_root_id=rid).live_query, timestamp=root_ts
             )
             if len(soma_df) == 1:
-                break
-
-        if len(soma_df) != 1:
-            return root_ts, None, None
+                return root_ts, soma_df.iloc[0]["pt_position"], soma_df.attrs["dataframe_resolution"]
 
-        return root_ts, soma_df.iloc[0]["pt_position"], soma_df.attrs["dataframe_resolution"]
+        return root_ts, None, None
 
     @staticmethod
     def _generate_v1_skeleton(
@@ -777,9 +2262,9 @@ class SkeletonService:
         """
         From https://caveconnectome.github.io/pcg_skel/tutorial/
         """
-        if verbose_level >= 1:
+        if _verbose_level.get() >= 1:
             SkeletonService.print("_generate_v1_skeleton()", rid)
-        if verbose_level >= 1:
+        if _verbose_level.get() >= 1:
             SkeletonService.print(f"CAVEClient version: {caveclient.__version__}")
         if (datastack_name == "minnie65_public") or (
             datastack_name == "minnie65_phase3_v1"
@@ -791,18 +2276,20 @@ class SkeletonService:
         root_ts, soma_location, soma_resolution = SkeletonService._get_root_soma(
             rid, cave_client, soma_tables
         )
-        if verbose_level >= 1:
+        if _verbose_level.get() >= 1:
             SkeletonService.print(f"soma_resolution: {soma_resolution}")
 
         # Get the location of the soma from nucleus detection:
-        if verbose_level >= 1:
+        if _verbose_level.get() >= 1:
             SkeletonService.print(
                 f"_generate_v1_skeleton {rid} {datastack_name} {soma_resolution} {collapse_soma} {collapse_radius}"
             )
             SkeletonService.print(f"CAVEClient version: {caveclient.__version__}")
 
         # Use the above parameters in the skeletonization:
-        skel = pcg_skel.pcg_skeleton(
+        skel = _cave_call_governor.call(
+            ["chunkedgraph", "l2cache"],
+            pcg_skel.pcg_skeleton,
             rid,
             cave_client,
             root_point=soma_location,
@@ -823,10 +2310,16 @@ class SkeletonService:
         collapse_soma,
         collapse_radius,
         cave_client,
+        lean=False,
     ):
-        if verbose_level >= 1:
+        """
+        Generate a v4 skeleton and the meshwork it was built from. With lean (see LEAN_GENERATION), only the meshwork
+        features the skeleton uses are computed, and no meshwork is returned. A lean skeleton may also be spliced from the
+        skeletons of the roots rid was edited from (see INCREMENTAL_GENERATION).
+        """
+        if _verbose_level.get() >= 1:
             SkeletonService.print("_generate_v4_skeleton()", rid)
-        if verbose_level >= 1:
+        if _verbose_level.get() >= 1:
             SkeletonService.print(f"CAVEClient version: {caveclient.__version__}")
         if (datastack_name == "minnie65_public") or (
             datastack_name == "minnie65_phase3_v1"
@@ -835,14 +2328,412 @@ class SkeletonService:
         else:
             soma_tables = None
 
-        root_ts, soma_location, soma_resolution = SkeletonService._get_root_soma(
-            rid, cave_client, soma_tables
+        # The network fetches that do not depend on each other are made at once: the soma lookup, the level 2 graph, the L2
+        # cache attributes of its level 2 ids and the synapses. Only skeletonization needs the soma and the graph, and only
+        # the synapses' mapping to the mesh needs the skeleton (see _fetch_level2_synapses()).
+        synapse_table = cave_client.info.get_datastack_info().get('synapse_table')
+        process_synapses = synapse_table is not None
+        l2dict_future = Future()
+        executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix=f"generate-{rid}")
+        soma_future = executor.submit(_in_current_context(SkeletonService._get_root_soma), rid, cave_client, soma_tables)
+        graph_future = executor.submit(
+            _in_current_context(_cave_call_governor.call), ["chunkedgraph"], cave_client.chunkedgraph.level2_chunk_graph, rid
+        )
+        if lean and incremental_generation:
+            versioned_skeleton = SkeletonService._generate_incremental_v4_skeleton(
+                rid, bucket, datastack_name, root_resolution, collapse_soma, collapse_radius, cave_client,
+                soma_future, graph_future, process_synapses,
+            )
+            if versioned_skeleton is not None:
+                executor.shutdown(wait=False)
+                return None, versioned_skeleton
+        l2data_future = executor.submit(
+            _in_current_context(SkeletonService._fetch_volumetric_properties), cave_client, graph_future, lean
+        )
+        synapses_future = executor.submit(
+            _in_current_context(SkeletonService._fetch_lean_synapse_sites if lean else SkeletonService._fetch_level2_synapses),
+            rid, cave_client, synapse_table, soma_future, l2dict_future,
+        ) if process_synapses else None
+        executor.shutdown(wait=False)
+
+        try:
+            return SkeletonService._build_v4_skeleton(
+                rid, bucket, datastack_name, root_resolution, collapse_soma, collapse_radius, cave_client,
+                soma_future, graph_future, l2data_future, synapses_future, l2dict_future, lean,
+            )
+        finally:
+            if not l2dict_future.done():  # Don't leave the synapse fetch waiting for a skeleton that was not built
+                l2dict_future.set_exception(RuntimeError(f"The skeleton of {rid} was not built"))
+
+    @staticmethod
+    def _get_parent_skeletons(rid, bucket, datastack_name, root_resolution, collapse_soma, collapse_radius, cave_client):
+        """The cached v4 skeletons of the roots the edit that created rid was made to, those that are cached."""
+        created_ts = _cave_call_governor.call(["chunkedgraph"], cave_client.chunkedgraph.get_root_timestamps, [rid])[0]
+        past_id_map = _cave_call_governor.call(
+            ["chunkedgraph"],
+            cave_client.chunkedgraph.get_past_ids,
+            [rid],
+            timestamp_past=created_ts - datetime.timedelta(milliseconds=1),
+        )["past_id_map"]
+        parents = []
+        for parent_rid in past_id_map.get(rid, []):
+            if parent_rid == rid:
+                continue
+            parent = SkeletonService._retrieve_skeleton_from_cache(
+                [parent_rid, bucket, HIGHEST_SKELETON_VERSION, datastack_name, root_resolution, collapse_soma, collapse_radius],
+                "h5_mpsk",
+            )
+            if parent is not None and parent.lvl2_ids is not None:
+                parents.append(parent)
+        return parents
+
+    @staticmethod
+    def _generate_incremental_v4_skeleton(
+        rid,
+        bucket,
+        datastack_name,
+        root_resolution,
+        collapse_soma,
+        collapse_radius,
+        cave_client,
+        soma_future,
+        graph_future,
+        process_synapses,
+    ):
+        """
+        Splice rid's skeleton from its parents' (see _get_parent_skeletons()), or return None if it is to be generated in
+        full. Failures are reported but not raised, so that the skeleton is then generated in full.
+        """
+        try:
+            parents = SkeletonService._get_parent_skeletons(
+                rid, bucket, datastack_name, root_resolution, collapse_soma, collapse_radius, cave_client
+            )
+            if not parents:
+                if _verbose_level.get() >= 1:
+                    SkeletonService.print(f"_generate_incremental_v4_skeleton() No cached parent skeletons of {rid}")
+                return None
+            root_ts, soma_location, soma_resolution = soma_future.result()
+            root_point = np.array(soma_location) * np.array(soma_resolution) if soma_location is not None else None
+            skel = SkeletonService._splice_skeleton(
+                rid, parents, graph_future.result(), root_point, collapse_radius, cave_client, process_synapses
+            )
+        except Exception as e:
+            SkeletonService.print(f"Exception while splicing the skeleton of {rid}: {str(e)}. Traceback:")
+            traceback.print_exc()
+            return None
+        if skel is None:
+            return None
+        skel, lvl2_ids = skel
+        if _verbose_level.get() >= 1:
+            SkeletonService.print(f"_generate_incremental_v4_skeleton() Spliced {rid} from {len(parents)} parent skeletons")
+        return VersionedSkeleton(skel, 4, lvl2_ids)
+
+    @staticmethod
+    def _splice_skeleton(rid, parents, level2_graph, root_point, collapse_radius, cave_client, process_synapses):
+        """
+        Splice rid's skeleton from its parents' skeletons and its level 2 graph, or return None where it is to be generated
+        in full. Return (skeleton, lvl2_ids).
+        The parents' skeleton vertices whose level 2 ids are all still rid's, and that are over INCREMENTAL_REBUILD_HOPS from
+        any level 2 id the edit created, are kept with their radius and compartment. The rest of rid's level 2 graph is
+        skeletonized anew, with the radius of an equivalent cylinder of the L2 volumes, and the compartment of the kept
+        vertices it joins. The pieces are joined along the level 2 graph.
+        """
+        lvl2_ids = np.unique(level2_graph)
+        if len(lvl2_ids) == 0:
+            return None
+        n_mesh = len(lvl2_ids)
+        mesh_edges = np.searchsorted(lvl2_ids, level2_graph)
+        adjacency = sparse.coo_matrix(
+            (np.ones(len(mesh_edges)), (mesh_edges[:, 0], mesh_edges[:, 1])), shape=(n_mesh, n_mesh)
+        ).tocsr()
+        adjacency = adjacency + adjacency.T
+
+        # The parents' skeleton vertices, numbered across all parents, and the one each of rid's level 2 ids maps to
+        mesh_index = {l2id: i for i, l2id in enumerate(lvl2_ids)}
+        owner = np.full(n_mesh, -1)
+        lost = []
+        vertices, edges, radius, compartment, roots, sizes = [], [], [], [], [], []
+        offset = 0
+        for parent in parents:
+            sk = parent.skeleton
+            mesh_to_skel_map = np.asarray(sk.mesh_to_skel_map) + offset
+            mesh_inds = np.array([mesh_index.get(int(l2id), -1) for l2id in parent.lvl2_ids])
+            owner[mesh_inds[mesh_inds >= 0]] = mesh_to_skel_map[mesh_inds >= 0]
+            lost.extend(mesh_to_skel_map[mesh_inds < 0])  # Vertices some of whose level 2 ids are now another root's
+            vertices.append(sk.vertices)
+            edges.append(sk.edges + offset)
+            radius.append(sk.vertex_properties.get("radius", np.ones(sk.n_vertices)))
+            compartment.append(sk.vertex_properties["compartment"] if "compartment" in sk.vertex_properties else None)
+            roots.append(sk.root + offset)
+            sizes.append((offset, offset + sk.n_vertices))
+            offset += sk.n_vertices
+        vertices, edges, radius = np.vstack(vertices), np.vstack(edges), np.concatenate(radius)
+        if process_synapses and any(c is None for c in compartment):
+            return None
+        compartment = np.concatenate(compartment) if process_synapses else None
+
+        # Rebuild around the level 2 ids the edit created, and the parents' vertices that changed
+        rebuilt = owner < 0
+        for _ in range(INCREMENTAL_REBUILD_HOPS):
+            rebuilt = rebuilt | (adjacency @ rebuilt.astype(int) > 0)
+        rebuilt_vertices = np.union1d(owner[rebuilt & (owner >= 0)], lost)
+        rebuilt = rebuilt | np.isin(owner, rebuilt_vertices)
+        if rebuilt.sum() > incremental_max_rebuild_fraction * n_mesh:
+            if _verbose_level.get() >= 1:
+                SkeletonService.print(f"_splice_skeleton() {rebuilt.sum()} of {n_mesh} level 2 ids of {rid} to rebuild")
+            return None
+        kept_vertices = np.unique(owner[~rebuilt])
+        kept_roots = [(root, ((kept_vertices >= start) & (kept_vertices < end)).sum()) for root, (start, end) in zip(roots, sizes)]
+        kept_roots = [(root, n_kept) for root, n_kept in kept_roots if root in kept_vertices]
+        if len(kept_roots) == 0:
+            return None
+
+        rebuilt_inds = np.flatnonzero(rebuilt)
+        l2data = _level2_attribute_cache.get_l2data(
+            cave_client, lvl2_ids[rebuilt_inds].tolist(), attributes=["rep_coord_nm", "size_nm3"]
+        ) if len(rebuilt_inds) > 0 else {}
+        rebuilt_positions = np.array([l2data[str(l2id)]["rep_coord_nm"] for l2id in lvl2_ids[rebuilt_inds]], dtype=float).reshape(-1, 3)
+        rebuilt_volumes = np.array([l2data[str(l2id)].get("size_nm3", 0) or 0 for l2id in lvl2_ids[rebuilt_inds]], dtype=float)
+        if root_point is not None and len(rebuilt_inds) > 0 and \
+                np.linalg.norm(rebuilt_positions - root_point, axis=1).min() <= collapse_radius:
+            return None  # The soma and its collapse are left to a full generation
+
+        # Skeletonize the rebuilt level 2 ids; those with no rebuilt neighbor join a kept neighbor's vertex
+        local_index = np.full(n_mesh, -1)
+        local_index[rebuilt_inds] = np.arange(len(rebuilt_inds))
+        rebuilt_edges = local_index[mesh_edges]
+        rebuilt_edges = rebuilt_edges[(rebuilt_edges >= 0).all(axis=1)]
+        if len(rebuilt_edges) > 0:
+            rebuilt_sk = pcg_skel.pcg_skeleton_direct(rebuilt_positions, rebuilt_edges, root_id=rid)
+            rebuilt_sk_vertices, rebuilt_sk_edges = rebuilt_sk.vertices, rebuilt_sk.edges
+            rebuilt_map = np.asarray(rebuilt_sk.mesh_to_skel_map)
+        else:
+            rebuilt_sk_vertices, rebuilt_sk_edges = np.zeros((0, 3)), np.zeros((0, 2), dtype=int)
+            rebuilt_map = np.full(len(rebuilt_inds), -1)
+
+        # Number the kept vertices, then the rebuilt ones
+        n_kept = len(kept_vertices)
+        renumbered = np.full(len(vertices), -1)
+        renumbered[kept_vertices] = np.arange(n_kept)
+        mesh_to_skel_map = np.full(n_mesh, -1)
+        mesh_to_skel_map[~rebuilt] = renumbered[owner[~rebuilt]]
+        mesh_to_skel_map[rebuilt_inds] = np.where(rebuilt_map >= 0, rebuilt_map + n_kept, -1)
+        unmapped = list(np.flatnonzero(mesh_to_skel_map < 0))
+        while unmapped:
+            still_unmapped = []
+            for i in unmapped:
+                neighbors = adjacency.indices[adjacency.indptr[i]:adjacency.indptr[i + 1]]
+                mapped = neighbors[mesh_to_skel_map[neighbors] >= 0]
+                if len(mapped) > 0:
+                    mesh_to_skel_map[i] = mesh_to_skel_map[mapped[0]]
+                else:
+                    still_unmapped.append(i)
+            if len(still_unmapped) == len(unmapped):
+                return None
+            unmapped = still_unmapped
+
+        kept_edges = renumbered[edges]
+        spliced_edges = [kept_edges[(kept_edges >= 0).all(axis=1)], rebuilt_sk_edges + n_kept]
+        spliced_vertices = np.vstack([vertices[kept_vertices], rebuilt_sk_vertices])
+        n_vertices = len(spliced_vertices)
+
+        # Join the pieces along the level 2 graph, one edge between any two of them
+        components = sparse.csgraph.connected_components(
+            sparse.coo_matrix(
+                (np.ones(sum(len(e) for e in spliced_edges)), tuple(np.vstack(spliced_edges).T)), shape=(n_vertices, n_vertices)
+            ),
+            directed=False,
+        )[1]
+        joins = []
+        crossing = mesh_to_skel_map[mesh_edges]
+        for a, b in crossing[components[crossing[:, 0]] != components[crossing[:, 1]]]:
+            if components[a] != components[b]:
+                joins.append([a, b])
+                components[components == components[b]] = components[a]
+        if len(np.unique(components)) != 1:
+            return None
+        spliced_edges = np.vstack(spliced_edges + [np.array(joins, dtype=int).reshape(-1, 2)])
+        if len(spliced_edges) != n_vertices - 1:
+            return None
+
+        if root_point is not None:
+            root = min(kept_roots, key=lambda r: np.linalg.norm(vertices[r[0]] - root_point))[0]
+        else:
+            root = max(kept_roots, key=lambda r: r[1])[0]  # That of the parent most of the skeleton is kept from
+        root = renumbered[root]
+
+        # The radius of each rebuilt vertex is that of a cylinder of its L2 volume and half its edges' length
+        spliced_radius = np.concatenate([radius[kept_vertices], np.zeros(len(rebuilt_sk_vertices))])
+        edge_lengths = np.linalg.norm(spliced_vertices[spliced_edges[:, 0]] - spliced_vertices[spliced_edges[:, 1]], axis=1)
+        half_lengths = np.bincount(spliced_edges.ravel(), weights=np.repeat(edge_lengths, 2), minlength=n_vertices) / 2
+        volumes = np.bincount(mesh_to_skel_map[rebuilt_inds], weights=rebuilt_volumes, minlength=n_vertices)
+        for v in range(n_kept, n_vertices):
+            if half_lengths[v] > 0:
+                spliced_radius[v] = np.sqrt(volumes[v] / (np.pi * half_lengths[v]))
+            else:
+                spliced_radius[v] = np.cbrt(3 * volumes[v] / (4 * np.pi))
+
+        vertex_properties = {"radius": spliced_radius}
+        if compartment is not None:
+            spliced_compartment = np.zeros(n_vertices, dtype=np.uint8)
+            spliced_compartment[:n_kept] = compartment[kept_vertices]
+            spliced_compartment[spliced_compartment == SOMA_COMPARTMENT_CODE] = DEFAULT_COMPARTMENT_CODE
+            # The rebuilt vertices take the compartment of the kept vertices they join
+            neighbors = [[] for _ in range(n_vertices)]
+            for a, b in spliced_edges:
+                neighbors[a].append(b)
+                neighbors[b].append(a)
+            frontier = list(range(n_kept))
+            while frontier:
+                next_frontier = []
+                for v in frontier:
+                    for n in neighbors[v]:
+                        if spliced_compartment[n] == 0:
+                            spliced_compartment[n] = spliced_compartment[v]
+                            next_frontier.append(n)
+                frontier = next_frontier
+            spliced_compartment[root] = SOMA_COMPARTMENT_CODE
+            vertex_properties["compartment"] = spliced_compartment
+
+        meta = copy.copy(parents[0].skeleton.meta)
+        meta.root_id = rid
+        skel = mp_skeleton.Skeleton(
+            spliced_vertices,
+            spliced_edges,
+            root=root,
+            radius=spliced_radius,
+            mesh_to_skel_map=mesh_to_skel_map,
+            vertex_properties=vertex_properties,
+            meta=meta,
+            remove_zero_length_edges=False,
         )
-        if verbose_level >= 1:
+        return skel, list(lvl2_ids)
+
+    @staticmethod
+    def _volumetric_properties(lean):
+        # The radius (r_eff) is computed from the volumes alone
+        return ["size_nm3"] if lean else pcg_skel.features.VOL_PROPERTIES
+
+    @staticmethod
+    def _fetch_volumetric_properties(cave_client, graph_future, lean=False):
+        """The L2 cache attributes add_volumetric_properties() needs, for the level 2 ids of a level 2 graph, or None if it
+        has no edges (a single level 2 id, found by pcg_meshwork() itself)."""
+        l2ids = np.unique(graph_future.result())
+        if len(l2ids) == 0:
+            return None
+        return _level2_attribute_cache.get_l2data(
+            cave_client, l2ids.tolist(), attributes=SkeletonService._volumetric_properties(lean)
+        )
+
+    @staticmethod
+    def _add_volumetric_properties(nrn, cave_client, l2data, lean=False):
+        """pcg_skel.features.add_volumetric_properties() from L2 cache attributes fetched beforehand."""
+        l2_df = nrn.anno.lvl2_ids.df
+        missing = [l2id for l2id in l2_df["lvl2_id"] if str(l2id) not in (l2data or {})]
+        if missing:
+            l2data = {**(l2data or {}), **_level2_attribute_cache.get_l2data(
+                cave_client, missing, attributes=SkeletonService._volumetric_properties(lean)
+            )}
+        l2data_df = pd.DataFrame.from_dict(l2data, orient="index")
+        l2data_df.index = [int(l2id) for l2id in l2data_df.index]
+        nrn.anno.add_annotations(
+            "vol_prop",
+            data=l2_df.merge(l2data_df, left_on="lvl2_id", right_index=True).drop(columns=["lvl2_id"]),
+            index_column="mesh_ind",
+        )
+
+    @staticmethod
+    def _fetch_level2_synapses(rid, cave_client, synapse_table, soma_future, l2dict_future):
+        """Query rid's pre- and postsynaptic sites and their level 2 ids while its skeleton is built.
+        pcg_anno maps the level 2 ids to mesh vertices by subscripting the mapping it is given, and nothing else, so it is
+        given one that waits for the skeleton's; the queries do not wait for it.
+        """
+        class _AwaitedMapping:
+            def __getitem__(self, l2id):
+                return l2dict_future.result()[l2id]
+
+        root_ts = soma_future.result()[0]
+        return _cave_call_governor.call(
+            ["materialize", "chunkedgraph"],
+            pcg_skel.pcg_anno.get_level2_synapses,
+            rid,
+            _AwaitedMapping(),
+            cave_client,
+            synapse_table,
+            remove_self=True,
+            pre=True,
+            post=True,
+            timestamp=root_ts,
+            synapse_point_resolution=[1, 1, 1],
+        )
+
+    @staticmethod
+    def _fetch_lean_synapse_sites(rid, cave_client, synapse_table, soma_future, l2dict_future):
+        """_fetch_level2_synapses() for LEAN_GENERATION: the mesh vertices of rid's pre- and postsynaptic sites, which are all
+        the axon/dendrite split uses, queried without the synapses' positions and other columns.
+        """
+        root_ts = soma_future.result()[0]
+        sites = []
+        for side in ["pre", "post"]:
+            syn_df = _cave_call_governor.call(
+                ["materialize"],
+                cave_client.materialize.live_live_query,
+                synapse_table,
+                timestamp=root_ts,
+                filter_equal_dict={synapse_table: {f"{side}_pt_root_id": rid}},
+                select_columns={synapse_table: ["id", "pre_pt_root_id", "post_pt_root_id", f"{side}_pt_supervoxel_id"]},
+                metadata=False,
+                log_warning=False,
+            )
+            syn_df = syn_df[syn_df["pre_pt_root_id"] != syn_df["post_pt_root_id"]]
+            l2ids = _cave_call_governor.call(
+                ["chunkedgraph"], cave_client.chunkedgraph.get_roots, syn_df[f"{side}_pt_supervoxel_id"].values, stop_layer=2, timestamp=root_ts
+            ) if len(syn_df) > 0 else []
+            l2dict = l2dict_future.result()
+            sites.append(pd.DataFrame({f"{side}_pt_mesh_ind": [l2dict[l2id] for l2id in l2ids]}, dtype=int))
+        return sites
+
+    @staticmethod
+    def _add_synapses(nrn, pre_syn_df, post_syn_df):
+        """The annotations pcg_skel.features.add_synapses() adds, from synapses fetched beforehand."""
+        for anno_name, syn_df, partner_column, mesh_ind_column in [
+            ("pre_syn", pre_syn_df, "post_pt_root_id", "pre_pt_mesh_ind"),
+            ("post_syn", post_syn_df, "pre_pt_root_id", "post_pt_mesh_ind"),
+        ]:
+            if partner_column not in syn_df.columns:  # Sites only (see _fetch_lean_synapse_sites())
+                nrn.anno.add_annotations(anno_name, syn_df, index_column=mesh_ind_column)
+                continue
+            nrn.anno.add_annotations(
+                anno_name,
+                syn_df.drop(columns=[partner_column]),
+                index_column=mesh_ind_column,
+                point_column="ctr_pt_position",
+                voxel_resolution=syn_df.attrs.get("dataframe_resolution"),
+            )
+
+    @staticmethod
+    def _build_v4_skeleton(
+        rid,
+        bucket,
+        datastack_name,
+        root_resolution,
+        collapse_soma,
+        collapse_radius,
+        cave_client,
+        soma_future,
+        graph_future,
+        l2data_future,
+        synapses_future,
+        l2dict_future,
+        lean=False,
+    ):
+        process_synapses = synapses_future is not None
+        root_ts, soma_location, soma_resolution = soma_future.result()
+        if _verbose_level.get() >= 1:
             SkeletonService.print(f"soma_resolution: {soma_resolution}")
 
         # Get the location of the soma from nucleus detection:
-        if verbose_level >= 1:
+        if _verbose_level.get() >= 1:
             SkeletonService.print(
                 f"_generate_v4_skeleton {rid} {datastack_name} {soma_resolution} {collapse_soma} {collapse_radius}"
             )
@@ -852,29 +2743,31 @@ class SkeletonService:
         use_default_compartments = False
 
         # Use the above parameters in the meshwork generation and skeletonization:
-        process_synapses = False
         try:
-            synapse_table = cave_client.info.get_datastack_info().get('synapse_table')
-            process_synapses = synapse_table is not None
-            if verbose_level >= 1:
-                SkeletonService.print(f"Synapse table's presence and name: {process_synapses} ({synapse_table})")
+            if _verbose_level.get() >= 1:
+                SkeletonService.print(f"Synapses being processed: {process_synapses}")
             
-            nrn = pcg_skel.pcg_meshwork(
-            # nrn = pcg_skel__meshwork__debugging.pcg_meshwork(
+            # The level 2 graph is already fetched; the L2 cache calls made here are for the graph's vertex positions, and
+            # are read through _level2_attribute_cache, which governs them.
+            # The synapses are fetched by _fetch_level2_synapses(), since pcg_meshwork() would only query them after this.
+            nrn = pcg_skel.pcg_meshwork(  # pcg_skel__meshwork__debugging.pcg_meshwork(
                 rid,
                 datastack_name,
-                cave_client,
+                _Level2CachedClient(cave_client),
                 root_point=soma_location,
                 root_point_resolution=soma_resolution,
                 collapse_soma=collapse_soma,
                 collapse_radius=collapse_radius,
                 timestamp=root_ts,
                 require_complete=True,
-                synapses='all',
-                synapse_table=synapse_table,
+                level2_graph=graph_future.result(),
             )
+            lvl2_ids_df = nrn.anno.lvl2_ids.df
+            l2dict_future.set_result(dict(zip(lvl2_ids_df["lvl2_id"], lvl2_ids_df["mesh_ind"])))
 
             if process_synapses:
+                SkeletonService._add_synapses(nrn, *synapses_future.result())
+
                 # Add synapse annotations.
                 # At the time of this writing, this fails. Casey is looking into it.
                 pcg_skel.features.add_is_axon_annotation(
@@ -888,22 +2781,15 @@ class SkeletonService:
                 )
 
             # Add volumetric properties
-            pcg_skel.features.add_volumetric_properties(
-                nrn,
-                cave_client,
-                # attributes: list[str] = VOL_PROPERTIES,
-                # l2id_anno_name: str = "lvl2_ids",
-                # l2id_col_name: str = "lvl2_id",
-                # property_name: str = "vol_prop",
-            )
+            SkeletonService._add_volumetric_properties(nrn, cave_client, l2data_future.result(), lean)
 
             # Add segment properties
             pcg_skel.features.add_segment_properties(
                 nrn,
                 # segment_property_name: str = "segment_properties",
                 # effective_radius: bool = True,
-                # area_factor: bool = True,
-                # strahler: bool = True,
+                area_factor=not lean,
+                strahler=not lean,
                 # strahler_by_compartment: bool = False,
                 # volume_property_name: str = "vol_prop",
                 # volume_col_name: str = "size_nm3",
@@ -915,7 +2801,7 @@ class SkeletonService:
             # del nrn.anno['pre_syn']
             # del nrn.anno['post_syn']
             skel = nrn.skeleton
-            if verbose_level >= 2:
+            if _verbose_level.get() >= 2:
                 # Confirm that the MeshParty bug fixed in MeshParty v1.18.3 and v2.0.3 is no longer in effect.
                 # TODO: Build a unit/integration test around this and clean up this logging output. For the time being, I have pushed it to verbose level 2.
                 SkeletonService.print(f"_generate_v4_skeleton() A rid, #skel.vertices: {rid}, {len(skel.vertices)}")
@@ -926,7 +2812,7 @@ class SkeletonService:
                 SkeletonService.print(f"_generate_v4_skeleton() A rid, #skel.vertex_properties compartments: {rid}, {len(skel.vertex_properties['compartment']) if skel.vertex_properties and 'compartment' in skel.vertex_properties else 'N/A'}")
                 SkeletonService.print(f"_generate_v4_skeleton() A rid, skel.vertex_properties: {rid}, {skel.vertex_properties}")
         except np.exceptions.AxisError as e:
-            if verbose_level >= 1:
+            if _verbose_level.get() >= 1:
                 SkeletonService.print("AxisError in _generate_v4_skeleton(). Resorting to v1 skeleton")
             
             use_default_radii = True
@@ -962,11 +2848,10 @@ class SkeletonService:
         skel._rooted.radius = radius_sk
         skel.vertex_properties['radius'] = skel.radius
             
-        if verbose_level >= 1:
+        if _verbose_level.get() >= 1:
             SkeletonService.print(f"_generate_v4_skeleton() rid, process_synapses: {rid}, {process_synapses}")
         if process_synapses:
             # Assign the axon/dendrite information to the skeleton
-            DEFAULT_COMPARTMENT_CODE, AXON_COMPARTMENT_CODE, SOMA_COMPARTMENT_CODE = 3, 2, 1
             if not use_default_compartments:
                 # The compartment codes are found in skeleton_plot.plot_tools.py:
                 # Default, Soma, Axon, Basal
@@ -996,9 +2881,11 @@ class SkeletonService:
         lvl2_df = nrn.anno.lvl2_ids.df
         lvl2_df.sort_values(by='mesh_ind', inplace=True)
         lvl2_ids = list(lvl2_df['lvl2_id'])
-        if verbose_level >= 1:
+        if _verbose_level.get() >= 1:
             SkeletonService.print("_generate_v4_skeleton() rid, len(lvl2_ids):", rid, len(lvl2_ids))
 
+        if lean:
+            nrn = None  # Let its annotation tables go now rather than once the request completes
         return nrn, VersionedSkeleton(skel, 4, lvl2_ids)
 
     @staticmethod
@@ -1011,8 +2898,9 @@ class SkeletonService:
         collapse_soma,
         collapse_radius,
         cave_client,
+        lean=False,
     ):
-        if verbose_level >= 1:
+        if _verbose_level.get() >= 1:
             SkeletonService.print("_generate_v2_skeleton() (which will pass through to v4)", rid)
         nrn, versioned_skeleton = SkeletonService._generate_v4_skeleton(
             rid,
@@ -1023,6 +2911,7 @@ class SkeletonService:
             collapse_soma,
             collapse_radius,
             cave_client,
+            lean,
         )
 
         return nrn, versioned_skeleton
@@ -1037,8 +2926,9 @@ class SkeletonService:
         collapse_soma,
         collapse_radius,
         cave_client,
+        lean=False,
     ):
-        if verbose_level >= 1:
+        if _verbose_level.get() >= 1:
             SkeletonService.print("_generate_v3_skeleton() (which will pass through to v4)", rid)
         nrn, versioned_skeleton = SkeletonService._generate_v4_skeleton(
             rid,
@@ -1049,6 +2939,7 @@ class SkeletonService:
             collapse_soma,
             collapse_radius,
             cave_client,
+            lean,
         )
 
         return nrn, versioned_skeleton
@@ -1289,7 +3180,7 @@ class SkeletonService:
         #     sk_flatdict["voxel_scaling"] = versioned_skeleton.skeleton.voxel_scaling
         # vertex_properties should provide radius and compartment
         if versioned_skeleton.skeleton.vertex_properties is not None:
-            if verbose_level >= 1:
+            if _verbose_level.get() >= 1:
                 SkeletonService.print(f"_skeleton_to_flatdict() versioned_skeleton.skeleton.vertex_properties.keys(): {versioned_skeleton.skeleton.vertex_properties.keys()}")
                 SkeletonService.print(f"_skeleton_to_flatdict() versioned_skeleton.skeleton.vertex_properties: {versioned_skeleton.skeleton.vertex_properties}")
             for key in versioned_skeleton.skeleton.vertex_properties.keys():
@@ -1376,7 +3267,7 @@ class SkeletonService:
         """
         try:
             accept_encoding = request.headers.get("Accept-Encoding", "")
-            if verbose_level >= 1:
+            if _verbose_level.get() >= 1:
                 SkeletonService.print(f"_after_request() accept_encoding: {accept_encoding}")
             
             if "gzip" not in accept_encoding.lower():
@@ -1393,7 +3284,7 @@ class SkeletonService:
 
             pre_compressed_size = len(response.data)
             response.data = compression.gzip_compress(response.data)
-            if verbose_level >= 1:
+            if _verbose_level.get() >= 1:
                 SkeletonService.print(f"_after_request() Compressed data size from {pre_compressed_size} to {len(response.data)}")
 
             response.headers["Content-Encoding"] = "gzip"
@@ -1412,12 +3303,11 @@ class SkeletonService:
         session_timestamp_: str = "not_provided",
         verbose_level_: int = 0
     ):
-        global session_timestamp, verbose_level
 
-        session_timestamp = session_timestamp_
+        _session_timestamp.set(session_timestamp_)
 
-        if verbose_level_ > verbose_level:
-            verbose_level = verbose_level_
+        if verbose_level_ > _verbose_level.get():
+            _verbose_level.set(verbose_level_)
 
         skeletonization_refusal_root_ids_df_without_timestamps = SkeletonService._read_refusal_list_without_timestamps(bucket)
         
@@ -1435,6 +3325,14 @@ class SkeletonService:
 
         return response
     
+    @staticmethod
+    def get_payload_cache_stats():
+        """
+        Counters of this process's in-memory payload cache. Each uwsgi process has its own cache,
+        so the stats (including the pid) describe only the process that served the request.
+        """
+        return _payload_cache.stats()
+
     @staticmethod
     def get_cache_contents(
         bucket: str,
@@ -1443,36 +3341,62 @@ class SkeletonService:
         rid_prefixes: List,
         limit: int = None,
         session_timestamp_: str = "not_provided",
-        verbose_level_: int = 0
+        verbose_level_: int = 0,
+        cursor: int = None,
     ):
         """
         Get the contents of the cache for a specific bucket and skeleton version.
+        When the datastack has a skeleton index (see compact_skeleton_index()) the files are found in it, in ascending
+        rid order, without listing the bucket. If more files than limit were found, "next_cursor" is included in the
+        result; passing it back as cursor returns the next page.
         """
-        global session_timestamp, verbose_level
 
-        session_timestamp = session_timestamp_
+        _session_timestamp.set(session_timestamp_)
 
-        if verbose_level_ > verbose_level:
-            verbose_level = verbose_level_
-        if debugging_root_id in rid_prefixes and verbose_level < 1:
-            verbose_level = 1
+        if verbose_level_ > _verbose_level.get():
+            _verbose_level.set(verbose_level_)
+        if debugging_root_id in rid_prefixes and _verbose_level.get() < 1:
+            _verbose_level.set(1)
         
         if bucket[-1] != "/":
             bucket += "/"
 
-        if verbose_level >= 1:
+        if _verbose_level.get() >= 1:
             SkeletonService.print(f"get_cache_contents() bucket: {bucket}, datastack_name: {datastack_name}, skeleton_version: {skeleton_version}, rid_prefixes: {rid_prefixes}, limit: {limit}")
 
+        index_result = None
+        if all(str(rid_prefix).isdigit() for rid_prefix in rid_prefixes):
+            try:
+                # One more than limit, to know whether there is a next page
+                index_result = _skeleton_index_cache.query(bucket, datastack_name, skeleton_version, rid_prefixes, limit + 1 if limit else None, cursor)
+            except Exception as e:
+                SkeletonService.print(f"Failed to read the skeleton index of {datastack_name}, listing the bucket instead: {str(e)}")
+        if index_result is not None:
+            num_found, rids = index_result
+            has_next_page = bool(limit) and len(rids) > limit
+            if has_next_page:
+                rids = rids[:limit]
+            cache_contents = {
+                "num_found": num_found,
+                "files": [
+                    SkeletonService._get_skeleton_filename(rid, bucket, skeleton_version, datastack_name, [1, 1, 1], True, 7500, "h5")
+                    for rid in rids
+                ],
+            }
+            if has_next_page:
+                cache_contents["next_cursor"] = rids[-1]
+            return cache_contents
+
         cf = CloudFiles(SkeletonService._get_bucket_subdirectory(bucket, datastack_name, skeleton_version))
         all_h5_files = []
         for rid_prefix in rid_prefixes:
             prefix = f"skeleton__v{skeleton_version}__rid-{rid_prefix}"
-            if verbose_level >= 1:
+            if _verbose_level.get() >= 1:
                 SkeletonService.print(f"get_cache_contents() prefix: {prefix}")
             one_prefix_files = list(cf.list(prefix=prefix))
             one_prefix_h5_files = [f for f in one_prefix_files if f.endswith(".h5.gz")]
             
-            if verbose_level >= 1:
+            if _verbose_level.get() >= 1:
                 SkeletonService.print(f"get_cache_contents() num_found: {len(one_prefix_h5_files)}")
                 if len(one_prefix_h5_files) > 0:
                     SkeletonService.print(f"get_cache_contents() first result: {one_prefix_h5_files[0]}")
@@ -1499,14 +3423,13 @@ class SkeletonService:
         Confirm or deny that a set of root ids have meshworks in the cache.
         """
 
-        global verbose_level
-        if verbose_level_ > verbose_level:
-            verbose_level = verbose_level_
+        if verbose_level_ > _verbose_level.get():
+            _verbose_level.set(verbose_level_)
 
         if bucket[-1] != "/":
             bucket += "/"
 
-        if verbose_level >= 1:
+        if _verbose_level.get() >= 1:
             SkeletonService.print(f"meshworks_exist() bucket: {bucket}, rids: {rids}")
         
         return_single_value = False
@@ -1514,8 +3437,8 @@ class SkeletonService:
             return_single_value = True
             rids = [rids]
         
-        if debugging_root_id in rids and verbose_level < 1:
-            verbose_level = 1
+        if debugging_root_id in rids and _verbose_level.get() < 1:
+            _verbose_level.set(1)
 
         cf = CloudFiles(f"{bucket}meshworks/{MESHWORK_VERSION}/")
         if True:  # include_compression:
@@ -1544,22 +3467,24 @@ class SkeletonService:
         skeleton_version_UNUSED: int,  # Deprecated, not used anymore
         rids: Union[List, int],
         session_timestamp_: str = "not_provided",
-        verbose_level_: int = 0
+        verbose_level_: int = 0,
+        use_index: bool = True,
     ):
         """
         Confirm or deny that a set of root ids have H5 skeletons in the cache.
+        The answer comes from the in-memory existence index (see _SkeletonIndexCache) when the datastack has one,
+        which can lag the bucket by up to SKELETON_INDEX_REVALIDATE_SECS. Pass use_index=False to HEAD the bucket instead.
         """
-        global session_timestamp, verbose_level
 
-        session_timestamp = session_timestamp_
+        _session_timestamp.set(session_timestamp_)
 
-        if verbose_level_ > verbose_level:
-            verbose_level = verbose_level_
+        if verbose_level_ > _verbose_level.get():
+            _verbose_level.set(verbose_level_)
 
         if bucket[-1] != "/":
             bucket += "/"
 
-        if verbose_level >= 1:
+        if _verbose_level.get() >= 1:
             SkeletonService.print(f"skeletons_exist() bucket: {bucket}, datastack_name: {datastack_name}, rids: {rids}")
         
         return_single_value = False
@@ -1567,12 +3492,23 @@ class SkeletonService:
             return_single_value = True
             rids = [rids]
         
-        if debugging_root_id in rids and verbose_level < 1:
-            verbose_level = 1
+        if debugging_root_id in rids and _verbose_level.get() < 1:
+            _verbose_level.set(1)
 
         # All skeletons are cached as V4 (or the whatever the latest version is, if subsequent development renders this comment outdated).
         # Requests for other versions are converted from V4 at the time of the request.
 
+        exist_results_clean = None
+        if use_index:
+            try:
+                exist_results_clean = _skeleton_index_cache.exist(bucket, datastack_name, HIGHEST_SKELETON_VERSION, rids)
+            except Exception as e:
+                SkeletonService.print(f"Failed to read the skeleton index of {datastack_name}, checking the bucket instead: {str(e)}")
+        if exist_results_clean is not None:
+            if _verbose_level.get() >= 1:
+                SkeletonService.print(f"skeletons_exist() {sum(exist_results_clean.values())} of {len(rids)} found in the skeleton index")
+            return exist_results_clean[int(rids[0])] if return_single_value else exist_results_clean
+
         cf = CloudFiles(SkeletonService._get_bucket_subdirectory(bucket, datastack_name, HIGHEST_SKELETON_VERSION))
         
         filenames = [
@@ -1625,14 +3561,14 @@ class SkeletonService:
             "skeleton_params_collapse_radius": f"{collapse_radius}",
             "skeleton_version": f"{skeleton_version}",
             "high_priority": f"{high_priority}",
-            "session_timestamp": session_timestamp,  # f"{SkeletonService.get_session_timestamp()}",
+            "session_timestamp": _session_timestamp.get(),  # f"{SkeletonService.get_session_timestamp()}",
             "verbose_level": f"{verbose_level_}",
         }
 
         exchange = os.getenv(
             "SKELETON_CACHE_HIGH_PRIORITY_EXCHANGE" if high_priority else "SKELETON_CACHE_LOW_PRIORITY_EXCHANGE",
             None)
-        if verbose_level >= 1:
+        if _verbose_level.get() >= 1:
             SkeletonService.print(f"publish_skeleton_request() Sending payload for rid {rid} to exchange {exchange}")
         try:
             messaging_client.publish(exchange, payload, attributes)
@@ -1643,6 +3579,225 @@ class SkeletonService:
         if verbose_level_ >= 1:
             SkeletonService.print(f"Message has been dispatched to {exchange}: {datastack_name} {rid} output_format: {output_format} skvn:{skeleton_version} {bucket}")
 
+    @staticmethod
+    def _validate_root_id_for_generation(bucket, datastack_name, rid, phases):
+        """
+        Run the checks that must pass before a root id is skeletonized: the refusal list, the PCG layer and chunkedgraph validity.
+        Return (cave_client, None) if the rid may be generated, else (None, outcome) where outcome names the rejection for _PhaseTimer.
+        """
+        # Confirm that the rid isn't in the refusal list
+        if SkeletonService._check_root_id_against_refusal_list(bucket, datastack_name, rid):
+            if _verbose_level.get() >= 1:
+                SkeletonService.print(f"get_skeleton_by_datastack_and_rid() rid {rid} is in the refusal list and therefore won't be skeletonized.")
+            return None, "refused"
+        phases.mark("refusal_list")
+
+        # Confirm the rid validity in a few ways
+        cave_client = _cave_client_pool.get_client(datastack_name)
+        phases.mark("caveclient_init")
+
+        # Confirm that the rid is actually a root id and not some other sort of arbitrary number, e.g., a supervoxel id arriving via request from Neuroglancer
+        cv = _cave_client_pool.get_cloudvolume(datastack_name)
+        phases.mark("segmentation_cloudvolume")
+        if cv.meta.decode_layer_id(rid) != cv.meta.n_layers:
+            if _verbose_level.get() >= 1:
+                SkeletonService.print(f"get_skeleton_by_datastack_and_rid() Invalid root id: {rid} (perhaps this is an id corresponding to a different level of the PCG, e.g., a supervoxel id)")
+            return None, "not_a_root_id"
+
+        # Confirm that the rid exists
+        if not cave_client.chunkedgraph.is_valid_nodes(rid):
+            if _verbose_level.get() >= 1:
+                SkeletonService.print(f"get_skeleton_by_datastack_and_rid() Invalid root id: {rid} (perhaps it doesn't exist; the error is unclear)")
+            return None, "invalid_root_id"
+        phases.mark("is_valid_nodes")
+
+        return cave_client, None
+
+    @staticmethod
+    def _is_heavy_root(rid, cave_client):
+        """
+        Whether rid has at least HEAVY_ROOT_MIN_L3_IDS level 3 ids, i.e., is to be generated by a heavy worker.
+        False whenever the routing is disabled, or the level 3 ids cannot be counted, so that the root is handled as before.
+        """
+        if heavy_root_min_l3_ids <= 0 or not os.getenv("SKELETON_CACHE_HEAVY_EXCHANGE", None):
+            return False
+        try:
+            n_l3_ids = len(_cave_call_governor.call(["chunkedgraph"], cave_client.chunkedgraph.get_leaves, rid, stop_layer=3))
+        except Exception as e:
+            SkeletonService.print(f"_is_heavy_root() Could not count the level 3 ids of {rid}: {repr(e)}")
+            return False
+        if _verbose_level.get() >= 1:
+            SkeletonService.print(f"_is_heavy_root() rid {rid} has {n_l3_ids} level 3 ids")
+        return n_l3_ids >= heavy_root_min_l3_ids
+
+    @staticmethod
+    def _generate_and_cache_skeleton(params, params_cached, cave_client, cache_meshwork, phases):
+        """
+        Generate a skeleton and cache it as H5, and as a meshwork if cache_meshwork is set.
+        Return (nrn, versioned_skeleton, sk_file_content_val, nrn_file_content_val), the latter two being the cached bytes.
+        Caching failures are reported but not raised, so that the generated skeleton can still be returned.
+        """
+        rid, bucket, skeleton_version, datastack_name = params[0], params[1], params[2], params[3]
+        nrn = None
+        versioned_skeleton = None
+
+        # First attempt a debugging retrieval to bypass computing a skeleton from scratch.
+        # On a nonlocal deployment this will simply fail and the skeleton will be generated as normal.
+        try:
+            versioned_skeleton = SkeletonService._retrieve_skeleton_from_local(
+                params_cached, "h5"
+            )
+        except Exception as e:
+            SkeletonService.print(f"Exception while retrieving local debugging skeleton for {rid}: {str(e)}. Traceback:")
+            traceback.print_exc()
+        
+        try:
+            if not versioned_skeleton:
+                if _verbose_level.get() >= 1:
+                    SkeletonService.print("No local (debugging) skeleton found. Proceeding to generate a new skeleton.")
+                skeletonization_start_time = default_timer()
+                lean = lean_generation and not cache_meshwork
+                if skeleton_version == 1:
+                    versioned_skeleton = SkeletonService._generate_v1_skeleton(*params, cave_client)
+                elif skeleton_version == 2:
+                    nrn, versioned_skeleton = SkeletonService._generate_v2_skeleton(*params, cave_client, lean=lean)
+                elif skeleton_version == 3:
+                    nrn, versioned_skeleton = SkeletonService._generate_v3_skeleton(*params, cave_client, lean=lean)
+                elif skeleton_version == 4:
+                    nrn, versioned_skeleton = SkeletonService._generate_v4_skeleton(*params, cave_client, lean=lean)
+                skeletonization_end_time = default_timer()
+                skeletonization_elapsed_time = skeletonization_end_time - skeletonization_start_time
+                phases.mark("generation")
+                if _verbose_level.get() >= 1:
+                    SkeletonService.print(f"Skeleton successfully generated in {skeletonization_elapsed_time} seconds: {versioned_skeleton}")
+                try:
+                    SkeletonService._archive_skeletonization_time(bucket, datastack_name, rid, skeleton_version,
+                        versioned_skeleton.skeleton.n_vertices, versioned_skeleton.skeleton.n_end_points, versioned_skeleton.skeleton.n_branch_points,
+                        skeletonization_elapsed_time)
+                except Exception as e:
+                    # This is a non-critical operation, so don't let it stop the process.
+                    SkeletonService.print(f"Exception while archiving skeletonization time: {str(e)}. Traceback:")
+                    traceback.print_exc()
+            else:
+                if _verbose_level.get() >= 1:
+                    SkeletonService.print("Local (debugging) skeleton was found.")
+        except Exception as e:
+            SkeletonService.print(f"Exception while generating skeleton for {rid}: {str(e)}. Traceback:")
+            traceback.print_exc()
+            raise e
+
+        sk_file_content_val = None
+        nrn_file_content_val = None
+        try:
+            if cache_meshwork:
+                nrn_file_content = BytesIO()
+                nrn.save_meshwork(nrn_file_content, overwrite=False)
+                nrn_file_content_val = nrn_file_content.getvalue()
+                SkeletonService._cache_meshwork(params, nrn_file_content_val)
+
+            sk_file_content = BytesIO()
+            SkeletonIO.write_skeleton_h5(versioned_skeleton.skeleton, versioned_skeleton.lvl2_ids, sk_file_content)
+            sk_file_content_val = sk_file_content.getvalue()
+            SkeletonService._cache_skeleton(params_cached, versioned_skeleton.version, sk_file_content_val, "h5")
+        except Exception as e:
+            SkeletonService.print(f"Exception while caching H5 skeleton for {rid}: {str(e)}. Traceback:")
+            traceback.print_exc()
+
+        return nrn, versioned_skeleton, sk_file_content_val, nrn_file_content_val
+
+    @staticmethod
+    def _get_generation_lease_path(params_cached):
+        datastack_name = params_cached[3]
+        datastack_name_remapped = DATASTACK_NAME_REMAPPING[datastack_name] if datastack_name in DATASTACK_NAME_REMAPPING else datastack_name
+        return f"{GENERATION_LEASE_PREFIX}{datastack_name_remapped}/{SkeletonService._get_skeleton_filename(*params_cached, 'h5', include_compression=False)}"
+
+    @staticmethod
+    def _generate_skeleton_leased(params, params_cached, cave_client, cache_meshwork, phases, duplicate_action="wait"):
+        """
+        _generate_and_cache_skeleton(), unless another worker holds the generation lease on this skeleton, in which case
+        poll the cache for the H5 it will write. Polling ends when the H5 appears, when the lease can be taken over
+        (its holder released it without caching, or died), or after GENERATION_LEASE_WAIT_SECS, when we generate it here.
+        With duplicate_action "requeue" or "ack" (see generation_lease_duplicate_action), GenerationLeaseHeld is raised
+        instead of polling.
+        A skeleton read back from the cache is returned with None in place of the cached bytes.
+        Meshwork generations are not leased, since a waiter would need the meshwork too, which is not polled for.
+        The outcome is emitted to the phase timings.
+        """
+        if generation_lease_ttl_secs <= 0 or cache_meshwork:
+            result = SkeletonService._generate_and_cache_skeleton(params, params_cached, cave_client, cache_meshwork, phases)
+            phases.emit("generated")
+            return result
+
+        rid, bucket = params[0], params[1]
+        lease = _GenerationLease(bucket, SkeletonService._get_generation_lease_path(params_cached), generation_lease_ttl_secs)
+        wait_deadline = default_timer() + generation_lease_wait_secs
+        while True:
+            try:
+                acquired = lease.try_acquire()
+            except Exception as e:
+                # Leasing only avoids duplicate work, so a failure to lease must not prevent generation
+                SkeletonService.print(f"Exception while acquiring the generation lease for {rid}, generating without it: {str(e)}")
+                result = SkeletonService._generate_and_cache_skeleton(params, params_cached, cave_client, cache_meshwork, phases)
+                phases.emit("generated_unleased")
+                return result
+
+            if acquired:
+                lease.start_heartbeat()
+                try:
+                    # The previous holder may have cached the skeleton between our cache check and our acquiring the lease
+                    versioned_skeleton = SkeletonService._retrieve_skeleton_from_cache(params_cached, "h5_mpsk")
+                    if versioned_skeleton:
+                        phases.emit("cache_hit_leased")
+                        return None, versioned_skeleton, None, None
+                    result = SkeletonService._generate_and_cache_skeleton(params, params_cached, cave_client, cache_meshwork, phases)
+                    phases.emit("generated_duplicate" if lease.lost else "generated")
+                    return result
+                finally:
+                    try:
+                        lease.release()
+                    except Exception as e:
+                        SkeletonService.print(f"Exception while releasing the generation lease for {rid}: {str(e)}")
+
+            if duplicate_action in ["requeue", "ack"]:
+                phases.emit(f"duplicate_{duplicate_action}d")
+                raise GenerationLeaseHeld(f"Skeleton {rid} is being generated by another worker")
+
+            if _verbose_level.get() >= 1:
+                SkeletonService.print(f"Skeleton {rid} is being generated by another worker. Waiting for it...")
+            time.sleep(GENERATION_LEASE_POLL_SECS)
+            versioned_skeleton = SkeletonService._retrieve_skeleton_from_cache(params_cached, "h5_mpsk")
+            if versioned_skeleton:
+                phases.mark("generation_lease_wait")
+                phases.emit("generation_lease_wait")
+                return None, versioned_skeleton, None, None
+            if default_timer() >= wait_deadline:
+                SkeletonService.print(f"Gave up waiting {generation_lease_wait_secs}s for another worker to generate {rid}. Generating it here.")
+                result = SkeletonService._generate_and_cache_skeleton(params, params_cached, cave_client, cache_meshwork, phases)
+                phases.emit("generated_duplicate")
+                return result
+
+    @staticmethod
+    def _generate_skeleton_coalesced(params, params_cached, cave_client, cache_meshwork, phases, duplicate_action="wait"):
+        """
+        Generate and cache a skeleton such that, of all the concurrent requests for it, exactly one generates it:
+        the requests within this process are coalesced by _single_flight, and those across workers by a generation
+        lease (see _generate_skeleton_leased()). Returns what _generate_and_cache_skeleton() returns.
+        """
+        rid, bucket, skeleton_version, datastack_name, root_resolution, collapse_soma, collapse_radius = params
+        key = (rid, bucket, skeleton_version, datastack_name, tuple(root_resolution), collapse_soma, collapse_radius, cache_meshwork, duplicate_action)
+        result, led = _single_flight.do(
+            key, lambda: SkeletonService._generate_skeleton_leased(params, params_cached, cave_client, cache_meshwork, phases, duplicate_action)
+        )
+        if led:
+            return result
+        phases.mark("coalesced_wait")
+        phases.emit("coalesced")
+        if _verbose_level.get() >= 1:
+            SkeletonService.print(f"Skeleton {rid} was generated by a concurrent request in this process.")
+        nrn, versioned_skeleton, sk_file_content_val, nrn_file_content_val = result
+        # Each request finalizes its skeleton in place (see _finalize_return_skeleton_version()), so they must not share it
+        return nrn, copy.deepcopy(versioned_skeleton), sk_file_content_val, nrn_file_content_val
+
     @staticmethod
     def get_skeleton_by_datastack_and_rid(
         datastack_name: str,
@@ -1665,21 +3820,20 @@ class SkeletonService:
         If not, then generate the skeleton from its cached H5 format and return it.
         If the H5 format also doesn't exist yet, then generate and cache the H5 version before generating and returning the requested format.
         """
-        global session_timestamp, verbose_level
 
-        session_timestamp = session_timestamp_
+        _session_timestamp.set(session_timestamp_)
 
-        if verbose_level_ > verbose_level:
-            verbose_level = verbose_level_
-        if rid == debugging_root_id and verbose_level < 1:
-            verbose_level = 1
+        if verbose_level_ > _verbose_level.get():
+            _verbose_level.set(verbose_level_)
+        if rid == debugging_root_id and _verbose_level.get() < 1:
+            _verbose_level.set(1)
 
         cache_meshwork = CACHE_MESHWORK or output_format == "meshwork" or output_format == "meshwork_none"
 
         if bucket[-1] != "/":
             bucket += "/"
 
-        if verbose_level >= 1:
+        if _verbose_level.get() >= 1:
             SkeletonService.print(
                 f"get_skeleton_by_datastack_and_rid() datastack_name: {datastack_name}, rid: {rid}, bucket: {bucket}, skeleton_version: {skeleton_version},",
                 f" root_resolution: {root_resolution}, collapse_soma: {collapse_soma}, collapse_radius: {collapse_radius}, output_format: {output_format}",
@@ -1689,42 +3843,17 @@ class SkeletonService:
         if rid == DEBUG_DEAD_LETTER_TEST_RID:
             raise Exception("Test exception for PubSub dead-lettering")
         
-        # Every message pays this whole preamble before we know whether any work is needed --
-        # the cache check happens further below. Time each step so the cost is attributable.
-        # See _PhaseTimer; enable with LOG_PHASE_TIMINGS=true.
+        # Time each step of the preamble so the cost is attributable. See _PhaseTimer; enable with LOG_PHASE_TIMINGS=true.
         phases = _PhaseTimer(rid)
 
-        # Confirm that the rid isn't in the refusal list
-        if SkeletonService._check_root_id_against_refusal_list(bucket, datastack_name, rid):
-            if verbose_level >= 1:
-                SkeletonService.print(f"get_skeleton_by_datastack_and_rid() rid {rid} is in the refusal list and therefore won't be skeletonized.")
-            phases.emit("refused")
-            return
-        phases.mark("refusal_list")
-
-        # Confirm the rid validity in a few ways
-        cave_client = caveclient.CAVEclient(
-            datastack_name,
-            server_address=CAVE_CLIENT_SERVER,
-        )
-        phases.mark("caveclient_init")
-
-        # Confirm that the rid is actually a root id and not some other sort of arbitrary number, e.g., a supervoxel id arriving via request from Neuroglancer
-        cv = cave_client.info.segmentation_cloudvolume()
-        phases.mark("segmentation_cloudvolume")
-        if cv.meta.decode_layer_id(rid) != cv.meta.n_layers:
-            if verbose_level >= 1:
-                SkeletonService.print(f"get_skeleton_by_datastack_and_rid() Invalid root id: {rid} (perhaps this is an id corresponding to a different level of the PCG, e.g., a supervoxel id)")
-            phases.emit("not_a_root_id")
-            return
-
-        # Confirm that the rid exists
-        if not cave_client.chunkedgraph.is_valid_nodes(rid):
-            if verbose_level >= 1:
-                SkeletonService.print(f"get_skeleton_by_datastack_and_rid() Invalid root id: {rid} (perhaps it doesn't exist; the error is unclear)")
-            phases.emit("invalid_root_id")
-            return
-        phases.mark("is_valid_nodes")
+        # With the cache-first fast path the validation below is deferred until we know a skeleton must be generated.
+        # Without it, every message pays the whole preamble before we know whether any work is needed.
+        cave_client = None
+        if not cache_first_fast_path:
+            cave_client, rejection = SkeletonService._validate_root_id_for_generation(bucket, datastack_name, rid, phases)
+            if rejection:
+                phases.emit(rejection)
+                return
 
         if not output_format:
             output_format = "none"
@@ -1758,6 +3887,11 @@ class SkeletonService:
             collapse_radius,
         ]
 
+        # Formats whose final encoded payload is plain bytes are also kept in the in-memory _payload_cache
+        payload_cache_key = None
+        if output_format in PAYLOAD_CACHE_FORMATS:
+            payload_cache_key = SkeletonService._get_payload_cache_key(params, output_format)
+
         cached_skeleton = None
         cached_meshwork = None
         if output_format == "none":
@@ -1767,9 +3901,10 @@ class SkeletonService:
             phases.mark("cache_check")
             if skel_confirmation:
                 # Nothing else to do, so return
-                if verbose_level >= 1:
+                if _verbose_level.get() >= 1:
                     SkeletonService.print(f"Skeleton is already in cache: {rid}")
-                phases.emit("cache_hit")
+                # "cache_hit_fast" means no refusal list, CAVEclient or chunkedgraph work was done for this message
+                phases.emit("cache_hit" if cave_client is not None else "cache_hit_fast")
                 return
             # At this point, fall through with cached_skeleton set to None to trigger generating a new skeleton.
         elif output_format == "meshwork_none":
@@ -1778,26 +3913,31 @@ class SkeletonService:
             )
             if meshwork_confirmation:
                 # Nothing else to do, so return
-                if verbose_level >= 1:
+                if _verbose_level.get() >= 1:
                     SkeletonService.print(f"Meshwork is already in cache: {rid}")
                 return
             # At this point, fall through with cached_meshwork set to None to trigger generating a new skeleton.
         elif output_format in ["flatdict", "json", "jsoncompressed", "arrays", "arrayscompressed",
                                "precomputed", "h5", "swc", "swccompressed"]:
-            cached_skeleton = SkeletonService._retrieve_skeleton_from_cache(
-                params_cached, output_format
-            )
-            if verbose_level >= 1:
+            if payload_cache_key:
+                cached_skeleton = _payload_cache.get(payload_cache_key)
+            if cached_skeleton is None:
+                cached_skeleton = SkeletonService._retrieve_skeleton_from_cache(
+                    params_cached, output_format
+                )
+                if cached_skeleton is not None and payload_cache_key:
+                    _payload_cache.put(payload_cache_key, cached_skeleton)
+            if _verbose_level.get() >= 1:
                 SkeletonService.print(f"Cached skeleton query result: {cached_skeleton is not None}")
-            if verbose_level >= 2:
+            if _verbose_level.get() >= 2:
                 SkeletonService.print(f"Cache skeleton query result: {cached_skeleton}")
         elif output_format == "meshwork":
             cached_meshwork = SkeletonService._retrieve_meshwork_from_cache(
                 params, True
             )
-            if verbose_level >= 1:
+            if _verbose_level.get() >= 1:
                 SkeletonService.print(f"Cached meshwork query result: {cached_meshwork is not None}")
-            if verbose_level >= 2:
+            if _verbose_level.get() >= 2:
                 SkeletonService.print(f"Cached meshwork query result: {cached_meshwork}")
         else:
             raise ValueError(f"Unknown output format: {output_format}")
@@ -1837,13 +3977,13 @@ class SkeletonService:
                             cached_skeleton
                         )
                     )
-                if verbose_level >= 1:
+                if _verbose_level.get() >= 1:
                     SkeletonService.print(f"Length of cached skeleton: {len(cached_skeleton)} and corresponding json: {len(json.dumps(cached_skeleton))}")
                 
                 if via_requests and has_request_context():
                     t0 = default_timer()
                     response = jsonify(cached_skeleton)
-                    if verbose_level >= 1:
+                    if _verbose_level.get() >= 1:
                         t1 = default_timer()
                         et = t1 - t0
                         SkeletonService.print(f"Time to jsonify json dict: {et}s")
@@ -1920,63 +4060,45 @@ class SkeletonService:
         # There is no need to check for an H5 skeleton if the requested format is H5 or None, since both seek an H5 above.
         nrn = None
         versioned_skeleton = None
+        sk_file_content_val = None
+        nrn_file_content_val = None
         if not skeleton_bytes:
             if output_format in ["flatdict", "json", "jsoncompressed", "arrays", "arrayscompressed", "swc", "swccompressed", "precomputed"]:
                 versioned_skeleton = SkeletonService._retrieve_skeleton_from_cache(params_cached, "h5_mpsk")
-            if verbose_level >= 1:
+            if _verbose_level.get() >= 1:
                 SkeletonService.print(f"H5 cache query result: {versioned_skeleton}")
 
         # If no H5 skeleton was found, generate a new skeleton.
         # Note that the skeleton for any given set of parameters will only ever be generated once, regardless of the multiple formats offered.
         # H5 will be used to generate all the other formats as needed.
         generate_new_skeleton = not versioned_skeleton and not skeleton_bytes
+        if generate_new_skeleton and cave_client is None:
+            # Only now that generation is unavoidable is it worth paying for validation (see cache_first_fast_path).
+            cave_client, rejection = SkeletonService._validate_root_id_for_generation(bucket, datastack_name, rid, phases)
+            if rejection:
+                phases.emit(rejection)
+                return
+        if generate_new_skeleton and not via_requests and not heavy_worker and \
+                SkeletonService._is_heavy_root(rid, cave_client):
+            phases.emit("heavy_rerouted")
+            raise HeavyRoot(f"Root {rid} is to be generated by a heavy worker")
         if generate_new_skeleton:  # No H5 skeleton was found
-            # First attempt a debugging retrieval to bypass computing a skeleton from scratch.
-            # On a nonlocal deployment this will simply fail and the skeleton will be generated as normal.
+            # Generates and caches the H5 skeleton (and meshwork), or waits for a concurrent generation of the same skeleton
+            # A request that only caches the skeleton need not wait for another worker generating it (see generation_lease_duplicate_action)
+            duplicate_action = generation_lease_duplicate_action if output_format == "none" else "wait"
             try:
-                versioned_skeleton = SkeletonService._retrieve_skeleton_from_local(
-                    params_cached, "h5"
+                nrn, versioned_skeleton, sk_file_content_val, nrn_file_content_val = SkeletonService._generate_skeleton_coalesced(
+                    params, params_cached, cave_client, cache_meshwork, phases, duplicate_action
                 )
-            except Exception as e:
-                SkeletonService.print(f"Exception while retrieving local debugging skeleton for {rid}: {str(e)}. Traceback:")
-                traceback.print_exc()
-            
-            try:
-                if not versioned_skeleton:
-                    if verbose_level >= 1:
-                        SkeletonService.print("No local (debugging) skeleton found. Proceeding to generate a new skeleton.")
-                    skeletonization_start_time = default_timer()
-                    if skeleton_version == 1:
-                        versioned_skeleton = SkeletonService._generate_v1_skeleton(*params, cave_client)
-                    elif skeleton_version == 2:
-                        nrn, versioned_skeleton = SkeletonService._generate_v2_skeleton(*params, cave_client)
-                    elif skeleton_version == 3:
-                        nrn, versioned_skeleton = SkeletonService._generate_v3_skeleton(*params, cave_client)
-                    elif skeleton_version == 4:
-                        nrn, versioned_skeleton = SkeletonService._generate_v4_skeleton(*params, cave_client)
-                    skeletonization_end_time = default_timer()
-                    skeletonization_elapsed_time = skeletonization_end_time - skeletonization_start_time
-                    phases.mark("generation")
-                    if verbose_level >= 1:
-                        SkeletonService.print(f"Skeleton successfully generated in {skeletonization_elapsed_time} seconds: {versioned_skeleton}")
-                    try:
-                        SkeletonService._archive_skeletonization_time(bucket, datastack_name, rid, skeleton_version,
-                            versioned_skeleton.skeleton.n_vertices, versioned_skeleton.skeleton.n_end_points, versioned_skeleton.skeleton.n_branch_points,
-                            skeletonization_elapsed_time)
-                    except Exception as e:
-                        # This is a non-critical operation, so don't let it stop the process.
-                        SkeletonService.print(f"Exception while archiving skeletonization time: {str(e)}. Traceback:")
-                        traceback.print_exc()
-                else:
-                    if verbose_level >= 1:
-                        SkeletonService.print("Local (debugging) skeleton was found.")
-            except Exception as e:
-                SkeletonService.print(f"Exception while generating skeleton for {rid}: {str(e)}. Traceback:")
-                traceback.print_exc()
-                raise e
+            except GenerationLeaseHeld:
+                if duplicate_action == "ack":
+                    if _verbose_level.get() >= 1:
+                        SkeletonService.print(f"Skeleton {rid} is being generated by another worker. Dropping this request.")
+                    return None
+                raise
 
         # Cache the meshwork and the skeleton in the requested format and return the content in various formats.
-        # Also cache the H5 skeleton if it was generated.
+        # The H5 skeleton (and meshwork) were already cached when they were generated.
 
         # Wrap all attemps to cache the skeleton in a try/except block to catch any exceptions.
         # Attempt to return the successfully generated skeleton regardless of any caching failures.
@@ -2005,19 +4127,16 @@ class SkeletonService:
                 traceback.print_exc()
 
             try:
+                # The H5 skeleton and meshwork have already been cached by _generate_skeleton_coalesced()
                 if cache_meshwork:
-                    nrn_file_content = BytesIO()
-                    nrn.save_meshwork(nrn_file_content, overwrite=False)
-                    nrn_file_content_val = nrn_file_content.getvalue()
-                    SkeletonService._cache_meshwork(params, nrn_file_content_val)
-                    nrn_file_content.seek(0)  # The attached file won't have a proper header if this isn't done
-
-                sk_file_content = BytesIO()
-                SkeletonIO.write_skeleton_h5(versioned_skeleton.skeleton, versioned_skeleton.lvl2_ids, sk_file_content)
-                # file_content_sz = file_content.getbuffer().nbytes
-                sk_file_content_val = sk_file_content.getvalue()
-                SkeletonService._cache_skeleton(params_cached, versioned_skeleton.version, sk_file_content_val, "h5")
-                sk_file_content.seek(0)  # The attached file won't have a proper header if this isn't done
+                    nrn_file_content = BytesIO(nrn_file_content_val)
+
+                if sk_file_content_val is not None:
+                    sk_file_content = BytesIO(sk_file_content_val)
+                else:  # Read back from the cache after another worker generated it
+                    sk_file_content = BytesIO()
+                    SkeletonIO.write_skeleton_h5(versioned_skeleton.skeleton, versioned_skeleton.lvl2_ids, sk_file_content)
+                    sk_file_content.seek(0)  # The attached file won't have a proper header if this isn't done
 
                 # Don't perform this conversion until after the H5 skeleton has been cached
                 if skeleton_version == 2 or skeleton_version == 3:
@@ -2109,13 +4228,14 @@ class SkeletonService:
 
                 if not skeleton_bytes:
                     assert versioned_skeleton is not None
-                    if verbose_level >= 1:
+                    if _verbose_level.get() >= 1:
                         SkeletonService.print("Generating flat dict with lvl2_ids of length: ", len(versioned_skeleton.lvl2_ids) if versioned_skeleton.lvl2_ids is not None else 0)
                     skeleton_json = SkeletonService._skeleton_to_flatdict(versioned_skeleton)
                     skeleton_bytes = SkeletonService.compressDictToBytes(skeleton_json)
                     SkeletonService._cache_skeleton(params_cached, versioned_skeleton.version, skeleton_bytes, output_format)
+                    _payload_cache.put(payload_cache_key, skeleton_bytes)
                 if via_requests and has_request_context():
-                    if verbose_level >= 1:
+                    if _verbose_level.get() >= 1:
                         SkeletonService.print(f"Compressed FLAT DICT size: {len(skeleton_bytes)}")
                     response = Response(
                         skeleton_bytes, mimetype="application/octet-stream"
@@ -2163,8 +4283,9 @@ class SkeletonService:
                     skeleton_json = SkeletonService._skeleton_to_json(versioned_skeleton)
                     skeleton_bytes = SkeletonService.compressDictToBytes(skeleton_json)
                     SkeletonService._cache_skeleton(params_cached, versioned_skeleton.version, skeleton_bytes, output_format)
+                    _payload_cache.put(payload_cache_key, skeleton_bytes)
                 if via_requests and has_request_context():
-                    if verbose_level >= 1:
+                    if _verbose_level.get() >= 1:
                         SkeletonService.print(f"Compressed JSON size: {len(skeleton_bytes)}")
                     response = Response(
                         skeleton_bytes, mimetype="application/octet-stream"
@@ -2212,6 +4333,7 @@ class SkeletonService:
                     skeleton_arrays = SkeletonService._skeleton_to_arrays(versioned_skeleton)
                     skeleton_bytes = SkeletonService.compressDictToBytes(skeleton_arrays)
                     SkeletonService._cache_skeleton(params_cached, versioned_skeleton.version, skeleton_bytes, output_format)
+                    _payload_cache.put(payload_cache_key, skeleton_bytes)
                 if via_requests and has_request_context():
                     response = Response(
                         skeleton_bytes, mimetype="application/octet-stream"
@@ -2257,6 +4379,7 @@ class SkeletonService:
             
             # Convert the CloudVolume skeleton to precomputed format
             skeleton_precomputed = cv_skeleton.to_precomputed()
+            _payload_cache.put(payload_cache_key, skeleton_precomputed)
 
             # Cache the precomputed skeleton
             try:
@@ -2277,6 +4400,202 @@ class SkeletonService:
                     return response
             return skeleton_precomputed
 
+    @staticmethod
+    def cache_skeletons_by_datastack_and_rids(
+        datastack_name: str,
+        rids: List,
+        bucket: str,
+        root_resolution: List,
+        collapse_soma: bool,
+        collapse_radius: int,
+        skeleton_version: int = 0,
+        session_timestamp_: str = "not_provided",
+        verbose_level_: int = 0,
+    ):
+        """
+        Batched get_skeleton_by_datastack_and_rid() with output_format "none", for a worker that pulls several messages at once.
+        The rids (deduplicated) are checked against the cache in one exists() call, the uncached ones against the refusal list,
+        the PCG layer and, in one is_valid_nodes() call, the chunkedgraph, and only the remaining ones are generated, one at a time.
+        Yields (rid, error) as each rid is settled, cached and rejected rids first, so that the caller can ack or nack
+        its message without waiting for the generations. error is None, or the exception the single rid path would have raised.
+        """
+
+        _session_timestamp.set(session_timestamp_)
+
+        if verbose_level_ > _verbose_level.get():
+            _verbose_level.set(verbose_level_)
+        if debugging_root_id in rids and _verbose_level.get() < 1:
+            _verbose_level.set(1)
+
+        if bucket[-1] != "/":
+            bucket += "/"
+
+        skeleton_version = SkeletonService.get_version_specific_default_version(skeleton_version)
+        rids = list(dict.fromkeys(rids))
+
+        if _verbose_level.get() >= 1:
+            SkeletonService.print(
+                f"cache_skeletons_by_datastack_and_rids() datastack_name: {datastack_name}, rids: {rids}, bucket: {bucket}, skeleton_version: {skeleton_version},",
+                f" root_resolution: {root_resolution}, collapse_soma: {collapse_soma}, collapse_radius: {collapse_radius}",
+            )
+
+        def params(rid, skeleton_version):
+            return [rid, bucket, skeleton_version, datastack_name, root_resolution, collapse_soma, collapse_radius]
+
+        uncached_rids = []
+        in_cache = SkeletonService._confirm_skeletons_in_cache([params(rid, HIGHEST_SKELETON_VERSION) for rid in rids], "h5")
+        for rid, cached in zip(rids, in_cache):
+            if cached:
+                _PhaseTimer(rid).emit("cache_hit_fast")
+                yield rid, None
+            else:
+                uncached_rids.append(rid)
+        if not uncached_rids:
+            return
+
+        rids_to_validate = []
+        for rid in uncached_rids:
+            if rid == DEBUG_DEAD_LETTER_TEST_RID:
+                yield rid, Exception("Test exception for PubSub dead-lettering")
+            elif SkeletonService._check_root_id_against_refusal_list(bucket, datastack_name, rid):
+                _PhaseTimer(rid).emit("refused")
+                yield rid, None
+            else:
+                rids_to_validate.append(rid)
+        if not rids_to_validate:
+            return
+
+        try:
+            cave_client = _cave_client_pool.get_client(datastack_name)
+            cv = _cave_client_pool.get_cloudvolume(datastack_name)
+            root_rids = []
+            for rid in rids_to_validate:
+                if cv.meta.decode_layer_id(rid) != cv.meta.n_layers:
+                    _PhaseTimer(rid).emit("not_a_root_id")
+                else:
+                    root_rids.append(rid)
+            valid = cave_client.chunkedgraph.is_valid_nodes(root_rids) if root_rids else []
+        except Exception as e:
+            # E.g., a rate limited chunkedgraph. Every rid not settled yet shares the failure.
+            for rid in rids_to_validate:
+                yield rid, e
+            return
+        for rid in rids_to_validate:
+            if rid not in root_rids:
+                yield rid, None
+        valid_rids = []
+        for rid, is_valid in zip(root_rids, valid):
+            if is_valid:
+                valid_rids.append(rid)
+            else:
+                _PhaseTimer(rid).emit("invalid_root_id")
+                yield rid, None
+
+        for rid in valid_rids:
+            error = None
+            try:
+                if not heavy_worker and SkeletonService._is_heavy_root(rid, cave_client):
+                    _PhaseTimer(rid).emit("heavy_rerouted")
+                    raise HeavyRoot(f"Root {rid} is to be generated by a heavy worker")
+                SkeletonService._generate_skeleton_coalesced(
+                    params(rid, skeleton_version), params(rid, HIGHEST_SKELETON_VERSION), cave_client, CACHE_MESHWORK,
+                    _PhaseTimer(rid), generation_lease_duplicate_action,
+                )
+            except GenerationLeaseHeld as e:
+                if generation_lease_duplicate_action != "ack":
+                    error = e
+            except Exception as e:
+                error = e  # Already reported by _generate_and_cache_skeleton()
+            yield rid, error
+
+    @staticmethod
+    def _fetch_skeletons_bulk_from_cache(
+        datastack_name: str,
+        rids: List,
+        bucket: str,
+        root_resolution: List,
+        collapse_soma: bool,
+        collapse_radius: int,
+        skeleton_version: int,
+        output_format: str,
+        verbose_level_: int = 0,
+    ):
+        """
+        Read (and, from H5, convert) the cached skeletons of already-validated rids.
+        Return a dict of rid -> skeleton for the rids that were found and a list of the rids that have no cached H5 at all.
+
+        Every step used to run once per rid, strictly in sequence, with several blocking GCS calls each.
+        Now each step is batched or runs on a bounded thread pool: a GET of the requested format for each rid
+        (a no-op unless CACHE_NON_H5_SKELETONS), one batched existence check of the H5 files for the rest, then
+        a GET and conversion of each H5 hit.
+        """
+        def params_cached(rid):
+            return [
+                rid,
+                bucket,
+                HIGHEST_SKELETON_VERSION,
+                datastack_name,
+                root_resolution,
+                collapse_soma,
+                collapse_radius,
+            ]
+
+        with ThreadPoolExecutor(max_workers=max(1, bulk_fetch_concurrency)) as executor:
+            fetched = list(executor.map(
+                _in_current_context(lambda rid: SkeletonService._retrieve_skeleton_from_cache(params_cached(rid), output_format)),
+                rids,
+            ))
+            if _verbose_level.get() >= 1:
+                SkeletonService.print(f"_fetch_skeletons_bulk_from_cache() {output_format} cache hits: {sum(skeleton is not None for skeleton in fetched)} of {len(rids)}")
+
+            unfetched_rids = [rid for rid, skeleton in zip(rids, fetched) if skeleton is None]
+            h5_available = SkeletonService._confirm_skeletons_in_cache([params_cached(rid) for rid in unfetched_rids], "h5")
+            if _verbose_level.get() >= 1:
+                SkeletonService.print(f"H5 availability: {dict(zip(unfetched_rids, h5_available))}")
+
+            convertible_rids = [rid for rid, available in zip(unfetched_rids, h5_available) if available]
+            converted = dict(zip(convertible_rids, executor.map(
+                _in_current_context(lambda rid: SkeletonService.get_skeleton_by_datastack_and_rid(
+                    datastack_name,
+                    rid,
+                    output_format,
+                    bucket,
+                    root_resolution,
+                    collapse_soma,
+                    collapse_radius,
+                    skeleton_version,
+                    False,
+                    _session_timestamp.get(),
+                    verbose_level_,
+                )),
+                convertible_rids,
+            )))
+
+        skeletons = {}
+        unavailable_rids = []
+        for rid, skeleton in zip(rids, fetched):
+            if skeleton is not None:
+                skeletons[rid] = skeleton
+            elif rid in converted:
+                skeletons[rid] = converted[rid]
+            else:
+                unavailable_rids.append(rid)
+        return skeletons, unavailable_rids
+
+    @staticmethod
+    def _encode_bulk_skeleton(skeleton, output_format):
+        """
+        The BytesIO skeletons aren't JSON serializable and so won't fly back over the wire. Gotta convert 'em.
+        It's debatable whether an ascii encoding of this sort is necessarily smaller than the CSV representation, but presumably it is.
+        I haven't measured the respective sizes to compare and confirm.
+        """
+        if output_format == "flatdict":
+            return binascii.hexlify(skeleton).decode('ascii')
+        elif output_format == "jsoncompressed":
+            return binascii.hexlify(skeleton).decode('ascii')
+        elif output_format == "swccompressed":
+            return binascii.hexlify(skeleton.getvalue()).decode('ascii')
+
     @staticmethod
     def get_skeletons_bulk_by_datastack_and_rids(
         datastack_name: str,
@@ -2294,19 +4613,18 @@ class SkeletonService:
         """
         Provide bulk retrieval (and optional generation) of skeletons by a list of root ids.
         """
-        global session_timestamp, verbose_level
 
-        session_timestamp = session_timestamp_
+        _session_timestamp.set(session_timestamp_)
 
-        if verbose_level_ > verbose_level:
-            verbose_level = verbose_level_
-        if debugging_root_id in rids and verbose_level < 1:
-            verbose_level = 1
+        if verbose_level_ > _verbose_level.get():
+            _verbose_level.set(verbose_level_)
+        if debugging_root_id in rids and _verbose_level.get() < 1:
+            _verbose_level.set(1)
 
         if bucket[-1] != "/":
             bucket += "/"
 
-        if verbose_level >= 1:
+        if _verbose_level.get() >= 1:
             SkeletonService.print(
                 f"get_skeletons_bulk_by_datastack_and_rids() datastack_name: {datastack_name}, rids: {rids}, bucket: {bucket}, skeleton_version: {skeleton_version}",
                 f" root_resolution: {root_resolution}, collapse_soma: {collapse_soma}, collapse_radius: {collapse_radius}, output_format: {output_format}, generate_missing_skeletons: {generate_missing_skeletons}",
@@ -2321,111 +4639,73 @@ class SkeletonService:
 
         if len(rids) > MAX_BULK_SYNCHRONOUS_SKELETONS:
             rids = rids[:MAX_BULK_SYNCHRONOUS_SKELETONS]
-            if verbose_level >= 1:
+            if _verbose_level.get() >= 1:
                 SkeletonService.print(f"get_skeletons_bulk_by_datastack_and_rids() Truncating rids to {MAX_BULK_SYNCHRONOUS_SKELETONS}")
 
-        cave_client = caveclient.CAVEclient(
-            datastack_name,
-            server_address=CAVE_CLIENT_SERVER,
-        )
-        cv = cave_client.info.segmentation_cloudvolume()
+        cave_client = _cave_client_pool.get_client(datastack_name)
+        cv = _cave_client_pool.get_cloudvolume(datastack_name)
 
-        messaging_client = MessagingClientPublisher(PUBSUB_BATCH_SIZE)
-        
+        # Validate all the rids before reading any of them: the refusal list and the layer check are local lookups,
+        # and the chunkedgraph validity of all the remaining rids is checked in one is_valid_nodes() call.
         skeletons = {}
+        refused_rids = set()
+        rids_to_validate = []
         for rid in rids:
-            params = [
-                rid,
-                bucket,
-                skeleton_version,
-                datastack_name,
-                root_resolution,
-                collapse_soma,
-                collapse_radius,
-            ]
-            params_cached = [
-                rid,
-                bucket,
-                HIGHEST_SKELETON_VERSION,
-                datastack_name,
-                root_resolution,
-                collapse_soma,
-                collapse_radius,
-            ]
-
             # Don't perform the normal validation on the debugging root id.
             # We want it to look like a valid root id so it reaches the skeleton generation code and triggers the dead lettering test.
-            if rid != DEBUG_DEAD_LETTER_TEST_RID:
-                if SkeletonService._check_root_id_against_refusal_list(bucket, datastack_name, rid):
-                    continue
-                if cv.meta.decode_layer_id(rid) != cv.meta.n_layers:
-                    skeletons[rid] = "invalid_layer_rid"
-                    continue
-                if not cave_client.chunkedgraph.is_valid_nodes(rid):
-                    skeletons[rid] = "invalid_rid"
-                    continue
-            
-            skeleton = SkeletonService._retrieve_skeleton_from_cache(params_cached, output_format)
-            if verbose_level >= 1:
-                SkeletonService.print(f"get_skeletons_bulk_by_datastack_and_rids() Cache query result for {output_format} rid {rid}: {skeleton is not None}")
-            
-            if skeleton is None:  # No JSON or SWC skeleton was found (but the H5 status is unknown at this point)
-                h5_available = SkeletonService._confirm_skeleton_in_cache(params_cached, "h5")
-                if verbose_level >= 1:
-                    SkeletonService.print(f"H5 availability for rid {rid}: {h5_available}")
-                if h5_available:
-                    skeleton = SkeletonService.get_skeleton_by_datastack_and_rid(
-                        datastack_name,
-                        rid,
-                        output_format,
-                        bucket,
-                        root_resolution,
-                        collapse_soma,
-                        collapse_radius,
-                        skeleton_version,
-                        False,
-                        session_timestamp,
-                        verbose_level_,
-                    )
-                if not h5_available:
-                    # No H5 skeleton was found, so generate one asynchronously
-                    SkeletonService.publish_skeleton_request(
-                        messaging_client,
-                        datastack_name,
-                        rid,
-                        "none",
-                        bucket,
-                        root_resolution,
-                        collapse_soma,
-                        collapse_radius,
-                        skeleton_version,
-                        True,
-                        verbose_level_,
-                    )
-                    skeleton = "async"
-            
-            if verbose_level >= 1:
-                SkeletonService.print(f"get_skeletons_bulk_by_datastack_and_rids() Final skeleton for rid {rid}: {skeleton is not None if skeleton != 'async' else skeleton}")
-            
-            # The BytesIO skeletons aren't JSON serializable and so won't fly back over the wire. Gotta convert 'em.
-            # It's debatable whether an ascii encoding of this sort is necessarily smaller than the CSV representation, but presumably it is.
-            # I haven't measured the respective sizes to compare and confirm.
-            if skeleton == "async":
-                skeletons[rid] = skeleton
+            if rid == DEBUG_DEAD_LETTER_TEST_RID:
+                continue
+            if SkeletonService._check_root_id_against_refusal_list(bucket, datastack_name, rid):
+                refused_rids.add(rid)
+            elif cv.meta.decode_layer_id(rid) != cv.meta.n_layers:
+                skeletons[rid] = "invalid_layer_rid"
             else:
-                if output_format == "flatdict":
-                    skeleton_hex_ascii = binascii.hexlify(skeleton).decode('ascii')
-                    skeletons[rid] = skeleton_hex_ascii
-                elif output_format == "jsoncompressed":
-                    skeleton_hex_ascii = binascii.hexlify(skeleton).decode('ascii')
-                    skeletons[rid] = skeleton_hex_ascii
-                elif output_format == "swccompressed":
-                    skeleton_hex_ascii = binascii.hexlify(skeleton.getvalue()).decode('ascii')
-                    skeletons[rid] = skeleton_hex_ascii
+                rids_to_validate.append(rid)
+        if rids_to_validate:
+            for rid, valid in zip(rids_to_validate, cave_client.chunkedgraph.is_valid_nodes(rids_to_validate)):
+                if not valid:
+                    skeletons[rid] = "invalid_rid"
+        valid_rids = [rid for rid in rids if rid not in refused_rids and rid not in skeletons]
 
-        messaging_client.close()
+        cached_skeletons, unavailable_rids = SkeletonService._fetch_skeletons_bulk_from_cache(
+            datastack_name,
+            valid_rids,
+            bucket,
+            root_resolution,
+            collapse_soma,
+            collapse_radius,
+            skeleton_version,
+            output_format,
+            verbose_level_,
+        )
+        for rid, skeleton in cached_skeletons.items():
+            skeletons[rid] = SkeletonService._encode_bulk_skeleton(skeleton, output_format)
 
-        return skeletons
+        if unavailable_rids:
+            # No H5 skeleton was found, so generate them asynchronously, all through one batching publisher
+            messaging_client = MessagingClientPublisher(PUBSUB_BATCH_SIZE)
+            for rid in unavailable_rids:
+                SkeletonService.publish_skeleton_request(
+                    messaging_client,
+                    datastack_name,
+                    rid,
+                    "none",
+                    bucket,
+                    root_resolution,
+                    collapse_soma,
+                    collapse_radius,
+                    skeleton_version,
+                    True,
+                    verbose_level_,
+                )
+                skeletons[rid] = "async"
+            messaging_client.close()
+
+        if _verbose_level.get() >= 1:
+            SkeletonService.print(f"get_skeletons_bulk_by_datastack_and_rids() {len(cached_skeletons)} cached, {len(unavailable_rids)} queued, {len(refused_rids)} refused, {len(skeletons) - len(cached_skeletons) - len(unavailable_rids)} invalid")
+
+        # Preserve the order of the request
+        return {rid: skeletons[rid] for rid in rids if rid in skeletons}
 
     @staticmethod
     def get_cached_skeletons_bulk_by_datastack_and_rids(
@@ -2451,17 +4731,16 @@ class SkeletonService:
           "missing":   [rids not found in cache and not queued]
           "async_queued": [rids not in cache that were queued for async generation]
         """
-        global session_timestamp, verbose_level
 
-        session_timestamp = session_timestamp_
+        _session_timestamp.set(session_timestamp_)
 
-        if verbose_level_ > verbose_level:
-            verbose_level = verbose_level_
+        if verbose_level_ > _verbose_level.get():
+            _verbose_level.set(verbose_level_)
 
         if bucket[-1] != "/":
             bucket += "/"
 
-        if verbose_level >= 1:
+        if _verbose_level.get() >= 1:
             SkeletonService.print(
                 f"get_cached_skeletons_bulk_by_datastack_and_rids() datastack_name: {datastack_name}, rids: {rids}, bucket: {bucket}, skeleton_version: {skeleton_version}",
                 f" root_resolution: {root_resolution}, collapse_soma: {collapse_soma}, collapse_radius: {collapse_radius}, output_format: {output_format}, generate_missing_skeletons: {generate_missing_skeletons}",
@@ -2473,7 +4752,7 @@ class SkeletonService:
 
         if len(rids) > MAX_BULK_CACHED_SKELETONS:
             rids = rids[:MAX_BULK_CACHED_SKELETONS]
-            if verbose_level >= 1:
+            if _verbose_level.get() >= 1:
                 SkeletonService.print(f"get_cached_skeletons_bulk_by_datastack_and_rids() Truncating rids to {MAX_BULK_CACHED_SKELETONS}")
 
         messaging_client = MessagingClientPublisher(PUBSUB_BATCH_SIZE) if generate_missing_skeletons else None
@@ -2482,69 +4761,47 @@ class SkeletonService:
         missing = []
         async_queued = []
 
+        # The refusal list is an in-memory set (see _RefusalListCache), so the first lookup revalidates it at most once
+        # for the whole batch and the rest are set lookups.
+        candidate_rids = []
         for rid in rids:
-            params_cached = [
-                rid,
-                bucket,
-                HIGHEST_SKELETON_VERSION,
-                datastack_name,
-                root_resolution,
-                collapse_soma,
-                collapse_radius,
-            ]
-
             if SkeletonService._check_root_id_against_refusal_list(bucket, datastack_name, rid):
                 missing.append(rid)
-                continue
+            else:
+                candidate_rids.append(rid)
 
-            skeleton = SkeletonService._retrieve_skeleton_from_cache(params_cached, output_format)
-            if verbose_level >= 1:
-                SkeletonService.print(f"get_cached_skeletons_bulk_by_datastack_and_rids() Cache query result for {output_format} rid {rid}: {skeleton is not None}")
-
-            if skeleton is None:
-                h5_available = SkeletonService._confirm_skeleton_in_cache(params_cached, "h5")
-                if verbose_level >= 1:
-                    SkeletonService.print(f"H5 availability for rid {rid}: {h5_available}")
-                if h5_available:
-                    skeleton = SkeletonService.get_skeleton_by_datastack_and_rid(
-                        datastack_name,
-                        rid,
-                        output_format,
-                        bucket,
-                        root_resolution,
-                        collapse_soma,
-                        collapse_radius,
-                        skeleton_version,
-                        False,
-                        session_timestamp,
-                        verbose_level_,
-                    )
-                if not h5_available:
-                    if generate_missing_skeletons:
-                        SkeletonService.publish_skeleton_request(
-                            messaging_client,
-                            datastack_name,
-                            rid,
-                            "none",
-                            bucket,
-                            root_resolution,
-                            collapse_soma,
-                            collapse_radius,
-                            skeleton_version,
-                            True,
-                            verbose_level_,
-                        )
-                        async_queued.append(rid)
-                    else:
-                        missing.append(rid)
-                    continue
+        cached_skeletons, unavailable_rids = SkeletonService._fetch_skeletons_bulk_from_cache(
+            datastack_name,
+            candidate_rids,
+            bucket,
+            root_resolution,
+            collapse_soma,
+            collapse_radius,
+            skeleton_version,
+            output_format,
+            verbose_level_,
+        )
+        for rid, skeleton in cached_skeletons.items():
+            skeletons[rid] = SkeletonService._encode_bulk_skeleton(skeleton, output_format)
 
-            if output_format == "flatdict":
-                skeletons[rid] = binascii.hexlify(skeleton).decode('ascii')
-            elif output_format == "jsoncompressed":
-                skeletons[rid] = binascii.hexlify(skeleton).decode('ascii')
-            elif output_format == "swccompressed":
-                skeletons[rid] = binascii.hexlify(skeleton.getvalue()).decode('ascii')
+        for rid in unavailable_rids:
+            if generate_missing_skeletons:
+                SkeletonService.publish_skeleton_request(
+                    messaging_client,
+                    datastack_name,
+                    rid,
+                    "none",
+                    bucket,
+                    root_resolution,
+                    collapse_soma,
+                    collapse_radius,
+                    skeleton_version,
+                    True,
+                    verbose_level_,
+                )
+                async_queued.append(rid)
+            else:
+                missing.append(rid)
 
         if messaging_client is not None:
             messaging_client.close()
@@ -2579,17 +4836,16 @@ class SkeletonService:
           "bucket":        GCS bucket name (without gs:// scheme)
           "path_template": GCS object path with {rid} placeholder
         """
-        global session_timestamp, verbose_level
 
-        session_timestamp = session_timestamp_
+        _session_timestamp.set(session_timestamp_)
 
-        if verbose_level_ > verbose_level:
-            verbose_level = verbose_level_
+        if verbose_level_ > _verbose_level.get():
+            _verbose_level.set(verbose_level_)
 
         if bucket[-1] != "/":
             bucket += "/"
 
-        if verbose_level >= 1:
+        if _verbose_level.get() >= 1:
             SkeletonService.print(
                 f"get_skeleton_token_by_datastack() datastack_name: {datastack_name}, bucket: {bucket}, skeleton_version: {skeleton_version}",
             )
@@ -2601,7 +4857,7 @@ class SkeletonService:
         bucket_extra_prefix = (parts[1] + "/") if len(parts) > 1 else ""
 
         if skeleton_version != HIGHEST_SKELETON_VERSION:
-            if verbose_level >= 1:
+            if _verbose_level.get() >= 1:
                 SkeletonService.print(
                     f"get_skeleton_token_by_datastack() Skeleton version V{skeleton_version} was requested but caching only supports version V{HIGHEST_SKELETON_VERSION}, so that version will be used."
                 )
@@ -2673,23 +4929,19 @@ class SkeletonService:
         """
         Generate a meshwork aynschronously. Then poll for the result to be ready and return it.
         """
-        global session_timestamp, verbose_level
 
-        session_timestamp = session_timestamp_
+        _session_timestamp.set(session_timestamp_)
 
-        if verbose_level_ > verbose_level:
-            verbose_level = verbose_level_
-        if rid == debugging_root_id and verbose_level < 1:
-            verbose_level = 1
+        if verbose_level_ > _verbose_level.get():
+            _verbose_level.set(verbose_level_)
+        if rid == debugging_root_id and _verbose_level.get() < 1:
+            _verbose_level.set(1)
 
         if SkeletonService._check_root_id_against_refusal_list(bucket, datastack_name, rid):
             raise ValueError(f"Problematic root id: {rid} is in the refusal list")
         
-        cave_client = caveclient.CAVEclient(
-            datastack_name,
-            server_address=CAVE_CLIENT_SERVER,
-        )
-        cv = cave_client.info.segmentation_cloudvolume()
+        cave_client = _cave_client_pool.get_client(datastack_name)
+        cv = _cave_client_pool.get_cloudvolume(datastack_name)
         if cv.meta.decode_layer_id(rid) != cv.meta.n_layers:
             raise ValueError(f"Invalid root id: {rid} (perhaps this is an id corresponding to a different level of the PCG, e.g., a supervoxel id)")
         if not cave_client.chunkedgraph.is_valid_nodes(rid):
@@ -2724,7 +4976,7 @@ class SkeletonService:
 
             t2 = default_timer()
 
-            if verbose_level >= 1:
+            if _verbose_level.get() >= 1:
                 SkeletonService.print(f"Polling for meshwork to be available for rid {rid}...")
             while not SkeletonService.meshworks_exist(
                 bucket,
@@ -2732,11 +4984,11 @@ class SkeletonService:
                 verbose_level_
             ):
                 time.sleep(5)
-            if verbose_level >= 1:
+            if _verbose_level.get() >= 1:
                 SkeletonService.print(f"Meshwork is now available for rid {rid}.")
         else:
             t2 = t1 = default_timer()
-            if verbose_level >= 1:
+            if _verbose_level.get() >= 1:
                 SkeletonService.print(f"No need to initiate asynchronous skeleton generation for rid {rid}. It already exists.")
         
         t3 = default_timer()
@@ -2751,13 +5003,13 @@ class SkeletonService:
             collapse_radius,
             -1,
             True,
-            session_timestamp,
+            _session_timestamp.get(),
             verbose_level_,
         )
         
         t4 = default_timer()
 
-        if verbose_level >= 1:
+        if _verbose_level.get() >= 1:
             et1 = t1 - t0
             et2 = t2 - t1
             et3 = t3 - t2
@@ -2783,14 +5035,13 @@ class SkeletonService:
         """
         Generate a skeleton aynschronously. Then poll for the result to be ready and return it.
         """
-        global session_timestamp, verbose_level
 
-        session_timestamp = session_timestamp_
+        _session_timestamp.set(session_timestamp_)
 
-        if verbose_level_ > verbose_level:
-            verbose_level = verbose_level_
-        if rid == debugging_root_id and verbose_level < 1:
-            verbose_level = 1
+        if verbose_level_ > _verbose_level.get():
+            _verbose_level.set(verbose_level_)
+        if rid == debugging_root_id and _verbose_level.get() < 1:
+            _verbose_level.set(1)
 
         # Don't perform the normal validation on the debugging root id.
         # We want it to look like a valid root id so it reaches the skeleton generation code and triggers the dead lettering test.
@@ -2798,11 +5049,8 @@ class SkeletonService:
             if SkeletonService._check_root_id_against_refusal_list(bucket, datastack_name, rid):
                 raise ValueError(f"Problematic root id: {rid} is in the refusal list")
 
-            cave_client = caveclient.CAVEclient(
-                datastack_name,
-                server_address=CAVE_CLIENT_SERVER,
-            )
-            cv = cave_client.info.segmentation_cloudvolume()
+            cave_client = _cave_client_pool.get_client(datastack_name)
+            cv = _cave_client_pool.get_cloudvolume(datastack_name)
             if cv.meta.decode_layer_id(rid) != cv.meta.n_layers:
                 raise ValueError(f"Invalid root id: {rid} (perhaps this is an id corresponding to a different level of the PCG, e.g., a supervoxel id)")
             if not cave_client.chunkedgraph.is_valid_nodes(rid):
@@ -2815,12 +5063,12 @@ class SkeletonService:
             datastack_name,
             skeleton_version,
             rid,
-            session_timestamp,
+            _session_timestamp.get(),
             verbose_level_
         ):
             t1 = default_timer()
 
-            if verbose_level >= 1:
+            if _verbose_level.get() >= 1:
                 SkeletonService.print(f"get_skeleton_by_datastack_and_rid_async() Rid {rid} not found in cache. Publishing a skeleton request to the message queue...")
 
             messaging_client = MessagingClientPublisher(PUBSUB_BATCH_SIZE)
@@ -2831,7 +5079,7 @@ class SkeletonService:
                 # Use the absence of a limiter to detect that we are running on the local machine.
                 # Debugging is much easier if we don't go through the PubSub system, but rather directly drop into the skeletonization function.
                 
-                if verbose_level >= 1:
+                if _verbose_level.get() >= 1:
                     SkeletonService.print(f'get_skeleton_by_datastack_and_rid_async() LIMITER_URI is {os.environ.get("LIMITER_URI", "None")}, indicating local machine debugging, so PubSub will not be used.')
 
                 skeleton = SkeletonService.get_skeleton_by_datastack_and_rid(
@@ -2844,7 +5092,7 @@ class SkeletonService:
                     collapse_radius,
                     skeleton_version,
                     True,
-                    session_timestamp,
+                    _session_timestamp.get(),
                     verbose_level_,
                 )
             else:
@@ -2866,22 +5114,23 @@ class SkeletonService:
 
             t2 = default_timer()
 
-            if verbose_level >= 1:
+            if _verbose_level.get() >= 1:
                 SkeletonService.print(f"get_skeleton_by_datastack_and_rid_async() Polling for skeleton to be available for rid {rid}...")
             while not SkeletonService.skeletons_exist(
                 bucket,
                 datastack_name,
                 skeleton_version,
                 rid,
-                session_timestamp,
-                verbose_level_
+                _session_timestamp.get(),
+                verbose_level_,
+                use_index=False,  # The index only sees the new skeleton after its next revalidation
             ):
                 time.sleep(5)
-            if verbose_level >= 1:
+            if _verbose_level.get() >= 1:
                 SkeletonService.print(f"get_skeleton_by_datastack_and_rid_async() Skeleton is now available for rid {rid}.")
         else:
             t2 = t1 = default_timer()
-            if verbose_level >= 1:
+            if _verbose_level.get() >= 1:
                 SkeletonService.print(f"get_skeleton_by_datastack_and_rid_async() No need to initiate asynchronous skeleton generation for rid {rid}. It already exists.")
         
         t3 = default_timer()
@@ -2896,13 +5145,13 @@ class SkeletonService:
             collapse_radius,
             skeleton_version,
             True,
-            session_timestamp,
+            _session_timestamp.get(),
             verbose_level_,
         )
         
         t4 = default_timer()
 
-        if verbose_level >= 1:
+        if _verbose_level.get() >= 1:
             et1 = t1 - t0
             et2 = t2 - t1
             et3 = t3 - t2
@@ -2927,23 +5176,19 @@ class SkeletonService:
         """
         Generate multiple skeletons aynschronously without returning anything.
         """
-        global session_timestamp, verbose_level
 
-        session_timestamp = session_timestamp_
+        _session_timestamp.set(session_timestamp_)
 
-        if verbose_level_ > verbose_level:
-            verbose_level = verbose_level_
-        if debugging_root_id in rids and verbose_level < 1:
-            verbose_level = 1
+        if verbose_level_ > _verbose_level.get():
+            _verbose_level.set(verbose_level_)
+        if debugging_root_id in rids and _verbose_level.get() < 1:
+            _verbose_level.set(1)
         
         if verbose_level_ >= 1:
             SkeletonService.print(f"generate_meshworks_bulk_by_datastack_and_rids_async() datastack_name: {datastack_name}, rids: {rids}, bucket: {bucket}")
 
-        cave_client = caveclient.CAVEclient(
-            datastack_name,
-            server_address=CAVE_CLIENT_SERVER,
-        )
-        cv = cave_client.info.segmentation_cloudvolume()
+        cave_client = _cave_client_pool.get_client(datastack_name)
+        cv = _cave_client_pool.get_cloudvolume(datastack_name)
 
         messaging_client = MessagingClientPublisher(PUBSUB_BATCH_SIZE)
 
@@ -2983,7 +5228,7 @@ class SkeletonService:
             num_workers = 15
             SkeletonService.print(f"Flask config variable SKELETONCACHE_WORKER_MAX_REPLICAS not found. Using default value of {num_workers}.")
         estimated_async_time_secs_upper_bound =  math.ceil(num_valid_rids / num_workers) * meshwork_generation_time_estimate_secs
-        if verbose_level >= 1:
+        if _verbose_level.get() >= 1:
             SkeletonService.print(f"Estimated async time: ceiling({num_valid_rids} / {num_workers}) * {meshwork_generation_time_estimate_secs} = {estimated_async_time_secs_upper_bound}")
         return estimated_async_time_secs_upper_bound
 
@@ -3003,14 +5248,13 @@ class SkeletonService:
         """
         Generate multiple skeletons aynschronously without returning anything.
         """
-        global session_timestamp, verbose_level
 
-        session_timestamp = session_timestamp_
+        _session_timestamp.set(session_timestamp_)
 
-        if verbose_level_ > verbose_level:
-            verbose_level = verbose_level_
-        if debugging_root_id in rids and verbose_level < 1:
-            verbose_level = 1
+        if verbose_level_ > _verbose_level.get():
+            _verbose_level.set(verbose_level_)
+        if debugging_root_id in rids and _verbose_level.get() < 1:
+            _verbose_level.set(1)
         
         if verbose_level_ >= 1:
             SkeletonService.print(f"generate_skeletons_bulk_by_datastack_and_rids_async() datastack_name: {datastack_name}, rids: {rids}, bucket: {bucket}")
@@ -3018,11 +5262,7 @@ class SkeletonService:
         num_rids_submitted = len(rids)
 
         t0 = default_timer()
-        cave_client = caveclient.CAVEclient(
-            datastack_name,
-            server_address=CAVE_CLIENT_SERVER,
-        )
-        cv = cave_client.info.segmentation_cloudvolume()
+        cv = _cave_client_pool.get_cloudvolume(datastack_name)
         t1 = default_timer()
         cv_et = t1 - t0
 
@@ -3031,8 +5271,8 @@ class SkeletonService:
             datastack_name,
             skeleton_version,
             rids,
-            session_timestamp,
-            verbose_level,
+            _session_timestamp.get(),
+            _verbose_level.get(),
         )
         if isinstance(exists_results, dict):
             rids = [rid for rid, exists in exists_results.items() if not exists]
@@ -3042,8 +5282,7 @@ class SkeletonService:
         t2 = default_timer()
         ex_et = t2 - t1
 
-        skeletonization_refusal_root_ids_df_without_timestamps = SkeletonService._read_refusal_list_without_timestamps(bucket)
-        refusal_rids = set(skeletonization_refusal_root_ids_df_without_timestamps['ROOT_ID'].tolist())
+        refusal_rids = _refusal_list_cache.rids(bucket, datastack_name)
         t3 = default_timer()
         rf_et = t3 - t2
 
@@ -3096,7 +5335,7 @@ class SkeletonService:
 
         total_et = t4 - t0
 
-        if verbose_level >= 1:
+        if _verbose_level.get() >= 1:
             SkeletonService.print(f"generate_skeletons_bulk_by_datastack_and_rids_async() Called with {num_rids_submitted} root ids, of which {num_valid_rids} were dispatched for skeletonization.")
             SkeletonService.print(f"generate_skeletons_bulk_by_datastack_and_rids_async() Elapsed times: CV:{cv_et:.3f}s EX:{ex_et:.3f}s RF1:{rf_et:.3f}s -- RF2:{t2a_ets:.3f}s LR:{t2b_ets:.3f}s VD:{t2c_ets:.3f}s PB1:{t2d_ets:.3f}s -- PB2:{t4_et:.3f}s -- TOTAL:{total_et:.3f}s")
         
@@ -3110,6 +5349,6 @@ class SkeletonService:
             num_workers = 15
             SkeletonService.print(f"Flask config variable SKELETONCACHE_WORKER_MAX_REPLICAS not found. Using default value of {num_workers}.")
         estimated_async_time_secs_upper_bound =  math.ceil(num_valid_rids / num_workers) * skeleton_generation_time_estimate_secs
-        if verbose_level >= 1:
+        if _verbose_level.get() >= 1:
             SkeletonService.print(f"Estimated async time: ceiling({num_valid_rids} / {num_workers}) * {skeleton_generation_time_estimate_secs} = {estimated_async_time_secs_upper_bound}")
         return estimated_async_time_secs_upper_bound
@@ -31,9 +31,10 @@ class SkeletonService_skvn3(SkeletonService):
         limit: int = None,
         session_timestamp_: str = "not_provided",
         verbose_level_: int = 0,
+        cursor: int = None,
     ):
         if verbose_level_ >= 1:
-            SkeletonService.print(f"SkeletonService_skvn3.get_cache_contents: {bucket} {skeleton_version} {rid_prefixes} {limit}")
+            SkeletonService.print(f"SkeletonService_skvn3.get_cache_contents: {bucket} {skeleton_version} {rid_prefixes} {limit} {cursor}")
         return SkeletonService.get_cache_contents(
             bucket,
             datastack_name,
@@ -42,6 +43,7 @@ class SkeletonService_skvn3(SkeletonService):
             limit,
             session_timestamp_,
             verbose_level_,
+            cursor,
         )
     
     @staticmethod
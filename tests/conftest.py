@@ -3,6 +3,7 @@ import logging
 import pytest
 
 from skeletonservice import create_app
+from skeletonservice.datasets import service as skeleton_service
 from skeletonservice.datasets.service_skvn1 import SkeletonService_skvn1
 from skeletonservice.datasets.service_skvn2 import SkeletonService_skvn2
 from skeletonservice.datasets.service_skvn3 import SkeletonService_skvn3
@@ -45,6 +46,25 @@ class CloudVolumeMock:
     def __init__(self):
         self.meta = CloudVolumeMock.CloudVolumeMockMetaMock()
 
+@pytest.fixture(autouse=True)
+def reset_process_caches():
+    """Process-level caches in service.py would otherwise carry one test's mocks into the next."""
+    skeleton_service._cave_client_pool.clear()
+    skeleton_service._refusal_list_cache.clear()
+    skeleton_service._payload_cache.clear()
+    skeleton_service._skeleton_index_cache.clear()
+    skeleton_service._cave_call_governor.clear()
+    skeleton_service._soma_position_cache.clear()
+    skeleton_service._level2_attribute_cache.clear()
+    yield
+    skeleton_service._cave_client_pool.clear()
+    skeleton_service._refusal_list_cache.clear()
+    skeleton_service._payload_cache.clear()
+    skeleton_service._skeleton_index_cache.clear()
+    skeleton_service._cave_call_governor.clear()
+    skeleton_service._soma_position_cache.clear()
+    skeleton_service._level2_attribute_cache.clear()
+
 # From MaterializationEngine:conftest.py
 # Setup Flask apps
 @pytest.fixture(scope="session")
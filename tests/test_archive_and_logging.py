@@ -2,8 +2,9 @@
 
 1. _archive_skeletonization_time() rewrote a single bucket-root CSV in full on every generated
    skeleton. The object had reached 85,309 rows / 8.10 MB uncompressed and all 200 workers
-   contended for it, leaving them at 1-6 millicores with ~9,000 messages backlogged. It is now
-   opt-in via ARCHIVE_SKELETONIZATION_TIMES.
+   contended for it, leaving them at 1-6 millicores with ~9,000 messages backlogged. It now writes
+   one small record per skeleton under a date/worker prefix, compacted offline into daily parquet
+   files, and ARCHIVE_SKELETONIZATION_TIMES=false still turns it off.
 
 2. google.cloud.logging setup_logging() was called at import scope in four modules, attaching
    several handlers to the root logger; each emit then failed with a 403 because the worker
@@ -12,29 +13,44 @@
 
 import importlib
 import logging
+from io import BytesIO
 from unittest import mock
 
+import pandas as pd
 import pytest
+from cloudfiles import CloudFiles
 
 
 @pytest.fixture
 def service(monkeypatch):
-    """Import service.py fresh so module-level env reads are re-evaluated."""
+    """Import service.py fresh so module-level env reads are re-evaluated.
+
+    The module's original namespace is restored afterwards: a reload replaces SkeletonService and
+    the process-level caches, so other test modules' patches on the class they imported would
+    otherwise no longer apply to the code that runs.
+    """
+    import skeletonservice.datasets.service as svc
+
+    saved = dict(svc.__dict__)
 
     def _load(**env):
         for k, v in env.items():
             monkeypatch.setenv(k, v)
-        import skeletonservice.datasets.service as svc
 
         return importlib.reload(svc)
 
-    return _load
+    yield _load
+    svc.__dict__.clear()
+    svc.__dict__.update(saved)
 
 
 class TestArchiveKillSwitch:
-    def test_disabled_by_default_touches_no_storage(self, service, monkeypatch):
+    def test_enabled_by_default(self, service, monkeypatch):
         monkeypatch.delenv("ARCHIVE_SKELETONIZATION_TIMES", raising=False)
-        svc = service()
+        assert service().archive_skeletonization_times is True
+
+    def test_disabled_touches_no_storage(self, service):
+        svc = service(ARCHIVE_SKELETONIZATION_TIMES="false")
 
         assert svc.archive_skeletonization_times is False
         with mock.patch.object(svc, "CloudFiles") as cf:
@@ -48,17 +64,34 @@ class TestArchiveKillSwitch:
         assert service(ARCHIVE_SKELETONIZATION_TIMES=value).archive_skeletonization_times is False
 
     @pytest.mark.parametrize("value", ["true", "True", "TRUE"])
-    def test_opt_in_reenables_the_old_path(self, service, value):
+    def test_enabled_writes_one_record_without_reading(self, service, value):
         svc = service(ARCHIVE_SKELETONIZATION_TIMES=value)
 
         assert svc.archive_skeletonization_times is True
         with mock.patch.object(svc, "CloudFiles") as cf:
-            cf.return_value.exists.return_value = False
             svc.SkeletonService._archive_skeletonization_time(
                 "gs://bucket", "minnie65_public", 864691135528193883, 4, 100, 5, 3, 12.5
             )
         cf.assert_called_once()
         cf.return_value.put.assert_called_once()
+        cf.return_value.exists.assert_not_called()
+        cf.return_value.get.assert_not_called()
+
+    def test_records_are_partitioned_by_date_and_worker(self, service):
+        svc = service(ARCHIVE_SKELETONIZATION_TIMES="true")
+
+        with mock.patch.object(svc, "CloudFiles") as cf:
+            for _ in range(2):
+                svc.SkeletonService._archive_skeletonization_time(
+                    "gs://bucket", "minnie65_public", 864691135528193883, 4, 100, 5, 3, 12.5
+                )
+
+        paths = [c[0][0] for c in cf.return_value.put.call_args_list]
+        assert paths[0] != paths[1]
+        for path in paths:
+            date, worker = path[len(svc.SKELETONIZATION_TIMES_PREFIX + "shards/"):].split("/")[:2]
+            assert len(date) == len("2026-08-16") and date.count("-") == 2
+            assert worker.endswith(f"-{svc.os.getpid()}")
 
     def test_header_columns_match_the_appended_row(self, service):
         """A from-scratch file previously got a header whose column order did not match the rows."""
@@ -88,6 +121,51 @@ class TestArchiveKillSwitch:
             )  # must not raise
 
 
+class TestSkeletonizationTimesCompaction:
+    @pytest.fixture
+    def bucket(self, tmp_path, monkeypatch):
+        from skeletonservice.datasets import service as svc
+
+        monkeypatch.setattr(svc, "archive_skeletonization_times", True)
+        return f"file://{tmp_path}/"
+
+    @staticmethod
+    def _archive(bucket, rid):
+        from skeletonservice.datasets import service as svc
+
+        svc.SkeletonService._archive_skeletonization_time(bucket, "minnie65_public", rid, 4, 100, 5, 3, 1.5)
+
+    def test_days_are_merged_into_parquet_and_records_removed(self, bucket):
+        from skeletonservice.datasets import service as svc
+
+        for rid in (1, 2, 3):
+            self._archive(bucket, rid)
+        cf = CloudFiles(bucket)
+        date = next(iter(cf.list(prefix=svc.SKELETONIZATION_TIMES_PREFIX + "shards/"))).split("/")[2]
+
+        assert svc.SkeletonService.compact_skeletonization_times(bucket) == {}  # today is still being written
+        assert svc.SkeletonService.compact_skeletonization_times(bucket, dates=[date]) == {date: 3}
+
+        assert list(cf.list(prefix=svc.SKELETONIZATION_TIMES_PREFIX + "shards/")) == []
+        day_df = pd.read_parquet(BytesIO(cf.get(f"{svc.SKELETONIZATION_TIMES_PREFIX}daily/{date}.parquet")))
+        assert list(day_df.columns) == svc.SKELETONIZATION_TIMES_COLUMNS
+        assert sorted(day_df["Root_ID"]) == [1, 2, 3]
+        assert day_df["N_Vertices"].dtype == "int64"
+
+    def test_late_records_are_merged_into_an_existing_day(self, bucket):
+        from skeletonservice.datasets import service as svc
+
+        cf = CloudFiles(bucket)
+        self._archive(bucket, 1)
+        date = next(iter(cf.list(prefix=svc.SKELETONIZATION_TIMES_PREFIX + "shards/"))).split("/")[2]
+        svc.SkeletonService.compact_skeletonization_times(bucket, dates=[date])
+        self._archive(bucket, 2)
+        svc.SkeletonService.compact_skeletonization_times(bucket, dates=[date])
+
+        day_df = pd.read_parquet(BytesIO(cf.get(f"{svc.SKELETONIZATION_TIMES_PREFIX}daily/{date}.parquet")))
+        assert sorted(day_df["Root_ID"]) == [1, 2]
+
+
 class TestNoCloudLoggingHandler:
     """The worker must not install a Cloud Logging handler.
 
@@ -0,0 +1,146 @@
+"""Guards for the bulk endpoints, which used to walk their rids strictly one at a time.
+
+get_cached_skeletons_bulk_by_datastack_and_rids() accepts up to MAX_BULK_CACHED_SKELETONS (500) rids,
+and each one cost several blocking GCS calls in sequence, so a full request took minutes. Reads now
+run on a bounded thread pool (BULK_FETCH_CONCURRENCY) and existence is checked in one batch.
+
+get_skeletons_bulk_by_datastack_and_rids() additionally made one chunkedgraph call per rid; all its rids
+are now validated in a single is_valid_nodes() call and all its misses published through one publisher.
+"""
+
+import binascii
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+from skeletonservice.datasets import service as svc
+
+BUCKET = "gs://bucket/"
+
+
+def _bulk_cached(rids, **kwargs):
+    return svc.SkeletonService.get_cached_skeletons_bulk_by_datastack_and_rids(
+        "minnie65_public", rids, BUCKET, [1, 1, 1], True, 7500, 4, "flatdict", **kwargs
+    )
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    """A cache in which even rids have their requested format and odd rids only have H5 (except 7, which has nothing)."""
+    state = {"in_flight": 0, "peak": 0, "confirm_calls": 0}
+    lock = threading.Lock()
+
+    def _retrieve(params, format):
+        with lock:
+            state["in_flight"] += 1
+            state["peak"] = max(state["peak"], state["in_flight"])
+        time.sleep(0.02)
+        with lock:
+            state["in_flight"] -= 1
+        rid = params[0]
+        return f"cached-{rid}".encode() if rid % 2 == 0 else None
+
+    def _confirm(params_list, format):
+        state["confirm_calls"] += 1
+        return [params[0] != 7 for params in params_list]
+
+    def _convert(datastack_name, rid, *args):
+        return f"converted-{rid}".encode()
+
+    monkeypatch.setattr(svc.SkeletonService, "_check_root_id_against_refusal_list", staticmethod(lambda bucket, ds, rid: rid == 3))
+    monkeypatch.setattr(svc.SkeletonService, "_retrieve_skeleton_from_cache", staticmethod(_retrieve))
+    monkeypatch.setattr(svc.SkeletonService, "_confirm_skeletons_in_cache", staticmethod(_confirm))
+    monkeypatch.setattr(svc.SkeletonService, "get_skeleton_by_datastack_and_rid", staticmethod(_convert))
+    return state
+
+
+class TestCachedBulkFetch:
+    def test_results_are_classified(self, cache):
+        result = _bulk_cached(list(range(10)))
+
+        assert result[2] == binascii.hexlify(b"cached-2").decode("ascii")
+        assert result[5] == binascii.hexlify(b"converted-5").decode("ascii")
+        assert 3 not in result  # refused
+        assert 7 not in result  # not cached in any format
+        assert sorted(result) == [0, 1, 2, 4, 5, 6, 8, 9]
+
+    def test_existence_is_checked_in_one_batch(self, cache):
+        _bulk_cached(list(range(10)))
+
+        assert cache["confirm_calls"] == 1
+
+    def test_reads_run_concurrently_within_the_bound(self, cache, monkeypatch):
+        monkeypatch.setattr(svc, "bulk_fetch_concurrency", 4)
+
+        t0 = time.monotonic()
+        _bulk_cached(list(range(40)))
+        elapsed = time.monotonic() - t0
+
+        assert cache["peak"] == 4
+        assert elapsed < 40 * 0.02 / 2  # well under the sequential time
+
+    def test_misses_are_queued_when_asked(self, cache, monkeypatch):
+        publish = mock.MagicMock()
+        monkeypatch.setattr(svc.SkeletonService, "publish_skeleton_request", staticmethod(publish))
+        monkeypatch.setattr(svc, "MessagingClientPublisher", mock.MagicMock())
+
+        _bulk_cached(list(range(10)), generate_missing_skeletons=True)
+
+        assert [c[0][2] for c in publish.call_args_list] == [7]
+
+
+class TestSynchronousBulk:
+    @pytest.fixture
+    def chunkedgraph(self, cache, monkeypatch):
+        """Rid 4 is not a root id and rid 6 is not valid in the chunkedgraph."""
+        pool = mock.MagicMock()
+        pool.get_cloudvolume.return_value.meta.n_layers = 2
+        pool.get_cloudvolume.return_value.meta.decode_layer_id.side_effect = lambda rid: 1 if rid == 4 else 2
+        pool.get_client.return_value.chunkedgraph.is_valid_nodes.side_effect = lambda rids: [rid != 6 for rid in rids]
+        monkeypatch.setattr(svc, "_cave_client_pool", pool)
+        monkeypatch.setattr(svc, "MAX_BULK_SYNCHRONOUS_SKELETONS", 100)
+        publisher = mock.MagicMock()
+        monkeypatch.setattr(svc, "MessagingClientPublisher", publisher)
+        publish = mock.MagicMock()
+        monkeypatch.setattr(svc.SkeletonService, "publish_skeleton_request", staticmethod(publish))
+        return pool.get_client.return_value.chunkedgraph, publisher, publish
+
+    @staticmethod
+    def _bulk(rids):
+        return svc.SkeletonService.get_skeletons_bulk_by_datastack_and_rids(
+            "minnie65_public", rids, BUCKET, [1, 1, 1], True, 7500, 4, "flatdict"
+        )
+
+    def test_rids_are_validated_in_one_call(self, chunkedgraph):
+        cg, _, _ = chunkedgraph
+
+        result = self._bulk(list(range(10)))
+
+        cg.is_valid_nodes.assert_called_once_with([0, 1, 2, 5, 6, 7, 8, 9])  # 3 refused, 4 not a root id
+        assert result[4] == "invalid_layer_rid"
+        assert result[6] == "invalid_rid"
+        assert 3 not in result
+
+    def test_results_keep_the_request_order(self, chunkedgraph):
+        rids = [9, 2, 7, 4, 1]
+
+        assert list(self._bulk(rids)) == rids
+
+    def test_misses_are_published_through_one_publisher(self, chunkedgraph):
+        _, publisher, publish = chunkedgraph
+
+        result = self._bulk(list(range(10)))
+
+        assert result[7] == "async"
+        assert [c[0][2] for c in publish.call_args_list] == [7]
+        publisher.assert_called_once()
+        publisher.return_value.close.assert_called_once()
+
+    def test_no_publisher_without_misses(self, chunkedgraph):
+        _, publisher, _ = chunkedgraph
+
+        self._bulk([0, 1, 2])
+
+        publisher.assert_not_called()
@@ -0,0 +1,70 @@
+"""Guards for the cost of reading skeletons and meshworks from the cache.
+
+Every cache read used to be cf.exists() followed by cf.get(): two GCS round trips per hit. A read is
+now a single GET that returns None when the object is missing and raises when the read fails.
+"""
+
+from unittest import mock
+
+import pytest
+
+from skeletonservice.datasets import service as svc
+
+PARAMS = [864691135528193883, "gs://bucket/", svc.HIGHEST_SKELETON_VERSION, "minnie65_public", [1, 1, 1], True, 7500]
+
+
+@pytest.fixture
+def cf(monkeypatch):
+    cf = mock.MagicMock()
+    monkeypatch.setattr(svc, "CloudFiles", mock.MagicMock(return_value=cf))
+    monkeypatch.setattr(svc, "CACHE_NON_H5_SKELETONS", True)
+    return cf
+
+
+class TestSingleGetCacheReads:
+    @pytest.mark.parametrize("format", ["flatdict", "jsoncompressed", "precomputed"])
+    def test_hit_is_one_get(self, cf, format):
+        cf.get.return_value = b"skeleton"
+
+        assert svc.SkeletonService._retrieve_skeleton_from_cache(PARAMS, format) == b"skeleton"
+
+        cf.get.assert_called_once()
+        cf.exists.assert_not_called()
+
+    def test_json_hit_is_decoded(self, cf):
+        cf.get.return_value = b'{"vertices": [[0, 1, 2]]}'
+
+        assert svc.SkeletonService._retrieve_skeleton_from_cache(PARAMS, "json") == {"vertices": [[0, 1, 2]]}
+        cf.exists.assert_not_called()
+
+    def test_miss_is_none(self, cf):
+        cf.get.return_value = None
+
+        assert svc.SkeletonService._retrieve_skeleton_from_cache(PARAMS, "h5") is None
+        assert svc.SkeletonService._retrieve_meshwork_from_cache(PARAMS, True) is None
+        cf.exists.assert_not_called()
+
+    def test_read_error_is_not_a_miss(self, cf):
+        cf.get.side_effect = IOError("503 Service Unavailable")
+
+        with pytest.raises(IOError):
+            svc.SkeletonService._retrieve_skeleton_from_cache(PARAMS, "h5")
+        with pytest.raises(IOError):
+            svc.SkeletonService._retrieve_meshwork_from_cache(PARAMS, True)
+
+    def test_meshwork_hit_is_one_get(self, cf):
+        cf.get.return_value = b"meshwork"
+
+        assert svc.SkeletonService._retrieve_meshwork_from_cache(PARAMS, True) == b"meshwork"
+        cf.get.assert_called_once()
+        cf.exists.assert_not_called()
+
+    def test_confirm_is_one_request_even_when_verbose(self, cf, monkeypatch):
+        token = svc._verbose_level.set(1)
+        cf.exists.return_value = True
+
+        try:
+            assert svc.SkeletonService._confirm_skeleton_in_cache(PARAMS, "h5")
+        finally:
+            svc._verbose_level.reset(token)
+        cf.exists.assert_called_once()
@@ -0,0 +1,96 @@
+"""Guards for the client-side governor of the CAVE calls made during generation.
+
+Workers used to learn about the materialization service's limit (800 per minute) only from its 429s, after which every
+message in flight was redelivered. Governed calls now take a token from a budget per window shared by all pods, and each
+pod adapts the rate it admits them at from the 429s it still gets (AIMD), so the fleet stays just under the limit.
+"""
+
+import time
+from unittest import mock
+
+import pytest
+import requests
+
+from skeletonservice.datasets import service as svc
+
+WINDOW_SECS = 0.5
+
+
+@pytest.fixture
+def governor(monkeypatch):
+    monkeypatch.setattr(svc.random, "uniform", lambda a, b: 0)
+    now = time.time()
+    time.sleep(WINDOW_SECS - now % WINDOW_SECS + 0.01)  # Start at the beginning of a window
+    return svc._CaveCallGovernor({"materialize": 4}, "memory://", window_secs=WINDOW_SECS, max_wait_secs=10)
+
+
+def _rate_limited_error():
+    response = requests.Response()
+    response.status_code = 500
+    return requests.HTTPError("500 Server Error: 429 Too Many Requests: 800 per 1 minute for url: .../query", response=response)
+
+
+class TestCaveCallGovernor:
+    def test_calls_past_the_budget_wait_for_the_next_window(self, governor):
+        windows = []
+        for _ in range(6):
+            governor.acquire("materialize")
+            windows.append(int(time.time() // WINDOW_SECS))
+
+        assert windows[:4] == [windows[0]] * 4
+        assert windows[4:] == [windows[0] + 1] * 2
+
+    def test_the_budget_is_shared_by_all_pods(self, governor):
+        other_pod = svc._CaveCallGovernor({"materialize": 4}, "memory://", window_secs=WINDOW_SECS, max_wait_secs=10)
+        other_pod._storage = governor._get_storage()  # Both pods reach the same store
+        for _ in range(4):
+            governor.acquire("materialize")
+
+        window = int(time.time() // WINDOW_SECS)
+        other_pod.acquire("materialize")
+
+        assert int(time.time() // WINDOW_SECS) == window + 1
+
+    def test_ungoverned_services_do_not_wait(self, governor):
+        storage = mock.MagicMock()
+        governor._storage = storage
+
+        governor.call(["chunkedgraph"], lambda: None)
+
+        storage.incr.assert_not_called()
+
+    def test_a_429_halves_the_rate_once_per_window(self, governor):
+        fn = mock.MagicMock(side_effect=_rate_limited_error())
+
+        for _ in range(2):
+            with pytest.raises(requests.HTTPError):
+                governor.call(["materialize"], fn)
+
+        assert governor.rate("materialize") == 2
+
+    def test_the_rate_recovers_after_windows_without_a_429(self, governor):
+        governor.rate_limited("materialize")
+        assert governor.rate("materialize") == 2
+
+        time.sleep(WINDOW_SECS * 2)
+
+        assert governor.rate("materialize") == pytest.approx(2.4)
+
+    def test_the_rate_has_a_floor(self, governor):
+        for _ in range(10):
+            governor.rate_limited("materialize")
+            governor._rates["materialize"]["decreased"] = None  # As if each 429 came in a later window
+
+        assert governor.rate("materialize") == pytest.approx(0.2)
+
+    def test_other_errors_leave_the_rate_alone(self, governor):
+        with pytest.raises(ValueError):
+            governor.call(["materialize"], mock.MagicMock(side_effect=ValueError("not found")))
+
+        assert governor.rate("materialize") == 4
+
+    def test_calls_go_ahead_when_the_storage_is_unreachable(self, governor):
+        governor._storage = mock.MagicMock()
+        governor._storage.incr.side_effect = ConnectionError("redis")
+
+        assert governor.call(["materialize"], lambda: "soma") == "soma"
@@ -0,0 +1,85 @@
+"""Guards for the pod-local disk cache between the web processes and the bucket.
+
+Every H5 read that missed the in-memory payload cache used to be a GCS round trip. With
+SKELETON_DISK_CACHE_DIR set, skeleton files are kept on local disk, shared by the pod's uwsgi
+processes, and bounded by SKELETON_DISK_CACHE_MAX_BYTES.
+"""
+
+import os
+from unittest import mock
+
+import pytest
+
+from skeletonservice.datasets import service as svc
+
+PARAMS = [864691135528193883, "gs://bucket/", svc.HIGHEST_SKELETON_VERSION, "minnie65_public", [1, 1, 1], True, 7500]
+
+
+def _set_mtime(cache, key, mtime):
+    os.utime(cache._path(key), (mtime, mtime))
+
+
+class TestDiskCache:
+    def test_round_trip(self, tmp_path):
+        cache = svc._DiskCache(str(tmp_path), max_bytes=1000)
+
+        assert cache.get("a") is None
+        cache.put("a", b"skeleton")
+        cache.put("empty", b"")
+
+        assert cache.get("a") == b"skeleton"
+        assert cache.get("empty") == b""
+
+    def test_processes_share_the_directory(self, tmp_path):
+        svc._DiskCache(str(tmp_path), max_bytes=1000).put("a", b"skeleton")
+
+        assert svc._DiskCache(str(tmp_path), max_bytes=1000).get("a") == b"skeleton"
+
+    def test_least_recently_used_is_evicted_past_the_byte_limit(self, tmp_path):
+        cache = svc._DiskCache(str(tmp_path), max_bytes=1000)
+        for i, key in enumerate("abcd"):
+            cache.put(key, b"x" * 250)
+            _set_mtime(cache, key, 1000 + i)
+        cache.get("a")  # bumps a to now
+
+        cache.put("e", b"x" * 250)
+
+        # Eviction goes down to 90% of the limit, so the two least recently used files go
+        assert cache.get("b") is None
+        assert cache.get("c") is None
+        assert all(cache.get(key) is not None for key in "ade")
+
+    def test_no_temporary_files_are_left_behind(self, tmp_path):
+        cache = svc._DiskCache(str(tmp_path), max_bytes=1000)
+        cache.put("a", b"x")
+
+        assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+    def test_disabled_without_a_directory(self):
+        cache = svc._DiskCache(None, max_bytes=1000)
+        cache.put("a", b"x")
+
+        assert cache.get("a") is None
+
+
+class TestDiskCacheInFrontOfTheBucket:
+    @pytest.fixture
+    def cf(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(svc, "_disk_cache", svc._DiskCache(str(tmp_path), max_bytes=1000))
+        cf = mock.MagicMock()
+        monkeypatch.setattr(svc, "CloudFiles", mock.MagicMock(return_value=cf))
+        return cf
+
+    def test_second_read_is_served_from_disk(self, cf):
+        cf.get.return_value = b"h5 bytes"
+
+        assert svc.SkeletonService._retrieve_skeleton_from_cache(PARAMS, "h5").read() == b"h5 bytes"
+        assert svc.SkeletonService._retrieve_skeleton_from_cache(PARAMS, "h5").read() == b"h5 bytes"
+
+        cf.get.assert_called_once()
+
+    def test_write_warms_the_disk_cache(self, cf):
+        svc.SkeletonService._cache_skeleton(PARAMS, svc.HIGHEST_SKELETON_VERSION, b"h5 bytes", "h5")
+
+        assert svc.SkeletonService._retrieve_skeleton_from_cache(PARAMS, "h5").read() == b"h5 bytes"
+        cf.get.assert_not_called()
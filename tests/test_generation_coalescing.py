@@ -0,0 +1,202 @@
+"""Guards for coalescing concurrent generations of the same skeleton.
+
+When a Neuroglancer link is shared, many clients ask for the same uncached rid at once, and every uwsgi and
+Pub/Sub worker used to run the whole generation for it independently. Concurrent requests in one process now
+wait on the first one's result, and workers wait on whichever holds the generation lease in the bucket.
+"""
+
+import json
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+from skeletonservice.datasets import service as svc
+
+PARAMS = [864691135528193883, None, 4, "minnie65_public", [1, 1, 1], True, 7500]
+
+
+@pytest.fixture
+def bucket(tmp_path):
+    return f"file://{tmp_path}/"
+
+
+@pytest.fixture
+def params(bucket):
+    params = list(PARAMS)
+    params[1] = bucket
+    return params
+
+
+def _run_concurrently(n, fn):
+    results = [None] * n
+    barrier = threading.Barrier(n)
+
+    def _run(i):
+        barrier.wait()
+        results[i] = fn()
+
+    threads = [threading.Thread(target=_run, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class TestSingleFlight:
+    def test_concurrent_calls_run_once(self):
+        single_flight = svc._SingleFlight()
+        calls = []
+
+        def _fn():
+            calls.append(1)
+            time.sleep(0.1)
+            return "skeleton"
+
+        results = _run_concurrently(8, lambda: single_flight.do("key", _fn))
+
+        assert len(calls) == 1
+        assert [result for result, _ in results] == ["skeleton"] * 8
+        assert sum(led for _, led in results) == 1
+
+    def test_waiters_see_the_exception(self):
+        single_flight = svc._SingleFlight()
+
+        def _fn():
+            time.sleep(0.1)
+            raise ValueError("generation failed")
+
+        def _call():
+            try:
+                single_flight.do("key", _fn)
+            except ValueError as e:
+                return str(e)
+
+        assert _run_concurrently(4, _call) == ["generation failed"] * 4
+
+    def test_calls_that_do_not_overlap_both_run(self):
+        single_flight = svc._SingleFlight()
+
+        assert single_flight.do("key", lambda: 1) == (1, True)
+        assert single_flight.do("key", lambda: 2) == (2, True)
+
+
+class TestGenerationLease:
+    def test_only_one_holder(self, bucket):
+        first = svc._GenerationLease(bucket, "generation_leases/ds/sk", ttl_secs=60)
+        second = svc._GenerationLease(bucket, "generation_leases/ds/sk", ttl_secs=60)
+
+        assert first.try_acquire()
+        assert not second.try_acquire()
+        first.release()
+        assert second.try_acquire()
+
+    def test_expired_lease_is_taken_over(self, bucket):
+        dead = svc._GenerationLease(bucket, "generation_leases/ds/sk", ttl_secs=-1)
+        assert dead.try_acquire()
+
+        assert svc._GenerationLease(bucket, "generation_leases/ds/sk", ttl_secs=60).try_acquire()
+
+    def test_heartbeat_keeps_the_lease_alive(self, bucket):
+        holder = svc._GenerationLease(bucket, "generation_leases/ds/sk", ttl_secs=0.3)
+        assert holder.try_acquire()
+        holder.start_heartbeat()
+
+        time.sleep(0.5)  # Past the TTL it was acquired with
+
+        assert not svc._GenerationLease(bucket, "generation_leases/ds/sk", ttl_secs=60).try_acquire()
+        holder.release()
+        assert not holder.lost
+
+    def test_heartbeat_notices_a_takeover(self, bucket):
+        holder = svc._GenerationLease(bucket, "generation_leases/ds/sk", ttl_secs=0.3)
+        assert holder.try_acquire()
+        other_worker = svc._GenerationLease(bucket, "generation_leases/ds/sk", ttl_secs=60)
+        time.sleep(0.35)  # Expire it before the heartbeat starts
+        assert other_worker.try_acquire()
+
+        holder.start_heartbeat()
+        time.sleep(0.2)
+
+        assert holder.lost
+        holder.release()  # Must not release the other worker's lease
+        assert not svc._GenerationLease(bucket, "generation_leases/ds/sk", ttl_secs=60).try_acquire()
+
+
+class TestCoalescedGeneration:
+    @pytest.fixture
+    def generate(self, monkeypatch):
+        def _generate(params, params_cached, cave_client, cache_meshwork, phases):
+            time.sleep(0.1)
+            return None, svc.VersionedSkeleton(mock.sentinel.skeleton, 4), b"h5", None
+
+        generate = mock.MagicMock(side_effect=_generate)
+        monkeypatch.setattr(svc.SkeletonService, "_generate_and_cache_skeleton", staticmethod(generate))
+        monkeypatch.setattr(svc, "GENERATION_LEASE_POLL_SECS", 0.01)
+        return generate
+
+    @staticmethod
+    def _coalesced(params, duplicate_action="wait"):
+        return svc.SkeletonService._generate_skeleton_coalesced(params, params, None, False, svc._PhaseTimer(params[0]), duplicate_action)
+
+    @staticmethod
+    def _outcomes(capsys):
+        lines = [line for line in capsys.readouterr().out.splitlines() if "PHASE_TIMINGS" in line]
+        return [json.loads(line.split("PHASE_TIMINGS ", 1)[1])["outcome"] for line in lines]
+
+    def test_one_generation_per_process(self, generate, params):
+        results = _run_concurrently(6, lambda: self._coalesced(params))
+
+        generate.assert_called_once()
+        assert all(result[2] == b"h5" for result in results)
+        assert len({id(result[1]) for result in results}) == 6  # each request gets its own copy to finalize
+
+    def test_waits_for_the_worker_holding_the_lease(self, generate, params, monkeypatch):
+        other_worker = svc._GenerationLease(params[1], svc.SkeletonService._get_generation_lease_path(params), ttl_secs=60)
+        assert other_worker.try_acquire()
+        cached = svc.VersionedSkeleton(mock.sentinel.cached, 4)
+        retrieve = mock.MagicMock(side_effect=[None, None, cached])
+        monkeypatch.setattr(svc.SkeletonService, "_retrieve_skeleton_from_cache", staticmethod(retrieve))
+
+        assert self._coalesced(params) == (None, cached, None, None)
+        generate.assert_not_called()
+
+    def test_generates_after_waiting_too_long(self, generate, params, monkeypatch):
+        assert svc._GenerationLease(params[1], svc.SkeletonService._get_generation_lease_path(params), ttl_secs=60).try_acquire()
+        monkeypatch.setattr(svc.SkeletonService, "_retrieve_skeleton_from_cache", staticmethod(lambda params, format: None))
+        monkeypatch.setattr(svc, "generation_lease_wait_secs", 0.05)
+
+        self._coalesced(params)
+
+        generate.assert_called_once()
+
+    def test_lease_is_released_after_generating(self, generate, params, monkeypatch):
+        monkeypatch.setattr(svc.SkeletonService, "_retrieve_skeleton_from_cache", staticmethod(lambda params, format: None))
+
+        self._coalesced(params)
+
+        assert svc._GenerationLease(params[1], svc.SkeletonService._get_generation_lease_path(params), ttl_secs=60).try_acquire()
+
+    @pytest.mark.parametrize("duplicate_action", ["requeue", "ack"])
+    def test_a_message_does_not_wait_for_another_worker(self, generate, params, monkeypatch, duplicate_action):
+        assert svc._GenerationLease(params[1], svc.SkeletonService._get_generation_lease_path(params), ttl_secs=60).try_acquire()
+        retrieve = mock.MagicMock(return_value=None)
+        monkeypatch.setattr(svc.SkeletonService, "_retrieve_skeleton_from_cache", staticmethod(retrieve))
+
+        with pytest.raises(svc.GenerationLeaseHeld):
+            self._coalesced(params, duplicate_action)
+
+        generate.assert_not_called()
+        retrieve.assert_not_called()
+
+    def test_generations_are_reported(self, generate, params, monkeypatch, capsys):
+        monkeypatch.setattr(svc, "log_phase_timings", True)
+        monkeypatch.setattr(svc.SkeletonService, "_retrieve_skeleton_from_cache", staticmethod(lambda params, format: None))
+        self._coalesced(params)
+        assert svc._GenerationLease(params[1], svc.SkeletonService._get_generation_lease_path(params), ttl_secs=60).try_acquire()
+        monkeypatch.setattr(svc, "generation_lease_wait_secs", 0.05)
+        self._coalesced(params)
+
+        assert self._outcomes(capsys) == ["generated", "generated_duplicate"]
@@ -0,0 +1,216 @@
+"""Guards for making the network fetches of a v4 generation at once.
+
+_generate_v4_skeleton() used to look up the soma, then fetch the level 2 graph, its vertices and the synapses (inside
+pcg_meshwork()), then the L2 cache attributes, each waiting on the one before. The fetches that do not depend on each
+other now run concurrently, so a generation waits for about the slowest of them rather than their sum. With
+LEAN_GENERATION, a skeleton whose meshwork is not cached fetches only what the skeleton is computed from, and is the
+same skeleton.
+"""
+
+import datetime
+import threading
+import time
+from concurrent.futures import Future
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from skeletonservice.datasets import service as svc
+
+RID = 864691135528193883
+FETCH_SECS = 0.2
+NEURON_L2IDS = np.arange(1000, 1060)  # A dendrite along +x (1000-1029) and an axon along -x (1030-1059) from the origin
+SV_OFFSET = 10 ** 7  # The supervoxel id of a synapse is its level 2 id plus this
+
+
+def _synapses(side):
+    df = pd.DataFrame({
+        "id": [1, 2],
+        "pre_pt_root_id": [RID, 5] if side == "pre" else [5, 6],
+        "post_pt_root_id": [5, 6] if side == "pre" else [RID, RID],
+        f"{side}_pt_supervoxel_id": [11, 12],
+        "ctr_pt_position": [[0, 0, 0], [1, 1, 1]],
+    })
+    df.attrs["dataframe_resolution"] = [1, 1, 1]
+    return df
+
+
+def _neuron_position(l2id):
+    return [(l2id - 999) * 1000 if l2id < 1030 else (1029 - l2id) * 1000, 0, 0]
+
+
+def _neuron_synapses(table, filter_equal_dict, select_columns=None, **kwargs):
+    side = "pre" if "pre_pt_root_id" in filter_equal_dict[table] else "post"
+    l2ids = NEURON_L2IDS[35:55:2] if side == "pre" else NEURON_L2IDS[2:28:2]  # Outputs on the axon, inputs on the dendrite
+    df = pd.DataFrame({
+        "id": np.arange(len(l2ids)),
+        "pre_pt_root_id": RID if side == "pre" else 5,
+        "post_pt_root_id": 5 if side == "pre" else RID,
+        f"{side}_pt_supervoxel_id": l2ids + SV_OFFSET,
+        "ctr_pt_position": [_neuron_position(l2id) for l2id in l2ids],
+    })
+    df.attrs["dataframe_resolution"] = [1, 1, 1]
+    return df[select_columns[table]] if select_columns else df
+
+
+@pytest.fixture
+def neuron_client(monkeypatch):
+    root_ts = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    monkeypatch.setattr(svc.SkeletonService, "_get_root_soma", staticmethod(lambda *args: (root_ts, [0, 0, 0], [1, 1, 1])))
+    monkeypatch.setattr(svc, "incremental_generation", False)
+    dendrite, axon = NEURON_L2IDS[:30], NEURON_L2IDS[30:]
+    cave_client = mock.MagicMock()
+    cave_client.info.get_datastack_info.return_value = {"synapse_table": "synapses"}
+    cave_client.chunkedgraph.level2_chunk_graph.return_value = np.concatenate([
+        np.array([dendrite[:-1], dendrite[1:]]).T, np.array([axon[:-1], axon[1:]]).T, [[dendrite[0], axon[0]]]
+    ])
+    cave_client.l2cache.get_l2data.side_effect = lambda l2ids, attributes: {
+        str(l2id): {
+            "rep_coord_nm": _neuron_position(l2id), "size_nm3": 1e9 * (1 + l2id % 4), "area_nm2": 1e6,
+            "mean_dt_nm": 100.0, "max_dt_nm": 200.0,
+        } for l2id in l2ids
+    }
+    cave_client.materialize.live_live_query.side_effect = _neuron_synapses
+    cave_client.get_roots.side_effect = lambda supervoxel_ids, **kwargs: np.asarray(supervoxel_ids) - SV_OFFSET
+    cave_client.chunkedgraph.get_roots.side_effect = cave_client.get_roots.side_effect
+    return cave_client
+
+
+@pytest.fixture
+def cave_client():
+    cave_client = mock.MagicMock()
+    cave_client.materialize.live_live_query.side_effect = (
+        lambda table, filter_equal_dict, **kwargs: _synapses("pre" if "pre_pt_root_id" in filter_equal_dict[table] else "post")
+    )
+    # pcg_anno calls get_roots() on anything that is not a real CAVEclient itself, as on a ChunkedGraphClient
+    cave_client.get_roots.side_effect = lambda supervoxel_ids, **kwargs: np.array([101, 102])
+    return cave_client
+
+
+class TestSynapsesFetchedEarly:
+    def test_the_queries_do_not_wait_for_the_skeleton(self, cave_client):
+        soma_future = Future()
+        soma_future.set_result((None, None, None))
+        l2dict_future = Future()
+        result = {}
+        thread = threading.Thread(target=lambda: result.update(synapses=svc.SkeletonService._fetch_level2_synapses(
+            RID, cave_client, "synapses", soma_future, l2dict_future
+        )))
+        thread.start()
+
+        deadline = time.time() + 5
+        while cave_client.get_roots.call_count < 1 and time.time() < deadline:
+            time.sleep(0.01)
+        assert cave_client.materialize.live_live_query.call_count >= 1
+        assert thread.is_alive()  # Waiting for the skeleton's mapping
+
+        l2dict_future.set_result({101: 0, 102: 1})
+        thread.join(5)
+
+        pre_syn_df, post_syn_df = result["synapses"]
+        assert pre_syn_df["pre_pt_mesh_ind"].tolist() == [0, 1]
+        assert post_syn_df["post_pt_mesh_ind"].tolist() == [0, 1]
+
+    def test_a_skeleton_that_is_not_built_ends_the_fetch(self, cave_client):
+        soma_future = Future()
+        soma_future.set_result((None, None, None))
+        l2dict_future = Future()
+        l2dict_future.set_exception(RuntimeError("not built"))
+
+        with pytest.raises(RuntimeError):
+            svc.SkeletonService._fetch_level2_synapses(RID, cave_client, "synapses", soma_future, l2dict_future)
+
+
+class TestConcurrentFetches:
+    def test_skeletonization_waits_for_the_slowest_fetch_only(self, cave_client, monkeypatch):
+        def _slow(result):
+            def _fetch(*args, **kwargs):
+                time.sleep(FETCH_SECS)
+                return result
+            return _fetch
+
+        monkeypatch.setattr(svc.SkeletonService, "_get_root_soma", staticmethod(_slow((None, None, None))))
+        cave_client.chunkedgraph.level2_chunk_graph.side_effect = _slow(np.array([[101, 102]]))
+        cave_client.l2cache.get_l2data.side_effect = _slow({})
+        cave_client.info.get_datastack_info.return_value = {"synapse_table": None}
+        entered = {}
+
+        def _pcg_meshwork(*args, **kwargs):
+            entered["secs"] = time.time() - start
+            entered["level2_graph"] = kwargs["level2_graph"]
+            raise ValueError("stop here")
+
+        monkeypatch.setattr(svc.pcg_skel, "pcg_meshwork", _pcg_meshwork)
+        start = time.time()
+
+        with pytest.raises(ValueError):
+            svc.SkeletonService._generate_v4_skeleton(RID, "gs://bucket/", 4, "minnie65_public", [1, 1, 1], True, 7500, cave_client)
+
+        assert entered["secs"] < FETCH_SECS * 1.75  # The soma and the graph were fetched at once
+        assert entered["level2_graph"].tolist() == [[101, 102]]
+        deadline = time.time() + 5
+        while not cave_client.l2cache.get_l2data.called and time.time() < deadline:
+            time.sleep(0.01)
+        assert cave_client.l2cache.get_l2data.call_args.args[0] == [101, 102]  # Fetched alongside skeletonization
+
+
+class TestLeanGeneration:
+    def test_only_the_synapse_sites_are_queried(self, cave_client):
+        cave_client.chunkedgraph.get_roots.side_effect = lambda supervoxel_ids, **kwargs: np.array([101] * len(supervoxel_ids))
+        soma_future = Future()
+        soma_future.set_result((None, None, None))
+        l2dict_future = Future()
+        l2dict_future.set_result({101: 3})
+
+        pre_syn_df, post_syn_df = svc.SkeletonService._fetch_lean_synapse_sites(
+            RID, cave_client, "synapses", soma_future, l2dict_future
+        )
+
+        select_columns = cave_client.materialize.live_live_query.call_args.kwargs["select_columns"]["synapses"]
+        assert "ctr_pt_position" not in select_columns
+        assert pre_syn_df.columns.tolist() == ["pre_pt_mesh_ind"]
+        assert pre_syn_df["pre_pt_mesh_ind"].tolist() == [3, 3]
+        assert post_syn_df["post_pt_mesh_ind"].tolist() == [3, 3]
+
+    def test_the_lean_skeleton_is_the_full_one(self, neuron_client):
+        skeletons = {}
+        for lean in [False, True]:
+            svc._level2_attribute_cache.clear()
+            nrn, skeletons[lean] = svc.SkeletonService._generate_v4_skeleton(
+                RID, "gs://bucket/", 4, "minnie65_public", [1, 1, 1], True, 7500, neuron_client, lean=lean
+            )
+        full, lean = skeletons[False], skeletons[True]
+
+        assert set(full.skeleton.vertex_properties["compartment"]) == {1, 2, 3}  # An axon was split off
+        assert lean.lvl2_ids == full.lvl2_ids
+        np.testing.assert_array_equal(lean.skeleton.vertices, full.skeleton.vertices)
+        np.testing.assert_array_equal(lean.skeleton.edges, full.skeleton.edges)
+        for vertex_property in ["radius", "compartment"]:
+            np.testing.assert_array_equal(
+                lean.skeleton.vertex_properties[vertex_property], full.skeleton.vertex_properties[vertex_property]
+            )
+
+    def test_only_the_volumes_are_fetched(self, cave_client):
+        graph_future = Future()
+        graph_future.set_result(np.array([[101, 102]]))
+
+        svc.SkeletonService._fetch_volumetric_properties(cave_client, graph_future, lean=True)
+
+        assert cave_client.l2cache.get_l2data.call_args.kwargs["attributes"] == ["size_nm3"]
+
+    @pytest.mark.parametrize("output_format, lean", [("none", True), ("meshwork", False)])
+    def test_a_cached_meshwork_is_built_in_full(self, output_format, lean, monkeypatch):
+        generate = mock.MagicMock(return_value=(None, mock.MagicMock()))
+        monkeypatch.setattr(svc.SkeletonService, "_generate_v4_skeleton", generate)
+        for name in ["_retrieve_skeleton_from_local", "_archive_skeletonization_time", "_cache_skeleton", "_cache_meshwork"]:
+            monkeypatch.setattr(svc.SkeletonService, name, mock.MagicMock(return_value=None))
+        monkeypatch.setattr(svc, "lean_generation", True)
+
+        svc.SkeletonService._generate_and_cache_skeleton(
+            [RID, "gs://bucket/", 4, "minnie65_public", [1, 1, 1], True, 7500], {}, mock.MagicMock(),
+            output_format == "meshwork", mock.MagicMock(),
+        )
+
+        assert generate.call_args.kwargs["lean"] is lean
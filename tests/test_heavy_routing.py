@@ -0,0 +1,152 @@
+"""Guards for routing roots too large for the normal workers to the heavy workers.
+
+Gigantic roots only reached the refusal list after they had killed or timed out the workers they were delivered to,
+blocking the queues for everything else meanwhile. A normal worker about to generate a root of at least
+HEAVY_ROOT_MIN_L3_IDS level 3 ids now publishes it to SKELETON_CACHE_HEAVY_EXCHANGE instead, served by workers with more
+memory and a longer timeout. Publishing a request makes no such count, so the web tier stays fast.
+"""
+
+import os
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+import pytest
+
+os.environ.setdefault("SKELETON_CACHE_LOW_PRIORITY_RETRIEVE_QUEUE", "low")
+os.environ.setdefault("SKELETON_CACHE_HIGH_PRIORITY_RETRIEVE_QUEUE", "high")
+os.environ.setdefault("SKELETON_CACHE_DEAD_LETTER_RETRIEVE_QUEUE", "dead")
+
+from messagingclient import RetryableError  # noqa: E402
+from skeletonservice.datasets import messaging  # noqa: E402
+from skeletonservice.datasets import service as svc  # noqa: E402
+
+RID = 864691135528193883
+
+
+@pytest.fixture
+def cave_client(monkeypatch):
+    monkeypatch.setattr(svc, "heavy_root_min_l3_ids", 100)
+    monkeypatch.setenv("SKELETON_CACHE_HEAVY_EXCHANGE", "heavy_exchange")
+    monkeypatch.setenv("SKELETON_CACHE_LOW_PRIORITY_EXCHANGE", "low_exchange")
+    pool = mock.MagicMock()
+    monkeypatch.setattr(svc, "_cave_client_pool", pool)
+    return pool.get_client.return_value
+
+
+def _publish(messaging_client):
+    svc.SkeletonService.publish_skeleton_request(
+        messaging_client, "minnie65_public", RID, "none", "gs://bucket/", [1, 1, 1], True, 7500, 4, False
+    )
+
+
+class TestPublishRouting:
+    def test_publishing_does_not_count_the_root(self, cave_client):
+        messaging_client = mock.MagicMock()
+
+        _publish(messaging_client)
+
+        exchange, _, attributes = messaging_client.publish.call_args.args
+        assert exchange == "low_exchange" and "heavy_root" not in attributes
+        cave_client.chunkedgraph.get_leaves.assert_not_called()
+
+
+class TestWorkerRouting:
+    @pytest.fixture
+    def generate(self, cave_client, monkeypatch):
+        cave_client.chunkedgraph.get_leaves.side_effect = lambda rid, stop_layer: np.arange(150 if rid == 3 else 50)
+        cave_client.chunkedgraph.is_valid_nodes.side_effect = lambda rids: [True] * len(rids)
+        svc._cave_client_pool.get_cloudvolume.return_value.meta.decode_layer_id.return_value = 1
+        svc._cave_client_pool.get_cloudvolume.return_value.meta.n_layers = 1
+        monkeypatch.setattr(svc.SkeletonService, "_check_root_id_against_refusal_list", staticmethod(lambda *args: False))
+        monkeypatch.setattr(
+            svc.SkeletonService, "_confirm_skeletons_in_cache", staticmethod(lambda params_list, format: [False] * len(params_list))
+        )
+        generate = mock.MagicMock(return_value=(None, None, b"h5", None))
+        monkeypatch.setattr(svc.SkeletonService, "_generate_skeleton_coalesced", staticmethod(generate))
+        return generate
+
+    @staticmethod
+    def _cache(rids):
+        return dict(svc.SkeletonService.cache_skeletons_by_datastack_and_rids(
+            "minnie65_public", rids, "gs://bucket/", [1, 1, 1], True, 7500, 4
+        ))
+
+    def test_a_normal_worker_hands_heavy_roots_on(self, generate, cave_client):
+        settled = self._cache([2, 3])
+
+        assert settled[2] is None
+        assert isinstance(settled[3], svc.HeavyRoot)
+        assert [call.args[0][0] for call in generate.call_args_list] == [2]
+        assert {call.kwargs["stop_layer"] for call in cave_client.chunkedgraph.get_leaves.call_args_list} == {3}
+
+    def test_a_heavy_worker_generates_them(self, generate, monkeypatch):
+        monkeypatch.setattr(svc, "heavy_worker", True)
+
+        settled = self._cache([3])
+
+        assert settled[3] is None
+        generate.assert_called_once()
+
+
+class TestMessageRerouting:
+    @pytest.fixture
+    def publisher(self, monkeypatch):
+        monkeypatch.setenv("SKELETON_CACHE_HEAVY_EXCHANGE", "heavy_exchange")
+        publisher = mock.MagicMock()
+        monkeypatch.setattr(messaging, "MessagingClientPublisher", lambda batch_size: publisher)
+        return publisher
+
+    @staticmethod
+    def _payload(**attributes):
+        return SimpleNamespace(data=b"", attributes={
+            "session_timestamp": "t",
+            "verbose_level": "0",
+            "__subscription_name": "projects/p/subscriptions/low",
+            "high_priority": "false",
+            "skeleton_params_datastack_name": "minnie65_public",
+            "skeleton_params_rid": f"{RID}",
+            "skeleton_params_output_format": "none",
+            "skeleton_params_bucket": "gs://bucket",
+            "skeleton_params_root_resolution": "1 1 1",
+            "skeleton_params_collapse_soma": "true",
+            "skeleton_params_collapse_radius": "7500",
+            "skeleton_version": "4",
+            **attributes,
+        })
+
+    def test_a_heavy_root_is_published_to_the_heavy_workers_and_acked(self, publisher, monkeypatch):
+        monkeypatch.setattr(
+            messaging.SkeletonService, "get_skeleton_by_datastack_and_rid", mock.MagicMock(side_effect=svc.HeavyRoot("heavy"))
+        )
+
+        messaging.callback(self._payload())  # Returns, so the message is acked
+
+        exchange, _, attributes = publisher.publish.call_args.args
+        assert exchange == "heavy_exchange"
+        assert attributes["heavy_root"] == "True" and "__subscription_name" not in attributes
+
+    def test_a_failed_publication_returns_the_message(self, publisher, monkeypatch):
+        publisher.publish.side_effect = ConnectionError("pubsub")
+        monkeypatch.setattr(
+            messaging.SkeletonService, "get_skeleton_by_datastack_and_rid", mock.MagicMock(side_effect=svc.HeavyRoot("heavy"))
+        )
+
+        with pytest.raises(RetryableError):
+            messaging.callback(self._payload())
+
+    def test_a_heavy_root_is_retried_on_the_heavy_workers(self, publisher):
+        assert messaging._schedule_retry(self._payload(heavy_root="True"))
+
+        assert publisher.publish.call_args.args[0] == "heavy_exchange"
+
+    def test_a_batch_publishes_a_heavy_root_once(self, publisher, monkeypatch):
+        monkeypatch.setattr(
+            messaging.SkeletonService, "cache_skeletons_by_datastack_and_rids",
+            mock.MagicMock(return_value=iter([(RID, svc.HeavyRoot("heavy"))])),
+        )
+
+        settled = list(messaging.batch_callback([self._payload(), self._payload()]))
+
+        assert settled == [(0, None), (1, None)]
+        publisher.publish.assert_called_once()
@@ -0,0 +1,112 @@
+"""Guards for splicing the skeleton of an edited root from its parents' skeletons.
+
+After a split or merge, most of the new root's level 2 graph is its parents', whose v4 skeletons are usually cached,
+yet _generate_v4_skeleton() skeletonized the whole root again. With INCREMENTAL_GENERATION, only the neighborhoods of
+the level 2 ids the edit created are skeletonized anew, and spliced into what is kept of the parents' skeletons.
+"""
+
+from io import BytesIO
+from unittest import mock
+
+import numpy as np
+import pcg_skel
+import pytest
+
+from skeletonservice.datasets import service as svc
+from skeletonservice.datasets.skeleton_io_from_meshparty import SkeletonIO
+
+RID = 864691135528193883
+PARENT_L2IDS = np.arange(1000, 1060)  # A line of level 2 ids 1 um apart from the soma at the origin
+EDITED_L2ID = 2020  # The level 2 id 1020 became in the edit
+
+
+def _position(l2id):
+    return [(l2id - 1000 if l2id < 2000 else l2id - 2000) * 1000, 0, 0]
+
+
+def _path(l2ids):
+    return np.array([l2ids[:-1], l2ids[1:]]).T
+
+
+@pytest.fixture
+def parent():
+    sk = pcg_skel.pcg_skeleton_direct(
+        np.array([_position(l2id) for l2id in PARENT_L2IDS], dtype=float), _path(np.arange(len(PARENT_L2IDS))),
+        root_point=[0, 0, 0],
+    )
+    sk.vertex_properties["radius"] = np.full(sk.n_vertices, 100.0)
+    compartment = np.where(sk.vertices[:, 0] < 30000, 3, 2).astype(np.uint8)
+    compartment[sk.root] = 1
+    sk.vertex_properties["compartment"] = compartment
+    h5 = BytesIO()
+    SkeletonIO.write_skeleton_h5(sk, list(PARENT_L2IDS), h5)
+    skeleton, lvl2_ids = SkeletonIO.read_skeleton_h5(BytesIO(h5.getvalue()))
+    return svc.VersionedSkeleton(skeleton, 4, lvl2_ids)
+
+
+@pytest.fixture
+def cave_client():
+    cave_client = mock.MagicMock()
+    cave_client.l2cache.get_l2data.side_effect = lambda l2ids, attributes: {
+        str(l2id): {"rep_coord_nm": _position(l2id), "size_nm3": 1e9} for l2id in l2ids
+    }
+    return cave_client
+
+
+def _split_graph():
+    l2ids = PARENT_L2IDS[:40].copy()  # The rest went to the other root
+    l2ids[20] = EDITED_L2ID
+    return _path(l2ids)
+
+
+class TestSpliceSkeleton:
+    def test_only_the_edited_neighborhood_is_rebuilt(self, parent, cave_client):
+        skel, lvl2_ids = svc.SkeletonService._splice_skeleton(
+            RID, [parent], _split_graph(), np.array([0, 0, 0]), 7500, cave_client, True
+        )
+
+        rebuilt = cave_client.l2cache.get_l2data.call_args.args[0]
+        assert sorted(rebuilt) == [1017, 1018, 1019, 1021, 1022, 1023, EDITED_L2ID]
+        assert len(lvl2_ids) == 40 and len(skel.mesh_to_skel_map) == 40
+        assert skel.n_vertices == 40 and len(skel.edges) == 39  # A single tree over the new root
+        assert skel.vertices[skel.root].tolist() == [0, 0, 0]
+        assert skel.vertex_properties["compartment"][skel.root] == 1
+        rebuilt_vertices = skel.mesh_to_skel_map[np.isin(lvl2_ids, rebuilt)]
+        assert (skel.vertex_properties["compartment"][rebuilt_vertices] == 3).all()
+        assert (skel.vertex_properties["radius"][rebuilt_vertices] == pytest.approx(np.sqrt(1e9 / (np.pi * 1000))))
+
+    def test_a_large_edit_is_generated_in_full(self, parent, cave_client, monkeypatch):
+        monkeypatch.setattr(svc, "incremental_max_rebuild_fraction", 0.1)
+
+        assert svc.SkeletonService._splice_skeleton(
+            RID, [parent], _split_graph(), np.array([0, 0, 0]), 7500, cave_client, True
+        ) is None
+        cave_client.l2cache.get_l2data.assert_not_called()
+
+    def test_an_edit_near_the_soma_is_generated_in_full(self, parent, cave_client):
+        assert svc.SkeletonService._splice_skeleton(
+            RID, [parent], _split_graph(), np.array([0, 0, 0]), 20000, cave_client, True
+        ) is None
+
+
+class TestIncrementalGeneration:
+    def test_a_root_without_cached_parents_is_generated_in_full(self, cave_client, monkeypatch):
+        monkeypatch.setattr(svc.SkeletonService, "_get_parent_skeletons", staticmethod(lambda *args: []))
+
+        assert svc.SkeletonService._generate_incremental_v4_skeleton(
+            RID, "gs://bucket/", "minnie65_public", [1, 1, 1], True, 7500, cave_client, mock.MagicMock(), mock.MagicMock(), True
+        ) is None
+
+    def test_a_spliced_skeleton_skips_the_full_generation(self, cave_client, monkeypatch):
+        spliced = svc.VersionedSkeleton(mock.MagicMock(), 4, [])
+        monkeypatch.setattr(svc, "incremental_generation", True)
+        monkeypatch.setattr(svc.SkeletonService, "_generate_incremental_v4_skeleton", staticmethod(lambda *args: spliced))
+        monkeypatch.setattr(svc.SkeletonService, "_get_root_soma", staticmethod(lambda *args: (None, None, None)))
+        cave_client.info.get_datastack_info.return_value = {"synapse_table": None}
+
+        nrn, versioned_skeleton = svc.SkeletonService._generate_v4_skeleton(
+            RID, "gs://bucket/", 4, "minnie65_public", [1, 1, 1], True, 7500, cave_client, lean=True
+        )
+
+        assert nrn is None and versioned_skeleton is spliced
+        cave_client.l2cache.get_l2data.assert_not_called()
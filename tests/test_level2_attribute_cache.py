@@ -0,0 +1,87 @@
+"""Guards for the per-process cache of L2 cache attributes.
+
+Every generation fetched the L2 cache attributes of every level 2 id of its root, twice (the positions inside
+pcg_meshwork() and the volumetric properties), though neighboring and re-edited roots share most of their level 2 ids.
+A level 2 id's attributes never change, so each process now keeps them, and fetches only the ids it does not hold.
+"""
+
+from unittest import mock
+
+import pytest
+
+from skeletonservice.datasets import service as svc
+
+
+@pytest.fixture
+def cave_client():
+    cave_client = mock.MagicMock()
+    cave_client.datastack_name = "minnie65_public"
+    cave_client.l2cache.get_l2data.side_effect = lambda l2ids, attributes: {
+        str(l2id): {attribute: l2id for attribute in attributes} for l2id in l2ids
+    }
+    return cave_client
+
+
+def _fetched(cave_client):
+    return [call.args[0] for call in cave_client.l2cache.get_l2data.call_args_list]
+
+
+class TestLevel2AttributeCache:
+    def test_only_the_ids_not_held_are_fetched(self, cave_client):
+        cache = svc._Level2AttributeCache(max_entries=10)
+        cache.get_l2data(cave_client, [1, 2, 3], attributes=["size_nm3"])
+
+        l2data = cache.get_l2data(cave_client, [2, 3, 4], attributes=["size_nm3"])
+
+        assert l2data == {"2": {"size_nm3": 2}, "3": {"size_nm3": 3}, "4": {"size_nm3": 4}}
+        assert _fetched(cave_client) == [[1, 2, 3], [4]]
+
+    def test_ids_missing_an_attribute_are_fetched_again(self, cave_client):
+        cache = svc._Level2AttributeCache(max_entries=10)
+        cache.get_l2data(cave_client, [1], attributes=["rep_coord_nm"])
+
+        l2data = cache.get_l2data(cave_client, [1], attributes=["rep_coord_nm", "size_nm3"])
+
+        assert l2data == {"1": {"rep_coord_nm": 1, "size_nm3": 1}}
+        assert len(_fetched(cave_client)) == 2
+
+    def test_ids_not_computed_yet_are_not_held(self, cave_client):
+        cave_client.l2cache.get_l2data.side_effect = lambda l2ids, attributes: {str(l2id): {} for l2id in l2ids}
+        cache = svc._Level2AttributeCache(max_entries=10)
+
+        assert cache.get_l2data(cave_client, [1], attributes=["size_nm3"]) == {"1": {}}
+        cache.get_l2data(cave_client, [1], attributes=["size_nm3"])
+
+        assert _fetched(cave_client) == [[1], [1]]
+
+    def test_the_least_recently_used_ids_are_evicted(self, cave_client):
+        cache = svc._Level2AttributeCache(max_entries=2)
+        cache.get_l2data(cave_client, [1, 2], attributes=["size_nm3"])
+        cache.get_l2data(cave_client, [1], attributes=["size_nm3"])
+        cache.get_l2data(cave_client, [3], attributes=["size_nm3"])
+
+        cache.get_l2data(cave_client, [1, 2], attributes=["size_nm3"])
+
+        assert _fetched(cave_client)[-1] == [2]
+
+    def test_datastacks_are_held_apart(self, cave_client):
+        cache = svc._Level2AttributeCache(max_entries=10)
+        cache.get_l2data(cave_client, [1], attributes=["size_nm3"])
+        cave_client.datastack_name = "h01_c3_flat"
+
+        cache.get_l2data(cave_client, [1], attributes=["size_nm3"])
+
+        assert len(_fetched(cave_client)) == 2
+
+
+class TestLevel2CachedClient:
+    def test_pcg_skel_reads_through_the_cache(self, cave_client, monkeypatch):
+        monkeypatch.setattr(svc, "_level2_attribute_cache", svc._Level2AttributeCache(max_entries=10))
+        client = svc._Level2CachedClient(cave_client)
+
+        for _ in range(2):
+            client.l2cache.get_l2data([1, 2], attributes=["rep_coord_nm"])
+
+        assert _fetched(cave_client) == [[1, 2]]
+        assert client.chunkedgraph is cave_client.chunkedgraph
+        assert client == cave_client and hash(client) == hash(cave_client)
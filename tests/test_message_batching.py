@@ -0,0 +1,155 @@
+"""Guards for the micro-batching message consumer.
+
+Each message used to pay the cache check and the validation (refusal list, CAVEclient, is_valid_nodes) on its own.
+With MESSAGE_BATCH_SIZE > 1 a worker pulls several messages at once, checks the cache for all their rids in one
+call, validates the uncached ones with one is_valid_nodes() call, and generates only what remains, while still
+acking or nacking every message on its own.
+"""
+
+import os
+from unittest import mock
+
+import pytest
+import requests
+
+os.environ.setdefault("SKELETON_CACHE_LOW_PRIORITY_RETRIEVE_QUEUE", "low")
+os.environ.setdefault("SKELETON_CACHE_HIGH_PRIORITY_RETRIEVE_QUEUE", "high")
+os.environ.setdefault("SKELETON_CACHE_DEAD_LETTER_RETRIEVE_QUEUE", "dead")
+
+from skeletonservice.datasets import messaging  # noqa: E402
+from skeletonservice.datasets import service as svc  # noqa: E402
+
+
+@pytest.fixture
+def validation(monkeypatch):
+    refusal = mock.MagicMock(return_value=False)
+    monkeypatch.setattr(svc.SkeletonService, "_check_root_id_against_refusal_list", staticmethod(refusal))
+    pool = mock.MagicMock()
+    pool.get_cloudvolume.return_value.meta.decode_layer_id.return_value = 1
+    pool.get_cloudvolume.return_value.meta.n_layers = 1
+    is_valid_nodes = pool.get_client.return_value.chunkedgraph.is_valid_nodes
+    is_valid_nodes.side_effect = lambda rids: [rid != 4 for rid in rids]
+    monkeypatch.setattr(svc, "_cave_client_pool", pool)
+    return refusal, is_valid_nodes
+
+
+@pytest.fixture
+def generate(monkeypatch):
+    generate = mock.MagicMock(return_value=(None, None, b"h5", None))
+    monkeypatch.setattr(svc.SkeletonService, "_generate_skeleton_coalesced", staticmethod(generate))
+    return generate
+
+
+@pytest.fixture
+def in_cache(monkeypatch):
+    in_cache = mock.MagicMock(side_effect=lambda params_list, format: [params[0] == 1 for params in params_list])
+    monkeypatch.setattr(svc.SkeletonService, "_confirm_skeletons_in_cache", staticmethod(in_cache))
+    return in_cache
+
+
+def _generated_rids(generate):
+    return [call.args[0][0] for call in generate.call_args_list]
+
+
+class TestCacheSkeletonsBatch:
+    @staticmethod
+    def _cache(rids):
+        return list(svc.SkeletonService.cache_skeletons_by_datastack_and_rids(
+            "minnie65_public", rids, "gs://bucket/", [1, 1, 1], True, 7500, 4
+        ))
+
+    def test_one_cache_check_and_one_validation_per_batch(self, validation, generate, in_cache):
+        refusal, is_valid_nodes = validation
+
+        settled = self._cache([1, 2, 3, 4, 2])
+
+        in_cache.assert_called_once()
+        is_valid_nodes.assert_called_once_with([2, 3, 4])
+        assert _generated_rids(generate) == [2, 3]
+        assert sorted(rid for rid, _ in settled) == [1, 2, 3, 4]
+        assert all(error is None for _, error in settled)
+
+    def test_cached_and_rejected_rids_are_settled_before_generating(self, validation, generate, in_cache):
+        settled = [rid for rid, _ in self._cache([2, 1, 4, 3])]
+
+        assert settled[:2] == [1, 4]
+
+    def test_all_cached_skips_validation(self, validation, generate, in_cache):
+        refusal, is_valid_nodes = validation
+
+        self._cache([1])
+
+        refusal.assert_not_called()
+        is_valid_nodes.assert_not_called()
+        generate.assert_not_called()
+
+    def test_a_failed_validation_is_every_rids_error(self, validation, generate, in_cache):
+        refusal, is_valid_nodes = validation
+        is_valid_nodes.side_effect = ValueError("chunkedgraph")
+
+        settled = dict(self._cache([1, 2, 3]))
+
+        assert settled[1] is None
+        assert isinstance(settled[2], ValueError) and isinstance(settled[3], ValueError)
+        generate.assert_not_called()
+
+    def test_generation_errors_stay_with_their_rid(self, validation, generate, in_cache):
+        generate.side_effect = [ValueError("generation"), (None, None, b"h5", None)]
+
+        settled = dict(self._cache([2, 3]))
+
+        assert isinstance(settled[2], ValueError)
+        assert settled[3] is None
+
+
+class TestBatchCallback:
+    class _Payload:
+        def __init__(self, rid, output_format="none", subscription="projects/p/subscriptions/low"):
+            self.attributes = {
+                "session_timestamp": "t",
+                "verbose_level": "0",
+                "__subscription_name": subscription,
+                "high_priority": "false",
+                "skeleton_params_datastack_name": "minnie65_public",
+                "skeleton_params_rid": f"{rid}",
+                "skeleton_params_output_format": output_format,
+                "skeleton_params_bucket": "gs://bucket",
+                "skeleton_params_root_resolution": "1 1 1",
+                "skeleton_params_collapse_soma": "true",
+                "skeleton_params_collapse_radius": "7500",
+                "skeleton_version": "4",
+            }
+
+    def test_every_message_is_settled_once(self, validation, generate, in_cache):
+        messages = [self._Payload(rid) for rid in [1, 2, 2, 3]]
+
+        settled = list(messaging.batch_callback(messages))
+
+        assert sorted(i for i, _ in settled) == [0, 1, 2, 3]
+        assert not any(requeue for _, requeue in settled)
+        assert _generated_rids(generate) == [2, 3]
+
+    def test_only_retryable_failures_are_requeued(self, validation, generate, in_cache):
+        response = requests.Response()
+        response.status_code = 429
+        generate.side_effect = [
+            requests.HTTPError("429 Too Many Requests", response=response),
+            svc.GenerationLeaseHeld("3"),
+            ValueError("structural"),
+        ]
+        messages = [self._Payload(rid) for rid in [2, 3, 5]]
+
+        settled = dict(messaging.batch_callback(messages))
+
+        assert settled == {0: "retryable", 1: "duplicate_requeued", 2: None}
+
+    def test_other_messages_go_through_the_single_message_callback(self, validation, generate, in_cache, monkeypatch):
+        single = mock.MagicMock()
+        monkeypatch.setattr(messaging, "callback", single)
+        messages = [self._Payload(2), self._Payload(3, output_format="h5"), self._Payload(4, subscription="projects/p/subscriptions/dead")]
+
+        settled = dict(messaging.batch_callback(messages))
+
+        assert settled == {0: None, 1: None, 2: None}
+        assert [call.args[0] for call in single.call_args_list] == messages[1:]
+        assert _generated_rids(generate) == [2]
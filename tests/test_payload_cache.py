@@ -0,0 +1,98 @@
+"""Guards for the in-memory payload cache in front of the bucket.
+
+Neuroglancer requests the same few rids through /precomputed/skeleton/<skvn>/<rid> over and over, and
+every one of those requests used to be a GCS read. Final encoded payloads are now kept per process in a
+bytes-bounded LRU with a TTL.
+"""
+
+from unittest import mock
+
+import pytest
+
+from skeletonservice.datasets import service as svc
+
+BUCKET = "gs://bucket/"
+
+
+class TestPayloadCache:
+    def test_hits_and_misses_are_counted(self):
+        cache = svc._PayloadCache(max_bytes=1000, ttl_secs=60)
+
+        assert cache.get("a") is None
+        cache.put("a", b"x" * 10)
+        assert cache.get("a") == b"x" * 10
+
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"], stats["entries"], stats["bytes"]) == (1, 1, 1, 10)
+
+    def test_least_recently_used_is_evicted_past_the_byte_limit(self):
+        cache = svc._PayloadCache(max_bytes=1000, ttl_secs=60)
+        for key in "abcd":
+            cache.put(key, b"x" * 250)
+        cache.get("a")  # a is now the most recently used
+
+        cache.put("e", b"x" * 250)
+
+        assert cache.get("b") is None
+        assert all(cache.get(key) is not None for key in "acde")
+        assert cache.stats()["evictions"] == 1
+        assert cache.stats()["bytes"] == 1000
+
+    def test_expired_entries_are_not_served(self):
+        cache = svc._PayloadCache(max_bytes=1000, ttl_secs=0)
+        cache.put("a", b"x")
+
+        assert cache.get("a") is None
+        assert cache.stats()["evictions"] == 1
+        assert cache.stats()["bytes"] == 0
+
+    def test_oversized_and_non_bytes_payloads_are_not_cached(self):
+        cache = svc._PayloadCache(max_bytes=1000, ttl_secs=60)
+        cache.put("big", b"x" * 251)
+        cache.put("dict", {"vertices": []})
+
+        assert cache.stats()["entries"] == 0
+
+    def test_zero_bytes_disables_the_cache(self):
+        cache = svc._PayloadCache(max_bytes=0, ttl_secs=60)
+        cache.put("a", b"x")
+
+        assert cache.get("a") is None
+        assert cache.stats()["misses"] == 0
+
+
+class TestPayloadCacheInFrontOfTheBucket:
+    @pytest.fixture
+    def retrieve(self, monkeypatch):
+        retrieve = mock.MagicMock(return_value=b"precomputed")
+        monkeypatch.setattr(svc.SkeletonService, "_retrieve_skeleton_from_cache", staticmethod(retrieve))
+        monkeypatch.setattr(svc, "cache_first_fast_path", True)
+        return retrieve
+
+    @staticmethod
+    def _get(rid, output_format="precomputed", skeleton_version=4):
+        return svc.SkeletonService.get_skeleton_by_datastack_and_rid(
+            "minnie65_public", rid, output_format, BUCKET, [1, 1, 1], True, 7500, skeleton_version, via_requests=False
+        )
+
+    def test_repeated_requests_read_the_bucket_once(self, retrieve):
+        assert self._get(1) == b"precomputed"
+        assert self._get(1) == b"precomputed"
+
+        retrieve.assert_called_once()
+        assert svc._payload_cache.stats()["hits"] == 1
+
+    def test_formats_and_versions_are_cached_separately(self, retrieve):
+        self._get(1)
+        self._get(1, output_format="flatdict")
+        self._get(1, skeleton_version=2)
+        self._get(2)
+
+        assert retrieve.call_count == 4
+
+    def test_stats_are_exposed(self, retrieve):
+        self._get(1)
+
+        stats = svc.SkeletonService.get_payload_cache_stats()
+        assert stats["entries"] == 1
+        assert stats["bytes"] == len(b"precomputed")
@@ -0,0 +1,252 @@
+"""Guards for the in-memory refusal list.
+
+Every per-rid refusal check used to GET and parse the whole refusal CSV and scan the DataFrame, so the
+bulk paths paid one GCS round trip per rid. The list is now held per bucket as datastack -> set of rids
+and only re-downloaded when the object's generation changes.
+
+Adding a rid used to read, append to and rewrite that same CSV. It now writes one marker object per
+(datastack, rid), and compact_refusal_list() periodically folds the markers into the CSV snapshot.
+The markers are filed by hour, so that a revalidation lists the recent hours only, not every marker
+that has yet to be compacted.
+"""
+
+import datetime
+import threading
+from unittest import mock
+
+import pandas as pd
+import pytest
+
+from skeletonservice.datasets import service as svc
+
+BUCKET = "gs://test_bucket/"
+
+
+@pytest.fixture
+def refusal_csv(monkeypatch):
+    """Serve a refusal list from memory and count reads and HEADs of it."""
+    state = {
+        "df": pd.DataFrame({
+            "TIMESTAMP": ["20250101_000000", "20250101_000000"],
+            "DATASTACK_NAME": ["minnie65_public", "flywire_fafb_public"],
+            "ROOT_ID": [864691135528193883, 720575940621039145],
+        }),
+        "etag": "1",
+        "markers": [],
+        "reads": 0,
+        "heads": 0,
+        "listed_hours": [],
+        "marker_reads": [],
+    }
+
+    def _read(bucket):
+        state["reads"] += 1
+        return state["df"].drop(columns=["TIMESTAMP"])
+
+    def _version(bucket):
+        state["heads"] += 1
+        return (state["etag"], None, None)
+
+    def _list_markers(bucket, hour=None):
+        state["listed_hours"].append(hour)
+        return [path for path in state["markers"] if hour is None or path.startswith(f"{svc.SKELETONIZATION_REFUSAL_MARKERS_PREFIX}{hour}/")]
+
+    def _read_markers(bucket, marker_paths):
+        state["marker_reads"].extend(marker_paths)
+        datastack_rids = [path.split("/")[-2:] for path in marker_paths]
+        return pd.DataFrame({
+            "TIMESTAMP": "", "DATASTACK_NAME": [d for d, _ in datastack_rids], "ROOT_ID": [int(r) for _, r in datastack_rids],
+        })
+
+    monkeypatch.setattr(svc.SkeletonService, "_read_refusal_list_without_timestamps", staticmethod(_read))
+    monkeypatch.setattr(svc.SkeletonService, "_list_refusal_markers", staticmethod(_list_markers))
+    monkeypatch.setattr(svc.SkeletonService, "_read_refusal_markers", staticmethod(_read_markers))
+    monkeypatch.setattr(svc._RefusalListCache, "_version", staticmethod(_version))
+    return state
+
+
+def _hour(hours_ago=0):
+    return (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=hours_ago)).strftime("%Y%m%d%H")
+
+
+class TestRefusalListCache:
+    def test_lookups_are_served_from_memory(self, refusal_csv):
+        cache = svc._RefusalListCache(revalidate_secs=60)
+
+        assert cache.contains(BUCKET, "minnie65_public", 864691135528193883)
+        assert not cache.contains(BUCKET, "minnie65_public", 720575940621039145)  # refused, but in another datastack
+        assert cache.contains(BUCKET, "flywire_fafb_public", "720575940621039145")
+        assert refusal_csv["reads"] == 1
+
+    def test_unchanged_generation_is_not_downloaded_again(self, refusal_csv):
+        cache = svc._RefusalListCache(revalidate_secs=1e-9)
+
+        for rid in [1, 2, 3, 4]:
+            cache.contains(BUCKET, "minnie65_public", rid)
+
+        assert refusal_csv["heads"] == 4
+        assert refusal_csv["reads"] == 1
+
+    def test_a_failed_version_check_keeps_the_list(self, refusal_csv, monkeypatch):
+        cache = svc._RefusalListCache(revalidate_secs=1e-9)
+        assert cache.contains(BUCKET, "minnie65_public", 864691135528193883)
+        monkeypatch.setattr(svc._RefusalListCache, "_version", staticmethod(mock.MagicMock(side_effect=IOError)))
+
+        assert cache.contains(BUCKET, "minnie65_public", 864691135528193883)
+        assert refusal_csv["reads"] == 1
+
+    def test_new_markers_are_read_without_downloading_the_list(self, refusal_csv):
+        cache = svc._RefusalListCache(revalidate_secs=1e-9)
+        assert not cache.contains(BUCKET, "minnie65_public", 5)
+
+        refusal_csv["markers"].append(svc.SkeletonService._refusal_marker_path("minnie65_public", 5, _hour()))
+
+        assert cache.contains(BUCKET, "minnie65_public", 5)
+        assert cache.contains(BUCKET, "minnie65_public", 5)
+        assert refusal_csv["reads"] == 1
+        assert len(refusal_csv["marker_reads"]) == 1  # Not read again once seen
+
+    def test_settled_hours_are_not_listed_again(self, refusal_csv):
+        cache = svc._RefusalListCache(revalidate_secs=1e-9)
+        cache.contains(BUCKET, "minnie65_public", 1)
+        state = cache._buckets[BUCKET]
+        state["from_hour"] -= datetime.timedelta(hours=3)
+
+        cache.contains(BUCKET, "minnie65_public", 1)
+        assert refusal_csv["listed_hours"] == [_hour(3), _hour(2), _hour(1), _hour()]
+        refusal_csv["listed_hours"].clear()
+
+        cache.contains(BUCKET, "minnie65_public", 1)
+        assert refusal_csv["listed_hours"][-1] == _hour() and len(refusal_csv["listed_hours"]) <= 2
+
+    def test_changed_generation_is_reloaded(self, refusal_csv):
+        cache = svc._RefusalListCache(revalidate_secs=1e-9)
+        assert not cache.contains(BUCKET, "minnie65_public", 5)
+
+        refusal_csv["df"] = pd.concat([refusal_csv["df"], pd.DataFrame({
+            "TIMESTAMP": ["20250102_000000"], "DATASTACK_NAME": ["minnie65_public"], "ROOT_ID": [5],
+        })])
+        refusal_csv["etag"] = "2"
+
+        assert cache.contains(BUCKET, "minnie65_public", 5)
+        assert refusal_csv["reads"] == 2
+
+    def test_failed_refresh_keeps_serving_the_previous_copy(self, refusal_csv, monkeypatch):
+        cache = svc._RefusalListCache(revalidate_secs=1e-9)
+        assert cache.contains(BUCKET, "minnie65_public", 864691135528193883)
+
+        refusal_csv["etag"] = "2"
+        monkeypatch.setattr(svc.SkeletonService, "_read_refusal_list_without_timestamps", staticmethod(mock.MagicMock(side_effect=IOError)))
+
+        assert cache.contains(BUCKET, "minnie65_public", 864691135528193883)
+
+    def test_add_is_visible_without_revalidation(self, refusal_csv):
+        cache = svc._RefusalListCache(revalidate_secs=60)
+        assert not cache.contains(BUCKET, "minnie65_public", 5)
+
+        cache.add(BUCKET, "minnie65_public", 5)
+
+        assert cache.contains(BUCKET, "minnie65_public", 5)
+        assert refusal_csv["reads"] == 1
+
+    def test_a_slow_bucket_holds_up_neither_other_buckets_nor_add(self, refusal_csv, monkeypatch):
+        cache = svc._RefusalListCache(revalidate_secs=1e-9)
+        cache.contains(BUCKET, "minnie65_public", 1)
+        entered, release = threading.Event(), threading.Event()
+
+        def _slow_version(bucket):
+            if bucket == BUCKET:
+                entered.set()
+                release.wait(5)
+            return ("1", None, None)
+
+        monkeypatch.setattr(svc._RefusalListCache, "_version", staticmethod(_slow_version))
+        thread = threading.Thread(target=cache.contains, args=(BUCKET, "minnie65_public", 1))
+        thread.start()
+        assert entered.wait(5)
+
+        cache.add(BUCKET, "minnie65_public", 5)
+        assert not cache.contains("gs://other_bucket/", "minnie65_public", 5)
+        release.set()
+        thread.join(5)
+
+        assert cache.contains(BUCKET, "minnie65_public", 5)  # Not lost by the revalidation that was under way
+
+    def test_add_rid_to_refusal_list_updates_the_process_cache(self, refusal_csv, monkeypatch):
+        monkeypatch.setattr(svc.CloudFiles, "put", mock.MagicMock())
+        assert not svc.SkeletonService._check_root_id_against_refusal_list(BUCKET, "minnie65_public", 5)
+
+        svc.SkeletonService.add_rid_to_refusal_list(BUCKET, "minnie65_public", 5)
+
+        assert svc.SkeletonService._check_root_id_against_refusal_list(BUCKET, "minnie65_public", 5)
+        assert refusal_csv["reads"] == 1
+
+
+class TestShardedRefusalList:
+    """Adding a rid writes one marker object; readers merge the snapshot with the markers."""
+
+    @pytest.fixture
+    def bucket(self, tmp_path):
+        bucket = f"file://{tmp_path}/"
+        snapshot = pd.DataFrame({
+            "TIMESTAMP": ["20250101_000000"],
+            "DATASTACK_NAME": ["minnie65_public"],
+            "ROOT_ID": [864691135528193883],
+        })
+        svc.CloudFiles(bucket).put(svc.SKELETONIZATION_REFUSAL_LIST_FILENAME, snapshot.to_csv(index=False).encode("utf-8"), compress=True)
+        return bucket
+
+    @staticmethod
+    def _entries(refusal_df):
+        return set(zip(refusal_df["DATASTACK_NAME"], refusal_df["ROOT_ID"]))
+
+    def test_add_writes_a_marker_without_rewriting_the_snapshot(self, bucket, monkeypatch):
+        read_snapshot = mock.MagicMock()
+        monkeypatch.setattr(svc.SkeletonService, "_read_refusal_list_snapshot", staticmethod(read_snapshot))
+
+        svc.SkeletonService.add_rid_to_refusal_list(bucket, "minnie65_public", 5)
+        svc.SkeletonService.add_rid_to_refusal_list(bucket, "minnie65_public", 5)
+
+        read_snapshot.assert_not_called()
+        markers = svc.SkeletonService._list_refusal_markers(bucket)
+        assert len(markers) == 1 and markers[0].endswith("/minnie65_public/5")
+        assert svc.SkeletonService._list_refusal_markers(bucket, markers[0].split("/")[-3]) == markers
+
+    def test_markers_without_an_hour_are_still_read(self, bucket):
+        svc.CloudFiles(bucket).put(f"{svc.SKELETONIZATION_REFUSAL_MARKERS_PREFIX}flywire_fafb_public/7", b"20250101_000000", compress=False)
+
+        refusal_df = svc.SkeletonService._read_refusal_list_without_timestamps(bucket)
+
+        assert ("flywire_fafb_public", 7) in self._entries(refusal_df)
+
+    def test_a_missing_snapshot_is_not_downloaded_again(self, bucket, monkeypatch):
+        svc.CloudFiles(bucket).delete(svc.SKELETONIZATION_REFUSAL_LIST_FILENAME)
+        read = mock.MagicMock(wraps=svc.SkeletonService._read_refusal_list_without_timestamps)
+        monkeypatch.setattr(svc.SkeletonService, "_read_refusal_list_without_timestamps", staticmethod(read))
+        cache = svc._RefusalListCache(revalidate_secs=1e-9)
+
+        for rid in [1, 2, 3]:
+            assert not cache.contains(bucket, "minnie65_public", rid)
+
+        assert read.call_count == 1
+
+    def test_readers_see_snapshot_and_markers(self, bucket):
+        svc.SkeletonService.add_rid_to_refusal_list(bucket, "flywire_fafb_public", 7)
+        svc.SkeletonService.add_rid_to_refusal_list(bucket, "minnie65_public", 864691135528193883)  # already in the snapshot
+
+        refusal_df = svc.SkeletonService._read_refusal_list_without_timestamps(bucket)
+
+        assert list(refusal_df.columns) == ["DATASTACK_NAME", "ROOT_ID"]
+        assert len(refusal_df) == 2
+        assert self._entries(refusal_df) == {("minnie65_public", 864691135528193883), ("flywire_fafb_public", 7)}
+
+    def test_compaction_folds_markers_into_the_snapshot(self, bucket):
+        svc.SkeletonService.add_rid_to_refusal_list(bucket, "flywire_fafb_public", 7)
+        before = svc.SkeletonService._read_refusal_list(bucket)
+
+        assert svc.SkeletonService.compact_refusal_list(bucket) == 1
+
+        assert svc.SkeletonService._list_refusal_markers(bucket) == []
+        snapshot = svc.SkeletonService._read_refusal_list_snapshot(bucket)
+        assert self._entries(snapshot) == self._entries(before)
+        assert svc.SkeletonService.compact_refusal_list(bucket) == 0
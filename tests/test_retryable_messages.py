@@ -9,6 +9,9 @@ RetryableError now propagates out of the callback; the consumer nacks and keeps
 """
 
 import os
+import time
+from types import SimpleNamespace
+from unittest import mock
 
 import pytest
 import requests
@@ -134,3 +137,105 @@ class TestCallbackPropagation:
         assert len(line) == 1, line
         import json
         assert json.loads(line[0].split("MESSAGE_TIMING ", 1)[1])["outcome"] == "retryable"
+
+    def test_a_skeleton_being_generated_elsewhere_is_requeued(self, monkeypatch, capsys):
+        monkeypatch.setattr(messaging, "log_phase_timings", True)
+        monkeypatch.setattr(
+            messaging.SkeletonService, "get_skeleton_by_datastack_and_rid",
+            staticmethod(lambda *a, **k: (_ for _ in ()).throw(messaging.GenerationLeaseHeld("rid"))),
+        )
+
+        with pytest.raises(RetryableError):
+            messaging.callback(self._Payload())
+
+        line = [l for l in capsys.readouterr().out.splitlines() if "MESSAGE_TIMING" in l]
+        import json
+        assert json.loads(line[0].split("MESSAGE_TIMING ", 1)[1])["outcome"] == "duplicate_requeued"
+
+
+class TestRetryScheduling:
+    """Retryable failures come back after an exponential, jittered delay, and go to the dead-letter path eventually."""
+
+    @pytest.fixture
+    def publisher(self, monkeypatch):
+        publisher = mock.MagicMock()
+        monkeypatch.setattr(messaging, "MessagingClientPublisher", lambda batch_size: publisher)
+        monkeypatch.setenv("SKELETON_CACHE_LOW_PRIORITY_EXCHANGE", "low_exchange")
+        monkeypatch.setattr(messaging, "batch_callback", lambda messages: ((i, "retryable") for i in range(len(messages))))
+        return publisher
+
+    @staticmethod
+    def _settle(subscriber, **attributes):
+        message = SimpleNamespace(ack_id="ack", message=SimpleNamespace(
+            data=b"", attributes={**TestCallbackPropagation._Payload().attributes, **attributes}
+        ))
+        messaging._settle_batch(subscriber, "projects/p/subscriptions/low", [message])
+
+    @staticmethod
+    def _acked(subscriber):
+        return subscriber.acknowledge.call_count == 1
+
+    def test_a_retryable_failure_is_published_again_delayed(self, publisher):
+        subscriber = mock.MagicMock()
+
+        self._settle(subscriber, retry_attempt="2")
+
+        exchange, _, attributes = publisher.publish.call_args.args
+        assert exchange == "low_exchange"
+        assert attributes["retry_attempt"] == "3"
+        delay = float(attributes["retry_not_before"]) - time.time()
+        assert messaging.retry_base_delay_secs * 2 - 1 <= delay <= messaging.retry_base_delay_secs * 4 + 1
+        assert "__subscription_name" not in attributes
+        assert self._acked(subscriber)
+
+    def test_a_message_that_is_not_due_is_held_back(self, publisher):
+        subscriber = mock.MagicMock()
+
+        self._settle(subscriber, retry_attempt="1", retry_not_before=f"{time.time() + 30:.0f}")
+
+        request = subscriber.modify_ack_deadline.call_args.kwargs["request"]
+        assert 29 <= request["ack_deadline_seconds"] <= 31
+        publisher.publish.assert_not_called()
+        assert not self._acked(subscriber)
+
+    def test_spent_retries_go_to_the_dead_letter_exchange(self, publisher, monkeypatch):
+        monkeypatch.setenv("SKELETON_CACHE_DEAD_LETTER_EXCHANGE", "dead_exchange")
+        subscriber = mock.MagicMock()
+
+        self._settle(subscriber, retry_attempt=f"{messaging.retry_max_attempts}")
+
+        assert publisher.publish.call_args.args[0] == "dead_exchange"
+        assert self._acked(subscriber)
+
+    def test_spent_retries_are_nacked_without_a_dead_letter_exchange(self, publisher, monkeypatch):
+        monkeypatch.delenv("SKELETON_CACHE_DEAD_LETTER_EXCHANGE", raising=False)
+        subscriber = mock.MagicMock()
+
+        self._settle(subscriber, retry_attempt=f"{messaging.retry_max_attempts}")
+
+        publisher.publish.assert_not_called()
+        assert subscriber.modify_ack_deadline.call_args.kwargs["request"]["ack_deadline_seconds"] == 0
+        assert not self._acked(subscriber)
+
+    def test_a_duplicate_never_reaches_the_dead_letter_exchange(self, publisher, monkeypatch):
+        monkeypatch.setenv("SKELETON_CACHE_DEAD_LETTER_EXCHANGE", "dead_exchange")
+        monkeypatch.setattr(messaging, "batch_callback", lambda messages: ((i, "duplicate_requeued") for i in range(len(messages))))
+        subscriber = mock.MagicMock()
+
+        self._settle(subscriber, retry_attempt=f"{messaging.retry_max_attempts}")
+
+        exchange, _, attributes = publisher.publish.call_args.args
+        assert exchange == "low_exchange"
+        assert attributes["retry_attempt"] == f"{messaging.retry_max_attempts}"
+        delay = float(attributes["retry_not_before"]) - time.time()
+        assert messaging.duplicate_retry_delay_secs / 2 - 1 <= delay <= messaging.duplicate_retry_delay_secs + 1
+        assert self._acked(subscriber)
+
+    def test_a_failed_publication_falls_back_to_a_nack(self, publisher):
+        publisher.publish.side_effect = ConnectionError("pubsub")
+        subscriber = mock.MagicMock()
+
+        self._settle(subscriber)
+
+        assert subscriber.modify_ack_deadline.call_args.kwargs["request"]["ack_deadline_seconds"] == 0
+        assert not self._acked(subscriber)
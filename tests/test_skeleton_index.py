@@ -0,0 +1,158 @@
+"""Guards for the skeleton existence index.
+
+skeletons_exist() used to HEAD every rid it was asked about, and it runs on every single-skeleton request
+(to pick a rate limit category) and for every rid of every bulk submission. Existence is now looked up in a
+per-datastack index: a sorted snapshot of rids plus one marker per H5 written since, held in memory.
+"""
+
+import datetime
+from unittest import mock
+
+import pytest
+
+from skeletonservice.datasets import service as svc
+
+DATASTACK = "minnie65_public"
+V = svc.HIGHEST_SKELETON_VERSION
+
+
+@pytest.fixture
+def bucket(tmp_path):
+    return f"file://{tmp_path}/"
+
+
+def _cache_h5(bucket, rid):
+    params = [rid, bucket, V, DATASTACK, [1, 1, 1], True, 7500]
+    svc.SkeletonService._cache_skeleton(params, V, b"h5 bytes", "h5")
+
+
+def _exist(bucket, rids, **kwargs):
+    return svc.SkeletonService.skeletons_exist(bucket, DATASTACK, V, rids, **kwargs)
+
+
+def _write_marker(bucket, hour, rid):
+    prefix = svc.SkeletonService._skeleton_index_prefix(DATASTACK, V)
+    svc.CloudFiles(bucket).put(f"{prefix}delta/{hour}/{rid}", b"", compress=False)
+
+
+class TestSkeletonIndex:
+    def test_without_an_index_the_bucket_is_checked(self, bucket):
+        _cache_h5(bucket, 1)
+
+        assert svc._skeleton_index_cache.exist(bucket, DATASTACK, V, [1]) is None
+        assert _exist(bucket, [1, 2]) == {1: True, 2: False}
+
+    def test_build_lists_the_cached_skeletons_once(self, bucket, monkeypatch):
+        _cache_h5(bucket, 1)
+        _cache_h5(bucket, 2)
+
+        assert svc.SkeletonService.compact_skeleton_index(bucket, DATASTACK) == 2
+
+        svc._skeleton_index_cache.clear()
+        exists = mock.MagicMock(side_effect=AssertionError("HEAD"))
+        monkeypatch.setattr(svc.CloudFiles, "exists", exists)
+        assert _exist(bucket, [1, 2, 3]) == {1: True, 2: True, 3: False}
+        assert _exist(bucket, 2) is True
+
+    def test_new_skeletons_are_seen_after_revalidation(self, bucket, monkeypatch):
+        svc.SkeletonService.compact_skeleton_index(bucket, DATASTACK)
+        monkeypatch.setattr(svc, "_skeleton_index_cache", svc._SkeletonIndexCache(revalidate_secs=1e-9))
+        assert _exist(bucket, [5]) == {5: False}
+
+        # Written by another worker: only the marker reaches this process
+        _write_marker(bucket, datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%d%H"), 5)
+
+        assert _exist(bucket, [5]) == {5: True}
+
+    def test_own_writes_are_seen_immediately(self, bucket):
+        svc.SkeletonService.compact_skeleton_index(bucket, DATASTACK)
+        assert _exist(bucket, [5]) == {5: False}
+
+        _cache_h5(bucket, 5)
+
+        assert _exist(bucket, [5]) == {5: True}
+
+    def test_compaction_folds_only_settled_hours(self, bucket):
+        svc.SkeletonService.compact_skeleton_index(bucket, DATASTACK)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        old_hour = (now - datetime.timedelta(hours=3)).strftime("%Y%m%d%H")
+        current_hour = now.strftime("%Y%m%d%H")
+        _write_marker(bucket, old_hour, 7)
+        _write_marker(bucket, current_hour, 8)
+
+        svc.SkeletonService.compact_skeleton_index(bucket, DATASTACK)
+
+        rids, through_hour = svc.SkeletonService._read_skeleton_index_snapshot(bucket, DATASTACK, V)
+        assert rids.tolist() == [7]
+        assert through_hour < current_hour
+        assert svc.SkeletonService._list_skeleton_index_deltas(bucket, DATASTACK, V) == {current_hour: [8]}
+        assert _exist(bucket, [7, 8, 9]) == {7: True, 8: True, 9: False}
+
+    def test_polling_can_bypass_the_index(self, bucket):
+        svc.SkeletonService.compact_skeleton_index(bucket, DATASTACK)
+        assert _exist(bucket, [5]) == {5: False}
+        svc.CloudFiles(svc.SkeletonService._get_bucket_subdirectory(bucket, DATASTACK, V)).put(
+            svc.SkeletonService._get_skeleton_filename(5, bucket, V, DATASTACK, [1, 1, 1], True, 7500, "h5"), b"h5 bytes", compress="gzip"
+        )
+
+        assert _exist(bucket, [5]) == {5: False}
+        assert _exist(bucket, [5], use_index=False) == {5: True}
+
+
+class TestIndexedCacheQuery:
+    """get_cache_contents() used to list the bucket by prefix and only then apply limit."""
+
+    @pytest.fixture
+    def indexed(self, bucket, monkeypatch):
+        for rid in [12, 120, 125, 1234, 13, 2]:
+            _cache_h5(bucket, rid)
+        svc.SkeletonService.compact_skeleton_index(bucket, DATASTACK)
+        _write_marker(bucket, datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%d%H"), 121)  # not yet compacted
+        svc._skeleton_index_cache.clear()
+        real_list = svc.CloudFiles.list
+
+        def _list(cf, prefix="", **kwargs):
+            assert not prefix.startswith("skeleton__"), "the skeletons were listed"
+            return real_list(cf, prefix=prefix, **kwargs)
+
+        monkeypatch.setattr(svc.CloudFiles, "list", _list)
+        return bucket
+
+    @staticmethod
+    def _query(bucket, prefixes, limit=None, cursor=None):
+        return svc.SkeletonService.get_cache_contents(bucket, DATASTACK, V, prefixes, limit, cursor=cursor)
+
+    @staticmethod
+    def _rids(cache_contents):
+        return [int(f[f.find("rid-") + 4:f.find("__ds")]) for f in cache_contents["files"]]
+
+    def test_prefix_ranges(self):
+        assert svc._SkeletonIndexCache._prefix_ranges(["12", "123"])[:3] == [(12, 12), (120, 129), (1200, 1299)]
+
+    def test_prefixes_with_a_leading_zero_match_nothing(self, indexed):
+        assert svc._SkeletonIndexCache._prefix_ranges(["0", "012"]) == []
+        assert self._query(indexed, ["0", "012"])["num_found"] == 0
+
+    def test_prefixes_are_served_from_the_index(self, indexed):
+        result = self._query(indexed, [12])
+
+        assert result["num_found"] == 5
+        assert self._rids(result) == [12, 120, 121, 125, 1234]
+        assert "next_cursor" not in result
+        assert result["files"][0] == svc.SkeletonService._get_skeleton_filename(12, indexed, V, DATASTACK, [1, 1, 1], True, 7500, "h5")
+
+    def test_overlapping_prefixes_are_not_counted_twice(self, indexed):
+        assert self._query(indexed, [1, 12])["num_found"] == 6
+
+    def test_pages_follow_the_cursor(self, indexed):
+        rids = []
+        cursor = None
+        while True:
+            page = self._query(indexed, [1], limit=2, cursor=cursor)
+            assert page["num_found"] == 6
+            rids.extend(self._rids(page))
+            cursor = page.get("next_cursor")
+            if cursor is None:
+                break
+
+        assert rids == [12, 13, 120, 121, 125, 1234]
@@ -2,6 +2,8 @@ import binascii
 import io
 from datetime import datetime, timezone
 from unittest.mock import MagicMock, patch
+import numpy as np
+import pytest
 import responses
 import pandas as pd
 from skeletonservice.datasets.service import MAX_BULK_CACHED_SKELETONS, SkeletonService
@@ -21,6 +23,18 @@ info_mapping = {
 url_template = endpoints.infoservice_endpoints_v2["datastack_info"]
 info_url = url_template.format_map(info_mapping)
 
+@pytest.fixture(autouse=True, scope="module")
+def stop_module_patches():
+    """The tests below start patches without stopping them; keep them from leaking into other modules."""
+    yield
+    patch.stopall()
+
+@pytest.fixture
+def bucket_without_skeleton_index(monkeypatch):
+    """These tests mock CloudFiles.exists() to stand in for the bucket, so the bucket must have no existence index."""
+    monkeypatch.setattr(CloudFiles, "head", MagicMock(return_value=None))
+    monkeypatch.setattr(SkeletonService, "_read_skeleton_index_snapshot", MagicMock(return_value=(np.array([], dtype=np.int64), None)))
+
 class TestSkeletonsService:
     def test_create_versioned_skeleton_service(self, test_app):
         SkelClassVsn = SkeletonService.get_version_specific_handler(1)
@@ -75,6 +89,7 @@ class TestSkeletonsService:
         
         patch.object(CloudFiles, "exists", return_value=True).start()
         patch.object(CloudFiles, "get", return_value=refusal_list_w_timestamp_csv).start()
+        patch.object(CloudFiles, "list", return_value=[]).start()  # No refusal markers since the last compaction
 
         SkelClassVsn = SkeletonService.get_version_specific_handler(4)
 
@@ -89,6 +104,7 @@ class TestSkeletonsService:
         )
         assert refusal_list_result_df.equals(refusal_list_wo_timestamp_df)
 
+    @pytest.mark.usefixtures("bucket_without_skeleton_index")
     def test_get_cache_contents(self, test_app, cloudfiles_mock):
         rid_prefix = "a"
         skeleton_version = 4
@@ -143,6 +159,7 @@ class TestSkeletonsService:
             1: True,
         }
 
+    @pytest.mark.usefixtures("bucket_without_skeleton_index")
     def test_skeletons_exist(self, test_app, cloudfiles_mock):
         rids = [1]
         results_mock = {"rid-1__ds": True}
@@ -285,6 +302,7 @@ class TestSkeletonsService:
         assert mw is None
 
     @responses.activate
+    @pytest.mark.usefixtures("bucket_without_skeleton_index")
     def test_get_skeleton_by_datastack_and_rid_async(self, test_app, caveclient_mock, cloudvolume_mock):
         responses.add(responses.GET, url=info_url, json=test_info, status=200)
         
@@ -386,7 +404,7 @@ class TestSkeletonsService:
         """Cache miss with no H5 available: RID is absent from the returned dict."""
         patch.object(SkeletonService, "_check_root_id_against_refusal_list", return_value=False).start()
         patch.object(SkeletonService, "_retrieve_skeleton_from_cache", return_value=None).start()
-        patch.object(SkeletonService, "_confirm_skeleton_in_cache", return_value=False).start()
+        patch.object(SkeletonService, "_confirm_skeletons_in_cache", return_value=[False]).start()
 
         SkelClassVsn = SkeletonService.get_version_specific_handler(4)
 
@@ -546,6 +564,7 @@ class TestSkeletonsService:
         assert result["bucket"] == "my-bucket-name"
         assert not result["bucket"].startswith("gs://")
 
+    @pytest.mark.usefixtures("bucket_without_skeleton_index")
     def test_generate_skeletons_bulk_by_datastack_and_rids_async(self, test_app, caveclient_mock, cloudvolume_mock):
         responses.add(responses.GET, url=info_url, json=test_info, status=200)
         
@@ -561,7 +580,7 @@ class TestSkeletonsService:
         patch.object(CloudFiles, "exists", side_effect=exists_side_effect).start()
 
         def refusal_list_side_effect(*args, **kwargs):
-            return pd.DataFrame([], columns=['ROOT_ID'])
+            return pd.DataFrame([], columns=['DATASTACK_NAME', 'ROOT_ID'])
         patch.object(SkeletonService, "_read_refusal_list_without_timestamps", side_effect=refusal_list_side_effect).start()
 
         patch.object(SkeletonService, "publish_skeleton_request", return_value=None).start()
@@ -0,0 +1,144 @@
+"""Guards for the per-datastack soma position cache.
+
+_get_root_soma() used to make up to two live_query calls to the materialization service for every generation, the
+calls that ran into its rate limit. Each soma table is now loaded once per process, in windows of annotation ids, and
+refreshed with the roots that changed since and the rows created since, so the soma of a root found in it is a dict hit.
+A root not found in it is still queried live, since a row may have been added for it since the last refresh.
+"""
+
+import datetime
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from skeletonservice.datasets import service as svc
+
+TABLE = "nucleus_detection_v0"
+RESOLUTION = np.array([4, 4, 40])
+PAST = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def _rows(rows):
+    """rows of (pt_root_id, pt_position), (pt_root_id, pt_position, created) or (..., created, id), ids counting from 1"""
+    return [(*row, PAST, i + 1)[:4] if len(row) < 4 else row for i, row in enumerate(rows)]
+
+
+def _somas(rows):
+    df = pd.DataFrame(_rows(rows), columns=["pt_root_id", "pt_position", "created", "id"])
+    df.attrs["dataframe_resolution"] = RESOLUTION
+    return df
+
+
+def _live_query(rows):
+    def _query(table, timestamp, limit=None, filter_in_dict=None, filter_greater_dict=None,
+               filter_greater_equal_dict=None, filter_less_dict=None):
+        selected = [
+            row for row in _rows(rows)
+            if (filter_in_dict is None or row[0] in filter_in_dict["pt_root_id"])
+            and (filter_greater_dict is None or row[2] > filter_greater_dict["created"])
+            and (filter_greater_equal_dict is None or row[3] >= filter_greater_equal_dict["id"])
+            and (filter_less_dict is None or row[3] < filter_less_dict["id"])
+        ]
+        return _somas(list(reversed(selected))[:limit])  # In no particular order
+    return mock.MagicMock(side_effect=_query)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(svc, "SOMA_CACHE_PAGE_ROWS", 2)
+    client = mock.MagicMock()
+    client.datastack_name = "minnie65_public"
+    client.materialize.live_query = _live_query([(1, [1, 1, 1]), (2, [2, 2, 2]), (3, [3, 3, 3]), (3, [4, 4, 4])])
+    return client
+
+
+def _expire(cache, client):
+    cache._entries[(client.datastack_name, TABLE)]["checked"] -= 60
+
+
+class TestSomaPositionCache:
+    def test_the_table_is_loaded_once(self, client):
+        cache = svc._SomaPositionCache(refresh_secs=60)
+
+        position, resolution = cache.lookup(client, TABLE, 2)
+        assert position == [2, 2, 2]
+        assert (resolution == RESOLUTION).all()
+        calls = client.materialize.live_query.call_count
+        assert calls == 5  # Three windows of ids, an empty one, and the query for ids past it that ends the load
+
+        cache.lookup(client, TABLE, 1)
+        assert client.materialize.live_query.call_count == calls
+
+    def test_a_gap_in_the_ids_does_not_end_the_load(self, client):
+        client.materialize.live_query = _live_query([(1, [1, 1, 1], PAST, 1), (9, [9, 9, 9], PAST, 9)])
+
+        assert svc._SomaPositionCache(refresh_secs=60).lookup(client, TABLE, 9)[0] == [9, 9, 9]
+
+    def test_a_root_missing_from_the_cache_is_left_to_live_query(self, client):
+        cache = svc._SomaPositionCache(refresh_secs=60)
+
+        assert cache.lookup(client, TABLE, 5) is None
+        assert cache.lookup(client, TABLE, 3) is None  # Two nuclei: not a single soma
+
+    def test_a_row_added_later_for_an_unchanged_root_is_found(self, client):
+        cache = svc._SomaPositionCache(refresh_secs=60)
+        assert cache.lookup(client, TABLE, 5) is None
+        _expire(cache, client)
+        client.chunkedgraph.get_delta_roots.return_value = (np.array([]), np.array([]))
+        added = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=1)
+        client.materialize.live_query = _live_query(
+            [(1, [1, 1, 1]), (2, [2, 2, 2]), (2, [6, 6, 6], added), (5, [5, 5, 5], added)]
+        )
+
+        assert cache.lookup(client, TABLE, 5)[0] == [5, 5, 5]
+        assert cache.lookup(client, TABLE, 2) is None  # Two nuclei now: not a single soma
+        assert cache.lookup(client, TABLE, 1)[0] == [1, 1, 1]
+
+    def test_an_old_entry_is_reloaded(self, client, monkeypatch):
+        cache = svc._SomaPositionCache(refresh_secs=60)
+        cache.lookup(client, TABLE, 1)
+        _expire(cache, client)
+        monkeypatch.setattr(svc, "SOMA_CACHE_RELOAD_SECS", 0)
+        client.materialize.live_query = _live_query([(2, [2, 2, 2])])
+
+        assert cache.lookup(client, TABLE, 1) is None  # Its row was deleted
+        client.chunkedgraph.get_delta_roots.assert_not_called()
+
+    def test_a_refresh_only_queries_the_changed_roots(self, client):
+        cache = svc._SomaPositionCache(refresh_secs=60)
+        cache.lookup(client, TABLE, 1)
+        _expire(cache, client)
+        client.chunkedgraph.get_delta_roots.return_value = (np.array([1]), np.array([7]))
+        client.materialize.live_query = _live_query([(2, [2, 2, 2]), (7, [1, 1, 1])])
+
+        assert cache.lookup(client, TABLE, 7)[0] == [1, 1, 1]
+        assert cache.lookup(client, TABLE, 1) is None
+        assert client.materialize.live_query.call_count == 2  # The rows created since, then the changed roots' rows
+        assert client.materialize.live_query.call_args.kwargs["filter_in_dict"] == {"pt_root_id": [7]}
+
+    def test_a_failed_load_falls_back_to_live_query(self, client):
+        client.materialize.live_query.side_effect = ConnectionError("materialize")
+
+        assert svc._SomaPositionCache(refresh_secs=60).lookup(client, TABLE, 1) is None
+
+
+class TestGetRootSoma:
+    def test_cached_somas_need_no_live_query(self, client, monkeypatch):
+        monkeypatch.setattr(svc, "_soma_position_cache", svc._SomaPositionCache(refresh_secs=60))
+        client.chunkedgraph.get_root_timestamps.return_value = [PAST]
+
+        root_ts, position, resolution = svc.SkeletonService._get_root_soma(2, client, ["nucleus_alternative_points", TABLE])
+
+        assert position == [2, 2, 2]
+        client.materialize.tables.__getitem__.assert_not_called()
+
+    def test_roots_missing_from_the_cache_are_queried_live(self, client, monkeypatch):
+        monkeypatch.setattr(svc, "_soma_position_cache", svc._SomaPositionCache(refresh_secs=60))
+        client.chunkedgraph.get_root_timestamps.return_value = [PAST]
+        client.materialize.tables.__getitem__.return_value.return_value.live_query.return_value = _somas([(9, [9, 9, 9])])
+
+        root_ts, position, resolution = svc.SkeletonService._get_root_soma(9, client, [TABLE])
+
+        assert position == [9, 9, 9]
@@ -0,0 +1,110 @@
+"""Guards for processing several messages at once in one worker process.
+
+Generation is mostly network wait, yet each worker processed one message at a time, leaving its pod's CPU idle while
+the queues backed up. WORKER_CONCURRENCY now runs that many consumers per process. That needed the request state that
+every entry point sets (verbose level, session timestamp) to be context-local rather than module globals, and
+CAVE_MAX_IN_FLIGHT_CALLS bounds the calls the threads make to CAVE together. The same holds for threaded uwsgi workers.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+os.environ.setdefault("SKELETON_CACHE_LOW_PRIORITY_RETRIEVE_QUEUE", "low")
+os.environ.setdefault("SKELETON_CACHE_HIGH_PRIORITY_RETRIEVE_QUEUE", "high")
+os.environ.setdefault("SKELETON_CACHE_DEAD_LETTER_RETRIEVE_QUEUE", "dead")
+
+from skeletonservice.datasets import messaging  # noqa: E402
+from skeletonservice.datasets import service as svc  # noqa: E402
+
+
+class TestRequestState:
+    def test_concurrent_requests_keep_their_own_state(self, monkeypatch):
+        barrier = threading.Barrier(2)
+        seen = {}
+
+        def _confirm(params, format):
+            barrier.wait()  # Both requests have set their state by now
+            seen[params[0]] = (svc._session_timestamp.get(), svc._verbose_level.get())
+            return True
+
+        monkeypatch.setattr(svc.SkeletonService, "_confirm_skeleton_in_cache", staticmethod(_confirm))
+
+        def _request(rid, verbose_level):
+            svc.SkeletonService.get_skeleton_by_datastack_and_rid(
+                "minnie65_public", rid, "none", "gs://bucket/", [1, 1, 1], True, 7500, 4, False, f"session-{rid}", verbose_level
+            )
+
+        threads = [threading.Thread(target=_request, args=(rid, rid - 1)) for rid in [1, 2]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert seen == {1: ("session-1", 0), 2: ("session-2", 1)}
+
+    def test_helper_threads_see_the_request_state(self):
+        token = svc._session_timestamp.set("session")
+        try:
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                seen = list(executor.map(svc._in_current_context(lambda _: svc._session_timestamp.get()), range(4)))
+        finally:
+            svc._session_timestamp.reset(token)
+
+        assert seen == ["session"] * 4
+
+    def test_a_message_does_not_inherit_the_previous_messages_state(self, monkeypatch):
+        monkeypatch.setattr(messaging, "callback", lambda payload: svc._verbose_level.set(payload))
+        verbose_level = svc._verbose_level.get()
+
+        messaging._callback_in_own_context(verbose_level + 1)
+
+        assert svc._verbose_level.get() == verbose_level
+
+
+class TestWebRequestState:
+    def test_each_request_starts_from_the_default_state(self, test_app):
+        token = svc._verbose_level.set(svc.default_verbose_level + 1)  # As left behind by a verbose request on this thread
+        try:
+            test_app.get("/skeletoncache/health")
+
+            assert svc._verbose_level.get() == svc.default_verbose_level
+            assert svc._session_timestamp.get().startswith("@_")
+        finally:
+            svc._verbose_level.reset(token)
+
+
+class TestConcurrentConsumers:
+    def test_consumers_run_at_once(self, monkeypatch):
+        barrier = threading.Barrier(3, timeout=5)
+        consume = mock.MagicMock(side_effect=lambda queues: barrier.wait())
+        monkeypatch.setattr(messaging, "_consume", consume)
+
+        messaging._consume_concurrently(["low", "high", "dead"], 3)  # Would hang if they ran one after the other
+
+        assert consume.call_count == 3
+
+    def test_a_failed_consumer_stops_the_worker(self, monkeypatch):
+        release = threading.Event()
+
+        def _consume(queues):
+            if threading.current_thread().name.endswith("-0"):
+                raise RuntimeError("subscription gone")
+            release.wait()
+
+        monkeypatch.setattr(messaging, "_consume", _consume)
+
+        messaging._consume_concurrently(["low"], 2)
+        release.set()
+
+
+class TestCaveCallLimit:
+    def test_clients_block_past_the_limit(self, monkeypatch):
+        build = mock.MagicMock()
+        monkeypatch.setattr(svc.caveclient, "CAVEclient", build)
+        monkeypatch.setattr(svc, "cave_max_in_flight_calls", 8)
+
+        svc._CaveClientPool(ttl_secs=60).get_client("minnie65_public")
+
+        build.assert_called_once_with("minnie65_public", server_address=svc.CAVE_CLIENT_SERVER, pool_maxsize=8, pool_block=True)
@@ -0,0 +1,152 @@
+"""Guards for the worker preamble, which runs on every message before any cache check.
+
+PHASE_TIMINGS on minniev7 showed caveclient_init and segmentation_cloudvolume dominating the wall
+time of messages that turned out to be cache hits: every message and every bulk request built a
+fresh CAVEclient and CloudVolume. They now come from a process-wide pool keyed by datastack.
+
+Most of those messages are for skeletons that already exist, so the cache is now checked first and
+the refusal list / chunkedgraph validation only runs when a skeleton actually has to be generated.
+"""
+
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+from skeletonservice.datasets import service as svc
+
+
+class TestCaveClientPool:
+    @pytest.fixture
+    def built(self, monkeypatch):
+        """Record every CAVEclient construction instead of contacting a server."""
+        calls = []
+
+        def _build(datastack_name, server_address=None):
+            calls.append(datastack_name)
+            client = mock.MagicMock(name=f"CAVEclient({datastack_name})")
+            client.info.segmentation_cloudvolume.side_effect = lambda: mock.MagicMock(name="cv")
+            return client
+
+        monkeypatch.setattr(svc.caveclient, "CAVEclient", _build)
+        return calls
+
+    def test_one_client_per_datastack(self, built):
+        pool = svc._CaveClientPool(ttl_secs=60)
+
+        a = pool.get_client("minnie65_public")
+        b = pool.get_client("minnie65_public")
+        c = pool.get_client("flywire_fafb_public")
+
+        assert a is b
+        assert a is not c
+        assert built == ["minnie65_public", "flywire_fafb_public"]
+
+    def test_cloudvolume_is_built_once_and_lazily(self, built):
+        pool = svc._CaveClientPool(ttl_secs=60)
+
+        client = pool.get_client("minnie65_public")
+        client.info.segmentation_cloudvolume.assert_not_called()
+
+        cv1 = pool.get_cloudvolume("minnie65_public")
+        cv2 = pool.get_cloudvolume("minnie65_public")
+        assert cv1 is cv2
+        assert client.info.segmentation_cloudvolume.call_count == 1
+
+    def test_entries_expire_after_ttl(self, built):
+        pool = svc._CaveClientPool(ttl_secs=0.05)
+
+        a = pool.get_client("minnie65_public")
+        time.sleep(0.06)
+        b = pool.get_client("minnie65_public")
+
+        assert a is not b
+        assert built == ["minnie65_public", "minnie65_public"]
+
+    def test_zero_ttl_disables_pooling(self, built):
+        pool = svc._CaveClientPool(ttl_secs=0)
+
+        pool.get_client("minnie65_public")
+        pool.get_client("minnie65_public")
+
+        assert built == ["minnie65_public", "minnie65_public"]
+
+    def test_concurrent_cold_start_builds_one_client(self, monkeypatch):
+        calls = []
+
+        def _slow_build(datastack_name, server_address=None):
+            calls.append(datastack_name)
+            time.sleep(0.05)
+            return mock.MagicMock()
+
+        monkeypatch.setattr(svc.caveclient, "CAVEclient", _slow_build)
+        pool = svc._CaveClientPool(ttl_secs=60)
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(pool.get_client("minnie65_public"))) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert len(calls) == 1
+        assert all(r is results[0] for r in results)
+
+
+class TestCacheFirstFastPath:
+    """Messages for skeletons that already exist must not pay for validation."""
+
+    ARGS = ("minnie65_public", 864691135528193883, "none", "gs://bucket/", [1, 1, 1], True, 7500, 4, False)
+
+    @pytest.fixture
+    def preamble(self, monkeypatch):
+        monkeypatch.setattr(svc, "log_phase_timings", True)
+        refusal = mock.MagicMock(return_value=False)
+        monkeypatch.setattr(svc.SkeletonService, "_check_root_id_against_refusal_list", staticmethod(refusal))
+        pool = mock.MagicMock()
+        pool.get_cloudvolume.return_value.meta.decode_layer_id.return_value = 1
+        pool.get_cloudvolume.return_value.meta.n_layers = 1
+        monkeypatch.setattr(svc, "_cave_client_pool", pool)
+        return refusal, pool
+
+    @staticmethod
+    def _outcome(capsys):
+        import json
+        lines = [l for l in capsys.readouterr().out.splitlines() if "PHASE_TIMINGS" in l]
+        assert len(lines) == 1, lines
+        return json.loads(lines[0].split("PHASE_TIMINGS ", 1)[1])["outcome"]
+
+    def test_cache_hit_skips_validation(self, preamble, monkeypatch, capsys):
+        refusal, pool = preamble
+        monkeypatch.setattr(svc.SkeletonService, "_confirm_skeleton_in_cache", staticmethod(lambda *a: True))
+
+        assert svc.SkeletonService.get_skeleton_by_datastack_and_rid(*self.ARGS) is None
+
+        refusal.assert_not_called()
+        pool.get_client.assert_not_called()
+        assert self._outcome(capsys) == "cache_hit_fast"
+
+    def test_disabled_validates_before_the_cache_check(self, preamble, monkeypatch, capsys):
+        refusal, pool = preamble
+        monkeypatch.setattr(svc, "cache_first_fast_path", False)
+        monkeypatch.setattr(svc.SkeletonService, "_confirm_skeleton_in_cache", staticmethod(lambda *a: True))
+
+        svc.SkeletonService.get_skeleton_by_datastack_and_rid(*self.ARGS)
+
+        refusal.assert_called_once()
+        pool.get_client.return_value.chunkedgraph.is_valid_nodes.assert_called_once()
+        assert self._outcome(capsys) == "cache_hit"
+
+    def test_cache_miss_still_validates_before_generating(self, preamble, monkeypatch, capsys):
+        refusal, pool = preamble
+        refusal.return_value = True
+        monkeypatch.setattr(svc.SkeletonService, "_confirm_skeleton_in_cache", staticmethod(lambda *a: False))
+        generate = mock.MagicMock()
+        monkeypatch.setattr(svc.SkeletonService, "_generate_v4_skeleton", staticmethod(generate))
+
+        assert svc.SkeletonService.get_skeleton_by_datastack_and_rid(*self.ARGS) is None
+
+        refusal.assert_called_once()
+        generate.assert_not_called()
+        assert self._outcome(capsys) == "refused"